@@ -1,44 +1,16 @@
 #!/usr/bin/env python3
-import re
+import argparse
 import os
+import sys
 
-os.chdir('/volume1/docker/shortsai/backend')
+import ops_trace
+from source_patcher import apply_patchset, print_report
+from update_index import INDEX_EDITS
 
-# 1. Обновить index.ts
-print("Updating index.ts...")
-with open('src/index.ts', 'r', encoding='utf-8') as f:
-    content = f.read()
+# Блок проверки канала в fetchAndSaveToServer, который дополняется логированием
+TELEGRAM_PATTERN = r'(    // Проверяем, что пользователь имеет доступ к этому каналу и читаем данные канала\n    // channelId уже проверен выше и гарантированно не undefined\n    const channelRef = db\n      \.collection\("users"\)\n      \.doc\(userId\)\n      \.collection\("channels"\)\n      \.doc\(channelId!\);\n    const channelSnap = await channelRef\.get\(\);\n\n    if \(!channelSnap\.exists\) \{)'
 
-# Добавить импорт diagRoutes
-if 'import diagRoutes' not in content:
-    content = content.replace(
-        'import debugRoutes from "./routes/debugRoutes";',
-        'import debugRoutes from "./routes/debugRoutes";\nimport diagRoutes from "./routes/diagRoutes";'
-    )
-    print("  Added diagRoutes import")
-
-# Добавить роут /api/diag
-if 'app.use("/api/diag", diagRoutes);' not in content:
-    content = content.replace(
-        'app.use("/api/debug", debugRoutes);',
-        'app.use("/api/debug", debugRoutes);\napp.use("/api/diag", diagRoutes);'
-    )
-    print("  Added /api/diag route")
-
-with open('src/index.ts', 'w', encoding='utf-8') as f:
-    f.write(content)
-print("OK: index.ts updated\n")
-
-# 2. Обновить telegramRoutes.ts
-print("Updating telegramRoutes.ts...")
-with open('src/routes/telegramRoutes.ts', 'r', encoding='utf-8') as f:
-    content = f.read()
-
-# Найти и заменить блок проверки канала
-pattern = r'(    // Проверяем, что пользователь имеет доступ к этому каналу и читаем данные канала\n    // channelId уже проверен выше и гарантированно не undefined\n    const channelRef = db\n      \.collection\("users"\)\n      \.doc\(userId\)\n      \.collection\("channels"\)\n      \.doc\(channelId!\);\n    const channelSnap = await channelRef\.get\(\);\n\n    if \(!channelSnap\.exists\) \{)'
-
-if re.search(pattern, content):
-    replacement = '''    // Проверяем, что пользователь имеет доступ к этому каналу и читаем данные канала
+TELEGRAM_REPLACEMENT = '''    // Проверяем, что пользователь имеет доступ к этому каналу и читаем данные канала
     // channelId уже проверен выше и гарантированно не undefined
     const firestorePath = `users/${userId}/channels/${channelId!}`;
     
@@ -88,40 +60,56 @@ if re.search(pattern, content):
         })
       });
     }'''
-    
-    content = re.sub(pattern, replacement, content)
-    print("  Added logging to fetchAndSaveToServer")
-    
-    with open('src/routes/telegramRoutes.ts', 'w', encoding='utf-8') as f:
-        f.write(content)
-    print("OK: telegramRoutes.ts updated\n")
-else:
-    print("WARN: Pattern not found, file may already be updated\n")
 
-# 3. Добавить DEBUG_DIAG в .env.production
-print("Updating .env.production...")
-if os.path.exists('.env.production'):
-    with open('.env.production', 'r', encoding='utf-8') as f:
-        env_content = f.read()
-    
-    if 'DEBUG_DIAG=' not in env_content:
-        env_content += '\n# Диагностические эндпоинты\nDEBUG_DIAG=true\n'
-        with open('.env.production', 'w', encoding='utf-8') as f:
-            f.write(env_content)
-        print("  Added DEBUG_DIAG=true")
-    else:
-        # Обновить существующий
-        env_content = re.sub(r'^DEBUG_DIAG=.*', 'DEBUG_DIAG=true', env_content, flags=re.MULTILINE)
-        with open('.env.production', 'w', encoding='utf-8') as f:
-            f.write(env_content)
-        print("  Updated DEBUG_DIAG=true")
-    print("OK: .env.production updated\n")
-else:
-    print("WARN: .env.production not found\n")
+PATCHES = {
+    # 1. index.ts: импорт и роут diagRoutes
+    "src/index.ts": INDEX_EDITS,
+    # 2. telegramRoutes.ts: логирование в fetchAndSaveToServer
+    "src/routes/telegramRoutes.ts": [
+        {
+            "type": "replace",
+            "label": "fetchAndSaveToServer channel check logging",
+            "pattern": TELEGRAM_PATTERN,
+            "replacement": TELEGRAM_REPLACEMENT,
+            "guard": 'Logger.info("fetchAndSaveToServer: checking channel in Firestore"',
+        },
+    ],
+    # 3. .env.production: диагностические эндпоинты
+    ".env.production": [
+        {
+            "type": "env_upsert",
+            "key": "DEBUG_DIAG",
+            "value": "true",
+            "comment": "Диагностические эндпоинты",
+        },
+    ],
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Apply diag/logging changes to the backend sources")
+    parser.add_argument("--root", default="/volume1/docker/shortsai/backend", help="backend directory")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--diff", action="store_true", help="print a unified diff of each change")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    os.chdir(args.root)
 
-print("=== All changes applied ===")
-print("Next steps:")
-print("1. sudo /usr/local/bin/docker-compose build backend")
-print("2. sudo /usr/local/bin/docker-compose down backend")
-print("3. sudo /usr/local/bin/docker-compose up -d backend")
+    with ops_trace.tracing(args.trace, args.profile):
+        reports = apply_patchset(PATCHES, dry_run=args.dry_run, with_diff=args.diff)
+    ok = print_report(reports)
+    if not ok:
+        print("\nERROR: conflicts found, conflicting files were left unchanged")
+        sys.exit(1)
 
+    print("\n=== All changes applied ===" if not args.dry_run else "\n=== Dry run, nothing written ===")
+    print("Next steps:")
+    print("1. on the workstation: python3 docker_context.py build backend --host adminv@192.168.100.222"
+          " --docker 'sudo /usr/local/bin/docker' --image backend_backend"
+          "  (only the files the Dockerfile copies; plain, on the NAS: sudo /usr/local/bin/docker-compose build backend)")
+    print("2. sudo /usr/local/bin/docker-compose down backend")
+    print("3. sudo /usr/local/bin/docker-compose up -d backend")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark inbox_worker on locally generated clips
+
+Generates a storage tree with --clips videos spread over a few channel
+inboxes (real test clips via ffmpeg's lavfi testsrc2/sine sources when
+ffmpeg is installed, otherwise random bytes processed by fake_ffmpeg.py),
+then processes the whole backlog once per configuration:
+
+  inline     one job at a time at normal priority, like ffmpegUtils.ts
+  -jN        N concurrent jobs under --nice
+
+While each run is going a probe thread does a ~1ms CPU task every 20ms,
+standing in for API requests; its latency shows how much the batch hurts
+the backend next to it. Every run starts from a clean tree.
+
+Usage: python3 bench_inbox_worker.py [--clips 24] [--seconds 6] [--workers 1,2,4] [--profile normalize]
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import inbox_worker
+from ops_common import Histogram, format_size
+
+PROBE_EVERY = 0.02
+PROBE_PAYLOAD = {"items": [{"id": i, "title": f"clip {i}", "tags": ["a", "b", "c"]} for i in range(200)]}
+
+
+def make_clip(path, seconds, real_ffmpeg):
+    if real_ffmpeg:
+        subprocess.run(["ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+                        "-f", "lavfi", "-i", f"testsrc2=size=720x1280:rate=30:duration={seconds}",
+                        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                        "-c:v", "libx264", "-preset", "ultrafast", "-c:a", "aac", "-shortest", path], check=True)
+    else:
+        # about the bitrate of a 720p short
+        with open(path, "wb") as f:
+            f.write(os.urandom(int(seconds * 250000)))
+
+
+def build_tree(root, clips, seconds, real_ffmpeg):
+    template = os.path.join(root, "template.mp4")
+    make_clip(template, seconds, real_ffmpeg)
+    for index in range(clips):
+        inbox = os.path.join(root, "videos", "users", f"user{index % 3}__uid{index % 3}", "channels",
+                             f"chan{index % 4}__cid{index % 4}", "inbox")
+        os.makedirs(inbox, exist_ok=True)
+        shutil.copyfile(template, os.path.join(inbox, f"video{index}.mp4"))
+    os.unlink(template)
+
+
+def clean_outputs(root):
+    for dirpath, dirnames, _ in os.walk(root):
+        if inbox_worker.OUTPUT_DIR in dirnames:
+            shutil.rmtree(os.path.join(dirpath, inbox_worker.OUTPUT_DIR))
+            dirnames.remove(inbox_worker.OUTPUT_DIR)
+
+
+class Probe:
+    """Latency of a small CPU-bound task run at a fixed rate"""
+
+    def __init__(self):
+        self.histogram = Histogram()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        while not self.stop.wait(PROBE_EVERY):
+            started = time.perf_counter()
+            json.loads(json.dumps(PROBE_PAYLOAD))
+            self.histogram.record(int((time.perf_counter() - started) * 1e6))
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop.set()
+        self.thread.join()
+
+
+def run_once(root, profile, workers, nice, ffmpeg, threads=None):
+    clean_outputs(root)
+    worker = inbox_worker.InboxWorker(root, [profile], workers, ffmpeg, nice, "none", threads,
+                                      trim_seconds=2, log=lambda line: None)
+    with Probe() as probe:
+        started = time.perf_counter()
+        for path in inbox_worker.backlog(root, worker.wanted):
+            worker.submit(path)
+        worker.join()
+        elapsed = time.perf_counter() - started
+    worker.stop()
+    return elapsed, worker, probe.histogram
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clips", type=int, default=24, help="videos to generate")
+    parser.add_argument("--seconds", type=float, default=6, help="length of each clip")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--nice", type=int, default=10, help="niceness for the pooled runs")
+    parser.add_argument("--profile", choices=inbox_worker.PROFILES, default="normalize")
+    parser.add_argument("--fake", action="store_true", help="use fake_ffmpeg.py even if ffmpeg is installed")
+    parser.add_argument("--dir", help="where to build the tree (default: a temp dir, removed afterwards)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    real_ffmpeg = not args.fake and shutil.which("ffmpeg") is not None
+    ffmpeg = ["ffmpeg"] if real_ffmpeg else [sys.executable, os.path.join(os.path.dirname(__file__) or ".",
+                                                                          "fake_ffmpeg.py")]
+    root = args.dir or tempfile.mkdtemp(prefix="inbox-bench-")
+    try:
+        build_tree(root, args.clips, args.seconds, real_ffmpeg)
+        cpus = inbox_worker.available_cpus()
+        print(f"{args.clips} clips of {args.seconds:g}s ({'ffmpeg' if real_ffmpeg else 'fake_ffmpeg'}), "
+              f"profile {args.profile}, {cpus} CPUs available")
+
+        with Probe() as idle:
+            time.sleep(1)
+        print(f"\n{'run':<12} {'seconds':>8} {'jobs/s':>7} {'MB/s':>7} {'job p50':>8} {'job p95':>8} "
+              f"{'api p50':>8} {'api p99':>8}")
+        print(f"{'idle':<12} {'-':>8} {'-':>7} {'-':>7} {'-':>8} {'-':>8} "
+              f"{idle.histogram.percentile(50) / 1e3:>6.2f}ms {idle.histogram.percentile(99) / 1e3:>6.2f}ms")
+
+        runs = [("inline", 1, 0, cpus)] + [(f"-j{w} nice{args.nice}", w, args.nice, None)
+                                           for w in (int(w) for w in args.workers.split(","))]
+        for label, workers, nice, threads in runs:
+            elapsed, worker, api = run_once(root, args.profile, workers, nice, ffmpeg, threads)
+            done = worker.counts["done"]
+            print(f"{label:<12} {elapsed:>8.2f} {done / elapsed:>7.2f} {worker.bytes_in / 1e6 / elapsed:>7.1f} "
+                  f"{worker.histogram.percentile(50) / 1e6:>7.2f}s {worker.histogram.percentile(95) / 1e6:>7.2f}s "
+                  f"{api.percentile(50) / 1e3:>6.2f}ms {api.percentile(99) / 1e3:>6.2f}ms")
+            if done != args.clips or worker.counts["failed"]:
+                print(f"ERROR: {done}/{args.clips} done, {worker.counts['failed']} failed")
+        print(f"\ninput per run: {format_size(worker.bytes_in)}")
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark source_patcher on the largest TypeScript files of the backend
+
+For each of the largest .ts files, builds a batch of edits (anchor inserts
+taken from the file's own lines plus regex replacements), scales the file
+by concatenating copies of it and times the single-pass plan_edits()
+against the old approach of one str.replace/re.sub pass per edit. A flat
+ns/byte column across scales shows the multi-edit pass is linear in file size.
+
+Usage: python3 bench_source_patcher.py [--root backend/src] [--files 3] [--edits 20]
+"""
+import argparse
+import os
+import re
+import time
+
+from source_patcher import plan_edits
+
+SCALES = [1, 2, 4, 8, 16]
+
+
+def largest_files(root, count):
+    sizes = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d != "node_modules"]
+        for filename in filenames:
+            if filename.endswith(".ts"):
+                path = os.path.join(dirpath, filename)
+                sizes.append((os.path.getsize(path), path))
+    return [path for _, path in sorted(sizes, reverse=True)[:count]]
+
+
+def build_edits(content, count):
+    """Insert-after edits on distinct lines plus a couple of regex replacements"""
+    lines = [line for line in content.splitlines() if len(line.strip()) > 20]
+    unique = [line for line in dict.fromkeys(lines) if content.count(line) == 1]
+    step = max(1, len(unique) // max(1, count))
+    edits = []
+    for index, line in enumerate(unique[::step][:count]):
+        edits.append({
+            "type": "insert_after",
+            "anchor": line,
+            "text": f"\n// bench marker {index}",
+            "all": True,
+        })
+    edits.append({"type": "replace", "pattern": r"Logger\.debug\(", "replacement": "Logger.info("})
+    edits.append({"type": "replace", "pattern": r"^import type ", "replacement": "import ", "flags": "m"})
+    return edits
+
+
+def naive_apply(content, edits):
+    """One full pass over the content per edit, like the old scripts"""
+    for edit in edits:
+        if edit["type"] == "insert_after":
+            if edit["text"].strip() not in content:
+                content = content.replace(edit["anchor"], edit["anchor"] + edit["text"])
+        else:
+            flags = re.MULTILINE if "m" in edit.get("flags", "") else 0
+            content = re.sub(edit["pattern"], edit["replacement"], content, flags=flags)
+    return content
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default="backend/src", help="directory to take .ts files from")
+    parser.add_argument("--files", type=int, default=3, help="number of largest files to use")
+    parser.add_argument("--edits", type=int, default=20, help="anchor edits per file")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (best is kept)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"{'file':<28} {'scale':>5} {'size':>9} {'edits':>5} {'single ms':>10} {'ns/byte':>8} {'naive ms':>9}")
+    for path in largest_files(args.root, args.files):
+        with open(path, "r", encoding="utf-8") as f:
+            base = f.read()
+        edits = build_edits(base, args.edits)
+        for scale in SCALES:
+            content = base * scale
+            single = best_time(lambda: plan_edits(content, edits), args.repeat)
+            naive = best_time(lambda: naive_apply(content, edits), args.repeat)
+            print(f"{os.path.basename(path):<28} {scale:>5} {len(content) / 1024:>7.0f}KB {len(edits):>5} "
+                  f"{single * 1000:>10.2f} {single * 1e9 / len(content):>8.1f} {naive * 1000:>9.2f}")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark storage_dedup on a synthetic storage tree
+
+Builds users/*/channels/*/{inbox,uploaded/<platform>} with random "videos",
+a share of exact copies (same clip in inbox, uploaded and other channels)
+and same-size files that differ only in the middle (they pass the
+head/tail prefilter and must be rejected by the full hash). Then times a
+dry run for each worker count against hashing every file in full, and
+reports bytes read and the read rate so it can be compared with what the
+NAS disks sustain (check with --bwlimit that the cap holds).
+
+Freshly written files are in the page cache, so without --drop-caches
+(root only) the numbers are the CPU ceiling rather than disk throughput.
+
+Usage: python3 bench_storage_dedup.py [--videos 400] [--size-mb 4] [--dup-ratio 0.3] [--workers 1,2,4]
+"""
+import argparse
+import hashlib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import storage_dedup
+from ops_common import format_size
+
+PLATFORMS = ["youtube", "tiktok"]
+
+
+def build_tree(root, videos, size, dup_ratio, near_ratio, seed=1):
+    """Write the synthetic tree, returns (file count, exact duplicates)"""
+    rng = random.Random(seed)
+    channels = [(f"user{u}__uid{u}", f"chan{c}__cid{u}x{c}") for u in range(max(1, videos // 40)) for c in range(3)]
+    files = duplicates = 0
+    for index in range(videos):
+        user_key, channel_key = rng.choice(channels)
+        base = os.path.join(root, "videos", "users", user_key, "channels", channel_key)
+        data = os.urandom(size)
+        paths = [os.path.join(base, "inbox", f"v{index}.mp4")]
+        if rng.random() < dup_ratio:
+            other_user, other_channel = rng.choice(channels)
+            paths.append(os.path.join(base, "uploaded", rng.choice(PLATFORMS), f"v{index}.mp4"))
+            paths.append(os.path.join(root, "videos", "users", other_user, "channels", other_channel,
+                                      "inbox", f"copy{index}.mp4"))
+            duplicates += len(paths) - 1
+        for path in paths:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(data)
+            files += 1
+        if rng.random() < near_ratio:
+            middle = size // 2
+            near = data[:middle] + os.urandom(16) + data[middle + 16:]
+            with open(os.path.join(base, "inbox", f"near{index}.mp4"), "wb") as f:
+                f.write(near)
+            files += 1
+    return files, duplicates
+
+
+def drop_caches():
+    os.sync()
+    try:
+        with open("/proc/sys/vm/drop_caches", "w") as f:
+            f.write("3\n")
+        return True
+    except OSError:
+        return False
+
+
+def naive_full_hash(root):
+    """Hash every file in full, the baseline the prefilter avoids"""
+    total = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            digest = hashlib.sha256()
+            with open(os.path.join(dirpath, filename), "rb") as f:
+                for chunk in iter(lambda: f.read(storage_dedup.READ_SIZE), b""):
+                    digest.update(chunk)
+                    total += len(chunk)
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--videos", type=int, default=400, help="distinct clips to generate")
+    parser.add_argument("--size-mb", type=float, default=4, help="size of each clip")
+    parser.add_argument("--dup-ratio", type=float, default=0.3, help="share of clips copied twice more")
+    parser.add_argument("--near-ratio", type=float, default=0.1, help="share of clips with a same-size variant")
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--bwlimit", type=float, default=0, help="MB/s cap to check, 0 = unlimited")
+    parser.add_argument("--drop-caches", action="store_true", help="drop the page cache before each run (root)")
+    parser.add_argument("--dir", help="where to build the tree (default: a temp dir, removed afterwards)")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    root = args.dir or tempfile.mkdtemp(prefix="dedup-bench-")
+    try:
+        started = time.perf_counter()
+        files, duplicates = build_tree(root, args.videos, int(args.size_mb * 1024 * 1024),
+                                       args.dup_ratio, args.near_ratio)
+        print(f"tree: {files} files, {duplicates} exact duplicates, built in {time.perf_counter() - started:.1f}s")
+        cold = args.drop_caches and drop_caches()
+        if args.drop_caches and not cold:
+            print("WARNING: cannot drop caches (not root), timings are warm-cache")
+
+        started = time.perf_counter()
+        naive_bytes = naive_full_hash(root)
+        naive = time.perf_counter() - started
+        print(f"\n{'run':<14} {'seconds':>8} {'read':>9} {'MB/s':>8} {'files/s':>8} {'dups':>5}")
+        print(f"{'naive sha256':<14} {naive:>8.2f} {format_size(naive_bytes):>9} "
+              f"{naive_bytes / 1e6 / naive:>8.1f} {files / naive:>8.0f} {'-':>5}")
+
+        for workers in [int(w) for w in args.workers.split(",")]:
+            if args.drop_caches:
+                drop_caches()
+            started = time.perf_counter()
+            plan, stats = storage_dedup.run(root, workers, args.bwlimit, min_size=1)
+            elapsed = time.perf_counter() - started
+            print(f"{f'dedup -j{workers}':<14} {elapsed:>8.2f} {format_size(stats['read_bytes']):>9} "
+                  f"{stats['read_mb_per_s']:>8.1f} {files / elapsed:>8.0f} {stats['duplicates']:>5}")
+            if stats["duplicates"] != duplicates:
+                print(f"ERROR: expected {duplicates} duplicates, found {stats['duplicates']}")
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
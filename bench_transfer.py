@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmark the Synology upload strategies against a loopback ssh
+
+Every strategy uploads the same generated files through fake_ssh.py (put
+first on PATH as "ssh"), which runs the remote side locally in a sandbox
+under the same execve limits as the NAS and counts the bytes it relays:
+
+  heredoc        upload_to_synology.py        base64 inside the command line
+  echo-chunks    upload_to_synology_v2.py     50000-char echo per ssh call
+  stdin          upload_to_synology_v3.py     script and data on python3's stdin
+  printf-chunks  upload_to_synology_final.py  10000-char printf per ssh call
+  session        upload_to_synology_session.py  one helper per worker, framed
+
+More per-file strategies can be added with --strategy NAME=MODULE:FUNCTION
+(a function(local_path, remote_path) returning True on success).
+
+Cases are one file of each --sizes and --counts files of --count-size.
+Each run is a fresh process measured with wait4: wall time, bytes on the
+wire (command lines + stdin + replies, from the fake ssh log), ssh
+connections, peak RSS of the uploader and of its whole process tree
+(remote side included), and the failure mode when a run does not leave
+every file byte-identical on the "NAS". A strategy that fails a size is
+not tried on bigger ones.
+
+--save writes the results as JSON; --baseline compares against a saved
+run and exits 1 when a case newly fails or got slower than --tolerance,
+so it can gate changes to the uploaders.
+
+Usage: python3 bench_transfer.py [--quick] [--sizes 1K,64K,1M,10M,100M] [--counts 1,10,100,1000]
+                                 [--only heredoc,session] [--binary] [--save out.json] [--baseline old.json]
+"""
+import argparse
+import hashlib
+import importlib
+import json
+import os
+import random
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from ops_common import format_size, parse_size
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+STRATEGIES = {
+    "heredoc": "upload_to_synology:upload_file",
+    "echo-chunks": "upload_to_synology_v2:upload_file_via_temp",
+    "stdin": "upload_to_synology_v3:upload_file_via_stdin",
+    "printf-chunks": "upload_to_synology_final:upload_file_final",
+    "session": "upload_to_synology_session",
+}
+
+# first match in the uploader's output names the failure
+FAILURE_PATTERNS = [
+    ("arg-too-long", re.compile(r"Argument list too long|E2BIG")),
+    ("binary", re.compile(r"UnicodeDecodeError|can't decode byte")),
+    ("memory", re.compile(r"MemoryError|Cannot allocate memory|Killed")),
+    ("remote-script", re.compile(r"SyntaxError|NameError|Traceback")),
+    ("timeout", re.compile(r"[Tt]imeout")),
+]
+
+def make_content(size, seed, binary):
+    """size bytes of source-like text (or random bytes), different per seed"""
+    rng = random.Random(seed)
+    if binary:
+        block = rng.randbytes(min(size, 65536))
+    else:
+        words = ["const", "export", "function", "return", "await", "video", "channel", "user", "=>", "{", "}",
+                 "import", "from", "if", "else", "string", "number", "null", "true", "false", "// note"]
+        lines = []
+        length = 0
+        while length < min(size, 65536):
+            line = " " * rng.choice((0, 2, 4)) + " ".join(rng.choice(words) for _ in range(rng.randint(2, 12)))
+            lines.append(line)
+            length += len(line) + 1
+        block = ("\n".join(lines) + "\n").encode("ascii")
+    header = f"// file {seed}\n".encode("ascii")
+    repeated = header + block * (size // max(len(block), 1) + 1)
+    return repeated[:size]
+
+
+def build_case(root, count, size, binary):
+    """Write count files of size bytes, returns [(local, remote)]"""
+    files = []
+    local_dir = os.path.join(root, "local")
+    for index in range(count):
+        remote = f"src/bench/d{index % 10}/file_{index}.{'bin' if binary else 'ts'}"
+        local = os.path.join(local_dir, remote)
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        with open(local, "wb") as f:
+            f.write(make_content(size, index, binary))
+        files.append((local, remote))
+    return files
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_worker(args):
+    """In the measured child: import the strategy and upload the case"""
+    with open(args.files) as f:
+        files = [tuple(pair) for pair in json.load(f)]
+    spec = args.worker_spec
+    module_name, _, function_name = spec.partition(":")
+    module = importlib.import_module(module_name)
+    module.NAS_HOST = args.host
+    module.BASE_PATH = args.remote
+    succeeded = 0
+    if function_name:
+        upload = getattr(module, function_name)
+        for local_path, remote_path in files:
+            if upload(local_path, remote_path):
+                succeeded += 1
+    else:
+        # the session uploader's own flow, as its __main__ runs it
+        def session_factory():
+            return module.RemoteSession(args.host, args.remote)
+        try:
+            with session_factory() as session:
+                manifest = module.manifest_for_files(files)
+                jobs = [module.UploadJob(local, remote, sha256) for local, remote, sha256 in manifest]
+                succeeded = module.run_uploads(session_factory, jobs, args.workers, initial_session=session)
+        except module.SessionError as e:
+            print(f"ERROR: {e}")
+    sys.stdout.flush()
+    with open(args.result, "w") as f:
+        json.dump({"succeeded": succeeded, "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}, f)
+    return 0
+
+
+class Runner:
+    """Runs one strategy on one case in a child process and measures it"""
+
+    def __init__(self, work, args):
+        self.work = work
+        self.args = args
+        self.bin = os.path.join(work, "bin")
+        os.makedirs(self.bin, exist_ok=True)
+        wrapper = os.path.join(self.bin, "ssh")
+        with open(wrapper, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{os.path.join(HERE, "fake_ssh.py")}" "$@"\n')
+        os.chmod(wrapper, 0o755)
+
+    def environment(self, log):
+        env = dict(os.environ)
+        env["PATH"] = self.bin + os.pathsep + env.get("PATH", "")
+        env["PYTHONPATH"] = HERE + os.pathsep + env.get("PYTHONPATH", "")
+        env["FAKE_SSH_LOG"] = log
+        env["FAKE_SSH_CONNECT"] = str(self.args.connect)
+        if self.args.bandwidth:
+            env["FAKE_SSH_BPS"] = str(self.args.bandwidth)
+        env["TMPDIR"] = os.path.join(self.work, "tmp")
+        return env
+
+    def limit_memory(self):
+        if self.args.mem_limit:
+            limit = self.args.mem_limit * 1024 * 1024
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+    def run(self, strategy, spec, files):
+        remote = os.path.join(self.work, "nas", strategy)
+        shutil.rmtree(remote, ignore_errors=True)
+        os.makedirs(remote)
+        os.makedirs(os.path.join(self.work, "tmp"), exist_ok=True)
+        log = os.path.join(self.work, "ssh.log")
+        output = os.path.join(self.work, "output.txt")
+        result_path = os.path.join(self.work, "result.json")
+        files_path = os.path.join(self.work, "files.json")
+        for path in (log, result_path):
+            if os.path.exists(path):
+                os.unlink(path)
+        with open(files_path, "w") as f:
+            json.dump(files, f)
+
+        command = [sys.executable, os.path.abspath(__file__), "--worker", spec, "--files", files_path,
+                   "--result", result_path, "--host", "bench@nas.invalid", "--remote", remote,
+                   "--workers", str(self.args.workers)]
+        timed_out = False
+        started = time.perf_counter()
+        with open(output, "w") as out:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=out, stderr=subprocess.STDOUT,
+                                       env=self.environment(log), cwd=self.work, start_new_session=True,
+                                       preexec_fn=self.limit_memory)
+            deadline = started + self.args.timeout
+            while True:
+                pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+                if pid:
+                    break
+                if time.perf_counter() > deadline:
+                    timed_out = True
+                    os.killpg(process.pid, signal.SIGKILL)
+                    pid, status, usage = os.wait4(process.pid, 0)
+                    break
+                time.sleep(0.01)
+            process.returncode = os.waitstatus_to_exitcode(status)
+        elapsed = time.perf_counter() - started
+
+        with open(output, errors="replace") as f:
+            text = f.read()
+        try:
+            with open(result_path) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            result = {"succeeded": 0, "rss": 0}
+        connections = []
+        if os.path.exists(log):
+            with open(log) as f:
+                connections = [json.loads(line) for line in f if line.strip()]
+
+        intact = 0
+        for local, relative in files:
+            target = os.path.join(remote, relative)
+            if os.path.exists(target) and sha256_of(target) == sha256_of(local):
+                intact += 1
+        failure = None
+        if timed_out:
+            failure = "timeout"
+        elif intact < len(files):
+            failure = next((name for name, pattern in FAILURE_PATTERNS if pattern.search(text)), None)
+            if failure is None:
+                failure = "corrupt" if result["succeeded"] >= len(files) else "error"
+        return {
+            "strategy": strategy,
+            "seconds": round(elapsed, 3),
+            "intact": intact,
+            "files": len(files),
+            "bytes": sum(os.path.getsize(local) for local, _ in files),
+            "wire": sum(c["command"] + c["stdin"] + c["stdout"] + c["stderr"] for c in connections),
+            "connections": len(connections),
+            "rss_kb": result["rss"],
+            "tree_rss_kb": usage.ru_maxrss,
+            "failure": failure,
+            "detail": last_error(text) if failure else "",
+        }
+
+
+def last_error(text):
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    for line in reversed(lines):
+        if any(pattern.search(line) for _, pattern in FAILURE_PATTERNS) or line.startswith("ERROR"):
+            return line[:120]
+    return lines[-1][:120] if lines else ""
+
+
+def cases(args):
+    """(label, count, size) for every case to run"""
+    result = [(f"1 x {format_size(size)}", 1, size) for size in args.sizes]
+    result += [(f"{count} x {format_size(args.count_size)}", count, args.count_size)
+               for count in args.counts if count > 1]
+    return result
+
+
+def print_table(results):
+    print(f"\n{'case':<16} {'strategy':<14} {'seconds':>8} {'MB/s':>7} {'wire':>10} {'x':>5} {'ssh':>6} "
+          f"{'rss':>9} {'tree rss':>9}  status")
+    for row in results:
+        if row.get("skipped"):
+            print(f"{row['case']:<16} {row['strategy']:<14} {'-':>8} {'-':>7} {'-':>10} {'-':>5} {'-':>6} "
+                  f"{'-':>9} {'-':>9}  skipped ({row['skipped']})")
+            continue
+        rate = row["bytes"] / 1e6 / row["seconds"] if row["seconds"] and not row["failure"] else 0
+        overhead = row["wire"] / row["bytes"] if row["bytes"] else 0
+        status = "ok" if not row["failure"] else f"FAIL {row['failure']} ({row['intact']}/{row['files']})"
+        print(f"{row['case']:<16} {row['strategy']:<14} {row['seconds']:>8.2f} {rate:>7.2f} "
+              f"{format_size(row['wire']):>10} {overhead:>5.2f} {row['connections']:>6} "
+              f"{format_size(row['rss_kb'] * 1024):>9} {format_size(row['tree_rss_kb'] * 1024):>9}  {status}")
+    failures = [row for row in results if row.get("failure")]
+    if failures:
+        print("\nfailure details:")
+        for row in failures:
+            print(f"  {row['case']} {row['strategy']}: {row['detail']}")
+
+
+def compare(results, baseline, tolerance):
+    """Regressions against a saved run, as printable lines"""
+    previous = {(row["case"], row["strategy"]): row for row in baseline}
+    problems = []
+    for row in results:
+        old = previous.get((row["case"], row["strategy"]))
+        if old is None or row.get("skipped") or old.get("skipped"):
+            continue
+        if row["failure"] and not old["failure"]:
+            problems.append(f"{row['case']} {row['strategy']}: now fails ({row['failure']})")
+        elif not row["failure"] and not old["failure"] and row["seconds"] > old["seconds"] * (1 + tolerance) \
+                and row["seconds"] - old["seconds"] > 0.05:
+            problems.append(f"{row['case']} {row['strategy']}: {old['seconds']:.2f}s -> {row['seconds']:.2f}s")
+    return problems
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1K,64K,1M,10M,100M",
+                        help="single-file sizes (default: %(default)s)")
+    parser.add_argument("--counts", default="1,10,100,1000", help="file counts (default: %(default)s)")
+    parser.add_argument("--count-size", type=parse_size, default=parse_size("4K"),
+                        help="size of each file in the count cases (default: 4K)")
+    parser.add_argument("--quick", action="store_true", help="sizes 1K,64K,1M and counts 1,10,100")
+    parser.add_argument("--only", help="comma-separated strategies to run")
+    parser.add_argument("--strategy", action="append", default=[], metavar="NAME=MODULE:FUNCTION",
+                        help="add a per-file strategy (may be repeated)")
+    parser.add_argument("--binary", action="store_true", help="random bytes instead of source-like text")
+    parser.add_argument("--connect", type=float, default=0.1,
+                        help="seconds per new ssh connection (default: %(default)s)")
+    parser.add_argument("--bandwidth", type=parse_size, help="cap on bytes/s sent, e.g. 12M for 100 Mbit")
+    parser.add_argument("--workers", type=int, default=4, help="session uploader workers (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds per run (default: %(default)s)")
+    parser.add_argument("--mem-limit", type=int, metavar="MB", help="address-space limit for each run")
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="fail on regressions against this saved JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown against --baseline (default: %(default)s)")
+    parser.add_argument("--dir", help="work directory (default: a temp dir, removed afterwards)")
+    # used by the measured child process
+    parser.add_argument("--worker", dest="worker_spec", help=argparse.SUPPRESS)
+    parser.add_argument("--files", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    parser.add_argument("--host", help=argparse.SUPPRESS)
+    parser.add_argument("--remote", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.sizes, args.counts = "1K,64K,1M", "1,10,100"
+    args.sizes = [parse_size(size) for size in args.sizes.split(",")]
+    args.counts = [int(count) for count in args.counts.split(",")]
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker_spec:
+        return run_worker(args)
+
+    strategies = dict(STRATEGIES)
+    for spec in args.strategy:
+        name, _, target = spec.partition("=")
+        if ":" not in target:
+            print(f"ERROR: --strategy expects NAME=MODULE:FUNCTION, got {spec}")
+            return 2
+        strategies[name] = target
+    if args.only:
+        wanted = args.only.split(",")
+        unknown = [name for name in wanted if name not in strategies]
+        if unknown:
+            print(f"ERROR: unknown strategies: {', '.join(unknown)} (have {', '.join(strategies)})")
+            return 2
+        strategies = {name: strategies[name] for name in wanted}
+
+    work = args.dir or tempfile.mkdtemp(prefix="transfer-bench-")
+    results = []
+    try:
+        runner = Runner(work, args)
+        print(f"{len(strategies)} strategies, {'binary' if args.binary else 'text'} files, "
+              f"{args.connect:g}s per ssh connection"
+              + (f", {format_size(args.bandwidth)}/s" if args.bandwidth else ""))
+        broken = {}
+        for label, count, size in cases(args):
+            case_dir = os.path.join(work, "case")
+            shutil.rmtree(case_dir, ignore_errors=True)
+            files = build_case(case_dir, count, size, args.binary)
+            for strategy, spec in strategies.items():
+                # a size that broke a strategy breaks it for every bigger size too
+                if count == 1 and strategy in broken and size > broken[strategy][0]:
+                    results.append({"case": label, "strategy": strategy,
+                                    "skipped": f"{broken[strategy][1]} at {format_size(broken[strategy][0])}"})
+                    continue
+                row = runner.run(strategy, spec, files)
+                row["case"] = label
+                results.append(row)
+                print(f"{label:<16} {strategy:<14} {row['seconds']:>8.2f}s  "
+                      f"{'ok' if not row['failure'] else 'FAIL ' + row['failure']}", flush=True)
+                if count == 1 and row["failure"] and row["failure"] != "binary":
+                    broken.setdefault(strategy, (size, row["failure"]))
+        print_table(results)
+    finally:
+        if not args.dir:
+            shutil.rmtree(work, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nOK: results saved to {args.save}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"ERROR: regression: {problem}")
+        if problems:
+            return 1
+        print(f"OK: no regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
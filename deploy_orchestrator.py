@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Run the NAS + VPS deploy as a DAG of steps with health-gated restarts and rollback
+
+The manual deploy is: run an uploader, apply_all_changes.py on the NAS, the
+three docker-compose commands it prints, then the VPS checks. Here each of
+those is a step bound to a host (local shell, or ssh to the NAS/VPS) with
+dependencies, and a step starts as soon as its dependencies succeeded, so
+independent work overlaps: the image snapshot and the VPS pre-check run
+while files upload, the build starts right after patching. A step whose
+"host" is a list fans out to one step per host.
+
+Steps may carry a health gate: after the command succeeds,
+/api/diag/buildinfo is polled until it reports the expected gitSha and
+buildId (the running container reads GIT_SHA/BUILD_ID from its env), and
+only then do dependent steps start. When a step or its gate fails nothing
+new is started, and the rollback commands of the failed step and of every
+finished step run in reverse order.
+
+Every health URL is also polled throughout the deploy to measure real
+downtime (longest gap without a successful response). Step timings are
+printed as a timeline with total wall time next to the serial sum.
+
+The plan is DEFAULT_PLAN below or a JSON file (--plan) of the same shape;
+"{name}" placeholders in commands and URLs are filled from "vars",
+--set NAME=VALUE, build_id and git_sha. --fake swaps the hosts for local
+subprocesses: each "backend" is a diag_mock_server.py restarted with the new
+BUILD_ID, so the whole flow, including rollback (--fake-fail), runs offline.
+
+Examples:
+  python3 deploy_orchestrator.py --dry-run
+  python3 deploy_orchestrator.py --git-sha $(git rev-parse HEAD)
+  python3 deploy_orchestrator.py --plan deploy.json --with vps_setup
+  python3 deploy_orchestrator.py --fake
+  python3 deploy_orchestrator.py --fake --fake-fail
+"""
+import argparse
+import copy
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import ops_trace
+from ops_common import fetch_buildinfo
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SSH_OPTIONS = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+HEALTH_INTERVAL = 1.0
+MONITOR_INTERVAL = 0.2
+LOG_TAIL_LINES = 15
+
+DEFAULT_PLAN = {
+    "vars": {
+        "base_path": "/volume1/docker/shortsai/backend",
+        # outside the backend directory, which is the Docker build context
+        "tools_path": "/volume1/docker/shortsai/deploy-tools",
+        "compose": "sudo /usr/local/bin/docker-compose",
+        "image": "backend_backend",
+        "nas_url": "http://192.168.100.222:7777",
+        "public_url": "https://api.shortsai.ru",
+    },
+    "hosts": {
+        "local": {},
+        "nas": {"ssh": "adminv@192.168.100.222"},
+        "vps": {"ssh": "root@api.shortsai.ru"},
+    },
+    "steps": [
+        {"name": "upload", "host": "local",
+         "run": "python3 upload_to_synology_session.py --sync"},
+        {"name": "snapshot", "host": "nas",
+         "run": "cd {base_path} && sudo docker tag {image}:latest {image}:rollback"
+                " && cp .env.production .env.production.rollback"},
+        {"name": "vps_check", "host": "vps", "stdin": "check_vps_status.sh", "run": "bash -s"},
+        {"name": "vps_setup", "host": "vps", "stdin": "setup_vps_api.sh", "run": "bash -s",
+         "optional": True, "deps": ["vps_check"]},
+        {"name": "tools", "host": "local",
+         "run": "python3 upload_to_synology_session.py --sync --base-path {tools_path}"
+                " --file apply_all_changes.py --file source_patcher.py --file update_index.py --file ops_trace.py"},
+        {"name": "patch", "host": "nas", "deps": ["upload", "tools"],
+         "run": "cd {base_path} && python3 {tools_path}/apply_all_changes.py --root {base_path}"},
+        {"name": "build", "host": "nas", "deps": ["patch", "snapshot"],
+         "run": "cd {base_path} && {compose} build backend"},
+        {"name": "restart", "host": "nas", "deps": ["build"],
+         "run": "cd {base_path} && sed -i '/^BUILD_ID=/d;/^GIT_SHA=/d' .env.production"
+                " && printf 'BUILD_ID=%s\\nGIT_SHA=%s\\n' {build_id} {git_sha} >> .env.production"
+                " && {compose} up -d --no-deps backend",
+         "rollback": "cd {base_path} && sudo docker tag {image}:rollback {image}:latest"
+                     " && cp .env.production.rollback .env.production && {compose} up -d --no-deps backend",
+         "health": {"url": "{nas_url}/api/diag/buildinfo", "timeout": 180}},
+        {"name": "public_check", "host": "local", "deps": ["restart", "vps_check"],
+         "run": "true",
+         "health": {"url": "{public_url}/api/diag/buildinfo", "timeout": 60}},
+    ],
+}
+
+
+class DeployError(Exception):
+    pass
+
+
+def fill(template, variables):
+    try:
+        return template.format_map(variables)
+    except KeyError as e:
+        raise DeployError(f"unknown placeholder {e} in {template!r}")
+
+
+def expand_steps(plan, enabled):
+    """Resolve fan-out and optional steps into {name: step} with concrete deps"""
+    instances = {}
+    for step in plan["steps"]:
+        if step.get("optional") and step["name"] not in enabled:
+            continue
+        hosts = step["host"] if isinstance(step["host"], list) else [step["host"]]
+        for host in hosts:
+            if host not in plan["hosts"]:
+                raise DeployError(f"step {step['name']}: unknown host {host}")
+            name = step["name"] if len(hosts) == 1 else f"{step['name']}@{host}"
+            instances[name] = dict(step, name=name, host=host, base=step["name"])
+    by_base = {}
+    for name, step in instances.items():
+        by_base.setdefault(step["base"], []).append(name)
+    for step in instances.values():
+        deps = []
+        for dep in step.get("deps", []):
+            if dep not in by_base:
+                if any(s["name"] == dep and s.get("optional") for s in plan["steps"]):
+                    continue
+                raise DeployError(f"step {step['name']}: unknown dependency {dep}")
+            same_host = [name for name in by_base[dep] if instances[name]["host"] == step["host"]]
+            # a fanned-out step waits for its own host's instance, otherwise for all of them
+            deps.extend(same_host if len(by_base[dep]) > 1 and same_host else by_base[dep])
+        step["deps"] = deps
+    check_acyclic(instances)
+    return instances
+
+
+def check_steps(steps, variables):
+    """Fail before anything starts on unknown placeholders or missing stdin scripts"""
+    for step in steps.values():
+        templates = [step["run"], step.get("rollback", "")]
+        if step.get("health"):
+            templates.append(step["health"]["url"])
+            templates.extend(step["health"].get("expect", {}).values())
+        for template in templates:
+            fill(template, variables)
+        if step.get("stdin") and not os.path.isfile(os.path.join(HERE, step["stdin"])):
+            raise DeployError(f"step {step['name']}: stdin script {step['stdin']} not found")
+
+
+def check_acyclic(steps):
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == "done":
+            return
+        if state.get(name) == "visiting":
+            raise DeployError("dependency cycle: " + " -> ".join(path + [name]))
+        state[name] = "visiting"
+        for dep in steps[name]["deps"]:
+            visit(dep, path + [name])
+        state[name] = "done"
+
+    for name in steps:
+        visit(name, [])
+
+
+class DowntimeMonitor:
+    """Polls health URLs in the background and measures gaps between good responses"""
+
+    def __init__(self, urls, interval=MONITOR_INTERVAL):
+        self.urls = sorted(set(urls))
+        self.interval = interval
+        self.stats = {url: {"checks": 0, "failures": 0, "down_since": None, "longest": 0.0, "total": 0.0}
+                      for url in self.urls}
+        self.stop_event = threading.Event()
+        self.threads = [threading.Thread(target=self.watch, args=(url,), daemon=True) for url in self.urls]
+
+    def watch(self, url):
+        stats = self.stats[url]
+        last_ok = None
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            try:
+                fetch_buildinfo(url, timeout=2)
+                ok = True
+            except (OSError, ValueError):
+                ok = False
+            stats["checks"] += 1
+            if ok:
+                if stats["down_since"] is not None:
+                    gap = now - stats["down_since"]
+                    stats["longest"] = max(stats["longest"], gap)
+                    stats["total"] += gap
+                    stats["down_since"] = None
+                last_ok = now
+            else:
+                stats["failures"] += 1
+                if stats["down_since"] is None:
+                    stats["down_since"] = last_ok if last_ok is not None else now
+            self.stop_event.wait(self.interval)
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        now = time.monotonic()
+        for stats in self.stats.values():
+            if stats["down_since"] is not None:
+                gap = now - stats["down_since"]
+                stats["longest"] = max(stats["longest"], gap)
+                stats["total"] += gap
+
+
+class Orchestrator:
+    def __init__(self, plan, steps, variables, log_dir, dry_run=False, print_lock=None):
+        self.plan = plan
+        self.steps = steps
+        self.vars = variables
+        self.log_dir = log_dir
+        self.dry_run = dry_run
+        self.results = {}
+        self.lock = threading.Lock()
+        self.print_lock = print_lock or threading.Lock()
+        self.started = None
+
+    def say(self, line):
+        with self.print_lock:
+            print(line, flush=True)
+
+    def command(self, host, script):
+        """argv running a shell script on a host"""
+        ssh = self.plan["hosts"][host].get("ssh")
+        if ssh:
+            return ["ssh"] + SSH_OPTIONS + [ssh, script]
+        return ["bash", "-c", script]
+
+    def run_script(self, step, script, suffix=""):
+        """Run one command of a step, output goes to its log file; returns (ok, log path)"""
+        log_path = os.path.join(self.log_dir, f"{step['name']}{suffix}.log")
+        stdin = subprocess.DEVNULL
+        if step.get("stdin"):
+            stdin = open(os.path.join(HERE, step["stdin"]), "rb")
+        env = dict(os.environ, BUILD_ID=self.vars["build_id"], GIT_SHA=self.vars["git_sha"])
+        try:
+            with open(log_path, "wb") as log:
+                log.write(f"$ {script}\n".encode())
+                log.flush()
+                process = subprocess.run(self.command(step["host"], script), stdin=stdin, stdout=log,
+                                         stderr=subprocess.STDOUT, cwd=HERE, env=env,
+                                         timeout=step.get("timeout", 3600))
+            return process.returncode == 0, log_path
+        except (OSError, subprocess.TimeoutExpired) as e:
+            with open(log_path, "a") as log:
+                log.write(f"\n{e}\n")
+            return False, log_path
+        finally:
+            if stdin is not subprocess.DEVNULL:
+                stdin.close()
+
+    def health_gate(self, gate):
+        """Poll buildinfo until it reports the expected build, returns (ok, detail)"""
+        url = fill(gate["url"], self.vars)
+        expect = {key: fill(value, self.vars)
+                  for key, value in gate.get("expect", {"gitSha": "{git_sha}", "buildId": "{build_id}"}).items()}
+        deadline = time.monotonic() + gate.get("timeout", 120)
+        last = "no response"
+        while True:
+            try:
+                info = fetch_buildinfo(url)
+                mismatched = {key: info.get(key) for key, value in expect.items() if info.get(key) != value}
+                if not mismatched:
+                    return True, f"{url} reports {expect}"
+                last = f"{url} reports {mismatched}, expected {expect}"
+            except (OSError, ValueError) as e:
+                last = f"{url}: {e}"
+            if time.monotonic() >= deadline:
+                return False, last
+            time.sleep(gate.get("interval", HEALTH_INTERVAL))
+
+    def run_step(self, step):
+        started = time.monotonic()
+        result = {"name": step["name"], "host": step["host"], "start": started - self.started,
+                  "ok": False, "detail": ""}
+        script = fill(step["run"], self.vars)
+        if self.dry_run:
+            result.update(ok=True, detail=script)
+        else:
+            with ops_trace.span(step["name"], cat="step", host=step["host"]):
+                ok, log_path = self.run_script(step, script)
+            result["log"] = log_path
+            if not ok:
+                result["detail"] = f"command failed, see {log_path}"
+            elif step.get("health"):
+                gate_started = time.monotonic()
+                with ops_trace.span(f"{step['name']} health gate", cat="gate", host=step["host"]):
+                    ok, result["detail"] = self.health_gate(step["health"])
+                result["gate_seconds"] = time.monotonic() - gate_started
+            result["ok"] = ok
+        result["seconds"] = time.monotonic() - started
+        with self.lock:
+            self.results[step["name"]] = result
+        status = "OK" if result["ok"] else "ERROR"
+        self.say(f"{status}: {step['name']} ({step['host']}) {result['seconds']:.1f}s"
+                 + (f" - {result['detail']}" if result["detail"] and not self.dry_run else ""))
+        if not result["ok"] and result.get("log"):
+            with open(result["log"], errors="replace") as f:
+                for line in f.read().splitlines()[-LOG_TAIL_LINES:]:
+                    self.say(f"    {line}")
+        return result
+
+    def run(self):
+        """Execute the DAG; returns True if every step succeeded"""
+        self.started = time.monotonic()
+        pending = dict(self.steps)
+        running = {}
+        failed = False
+        done_event = threading.Condition(self.lock)
+
+        def worker(step):
+            started = time.monotonic()
+            try:
+                self.run_step(step)
+            except Exception as e:
+                # record the failure, otherwise run() waits for this step forever
+                with self.lock:
+                    self.results.setdefault(step["name"], {
+                        "name": step["name"], "host": step["host"], "ok": False,
+                        "start": started - self.started, "seconds": time.monotonic() - started,
+                        "detail": str(e)})
+                self.say(f"ERROR: {step['name']} ({step['host']}) - {e}")
+            with done_event:
+                done_event.notify_all()
+
+        while pending or running:
+            with self.lock:
+                finished = [name for name in running if name in self.results]
+                for name in finished:
+                    running.pop(name)
+                    failed = failed or not self.results[name]["ok"]
+                if not failed:
+                    ready = [step for step in pending.values()
+                             if all(dep in self.results and self.results[dep]["ok"] for dep in step["deps"])]
+                else:
+                    ready = []
+                    if not running:
+                        break
+                if not ready and not running:
+                    # the remaining steps depend on something that failed
+                    break
+                for step in ready:
+                    del pending[step["name"]]
+                    thread = threading.Thread(target=worker, args=(step,), daemon=True)
+                    running[step["name"]] = thread
+                    thread.start()
+                if not ready:
+                    done_event.wait(0.5)
+        self.skipped = sorted(pending)
+        return not failed and not pending
+
+    def rollback(self):
+        """Rollback commands of finished and failed steps, most recent first"""
+        order = sorted(self.results.values(), key=lambda result: result["start"] + result["seconds"],
+                       reverse=True)
+        ok = True
+        for result in order:
+            step = self.steps[result["name"]]
+            if not step.get("rollback"):
+                continue
+            started = time.monotonic()
+            success, log_path = self.run_script(step, fill(step["rollback"], self.vars), ".rollback")
+            detail = "" if success else f", see {log_path}"
+            if success and step.get("health"):
+                # wait until the previous build answers again
+                previous = self.vars.get(f"prev_build_id_{step['host']}", "unknown")
+                gate = dict(step["health"], expect={} if previous == "unknown" else {"buildId": previous})
+                success, detail = self.health_gate(gate)
+                detail = f" - {detail}"
+            ok = ok and success
+            self.say(f"{'OK' if success else 'ERROR'}: rollback {step['name']} ({step['host']}) "
+                     f"{time.monotonic() - started:.1f}s{detail}")
+        return ok
+
+
+def print_timeline(results, total, width=40):
+    print(f"\n{'step':<18} {'host':<8} {'start':>7} {'seconds':>8}  timeline")
+    scale = width / max(total, 1e-9)
+    for result in sorted(results.values(), key=lambda r: r["start"]):
+        offset = int(result["start"] * scale)
+        length = max(1, int(result["seconds"] * scale))
+        bar = " " * offset + ("#" if result["ok"] else "x") * length
+        gate = f" (gate {result['gate_seconds']:.1f}s)" if "gate_seconds" in result else ""
+        print(f"{result['name']:<18} {result['host']:<8} {result['start']:>7.1f} {result['seconds']:>8.1f}  "
+              f"{bar}{gate}")
+    serial = sum(result["seconds"] for result in results.values())
+    print(f"\ntotal {total:.1f}s wall, {serial:.1f}s if run one after another")
+
+
+def git_sha():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def fake_plan(workdir, fail=False):
+    """Local stand-ins: two mock backends restarted with the new BUILD_ID, sleeps for transfer/build"""
+    server = shlex.quote(os.path.join(HERE, "diag_mock_server.py"))
+    python = shlex.quote(sys.executable)
+
+    def restart(name, port, build_env):
+        pid = shlex.quote(os.path.join(workdir, f"{name}.pid"))
+        # the mock takes ~1s to come up, like a container starting
+        return (f"kill $(cat {pid}) 2>/dev/null; {build_env} "
+                f"nohup sh -c 'sleep 1; exec {python} {server} --port {port}' > /dev/null 2>&1 & echo $! > {pid}")
+
+    new_env = "BUILD_ID=broken GIT_SHA=broken" if fail else "BUILD_ID={build_id} GIT_SHA={git_sha}"
+    old_env = "BUILD_ID={prev_build_id_nas} GIT_SHA={prev_git_sha_nas}"
+    plan = copy.deepcopy(DEFAULT_PLAN)
+    plan["vars"].update({"nas_url": "http://127.0.0.1:{nas_port}", "public_url": "http://127.0.0.1:{nas_port}"})
+    plan["hosts"] = {"local": {}, "nas": {}, "nas2": {}, "vps": {}}
+    plan["steps"] = [
+        {"name": "upload", "host": "local", "run": "sleep 1.5"},
+        {"name": "snapshot", "host": ["nas", "nas2"], "run": "sleep 0.3"},
+        {"name": "vps_check", "host": "vps", "run": "sleep 0.8"},
+        {"name": "patch", "host": ["nas", "nas2"], "deps": ["upload"], "run": "sleep 0.3"},
+        {"name": "build", "host": ["nas", "nas2"], "deps": ["patch", "snapshot"], "run": "sleep 2"},
+        {"name": "restart", "host": "nas", "deps": ["build"],
+         "run": restart("nas", "{nas_port}", new_env),
+         "rollback": restart("nas", "{nas_port}", old_env),
+         "health": {"url": "{nas_url}/api/diag/buildinfo", "timeout": 5, "interval": 0.2}},
+        # the second backend only restarts once the first one is healthy
+        {"name": "restart2", "host": "nas2", "deps": ["build", "restart"],
+         "run": restart("nas2", "{nas2_port}", "BUILD_ID={build_id} GIT_SHA={git_sha}"),
+         "rollback": restart("nas2", "{nas2_port}", "BUILD_ID={prev_build_id_nas2} GIT_SHA={prev_git_sha_nas2}"),
+         "health": {"url": "http://127.0.0.1:{nas2_port}/api/diag/buildinfo", "timeout": 5, "interval": 0.2}},
+        {"name": "public_check", "host": "local", "deps": ["restart2", "vps_check"], "run": "true",
+         "health": {"url": "{public_url}/api/diag/buildinfo", "timeout": 5, "interval": 0.2}},
+    ]
+    return plan
+
+
+def start_fake_backends(workdir, variables):
+    from diag_mock_server import start_mock_server
+
+    processes = []
+    for name in ("nas", "nas2"):
+        probe = start_mock_server()
+        port = probe.server_address[1]
+        probe.shutdown()
+        probe.server_close()
+        env = dict(os.environ, BUILD_ID=f"{name}-previous", GIT_SHA="0" * 40)
+        process = subprocess.Popen([sys.executable, os.path.join(HERE, "diag_mock_server.py"), "--port", str(port)],
+                                   env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        with open(os.path.join(workdir, f"{name}.pid"), "w") as f:
+            f.write(str(process.pid))
+        variables[f"{name}_port"] = str(port)
+        processes.append(process)
+    for name in ("nas", "nas2"):
+        url = f"http://127.0.0.1:{variables[f'{name}_port']}/api/diag/buildinfo"
+        for _ in range(50):
+            try:
+                fetch_buildinfo(url)
+                break
+            except OSError:
+                time.sleep(0.1)
+    return processes
+
+
+def stop_fake_backends(workdir):
+    for name in ("nas", "nas2"):
+        try:
+            with open(os.path.join(workdir, f"{name}.pid")) as f:
+                os.kill(int(f.read()), 15)
+        except (OSError, ValueError):
+            pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plan", help="JSON plan file (default: the built-in NAS + VPS plan)")
+    parser.add_argument("--git-sha", help="expected GIT_SHA (default: git rev-parse HEAD)")
+    parser.add_argument("--build-id", help="expected BUILD_ID (default: UTC timestamp + short sha)")
+    parser.add_argument("--set", action="append", default=[], metavar="NAME=VALUE", help="override a plan var")
+    parser.add_argument("--with", dest="enable", action="append", default=[], help="enable an optional step")
+    parser.add_argument("--no-rollback", action="store_true", help="leave a failed deploy as it is")
+    parser.add_argument("--log-dir", help="step logs (default: a new temp dir)")
+    parser.add_argument("--dry-run", action="store_true", help="print the DAG and commands without running")
+    parser.add_argument("--fake", action="store_true", help="run against local mock backends instead of hosts")
+    parser.add_argument("--fake-fail", action="store_true", help="with --fake, deploy a build that fails its gate")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="deploy-")
+    log_dir = args.log_dir or workdir
+    os.makedirs(log_dir, exist_ok=True)
+    if args.fake:
+        plan = fake_plan(workdir, args.fake_fail)
+    elif args.plan:
+        with open(args.plan, encoding="utf-8") as f:
+            plan = json.load(f)
+    else:
+        plan = DEFAULT_PLAN
+
+    sha = args.git_sha or git_sha()
+    variables = dict(plan.get("vars", {}))
+    variables.update(git_sha=sha, build_id=args.build_id or f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{sha[:7]}")
+    for assignment in args.set:
+        name, _, value = assignment.partition("=")
+        variables[name] = value
+    processes = start_fake_backends(workdir, variables) if args.fake and not args.dry_run else []
+    try:
+        # vars may refer to other vars (nas_url -> nas_port)
+        for _ in range(3):
+            variables = {name: fill(value, variables) if isinstance(value, str) else value
+                         for name, value in variables.items()}
+        steps = expand_steps(plan, set(args.enable))
+        gates = [fill(step["health"]["url"], variables) for step in steps.values() if step.get("health")]
+        for step in steps.values():
+            if step.get("health") and not args.dry_run:
+                host = step["host"]
+                try:
+                    info = fetch_buildinfo(fill(step["health"]["url"], variables))
+                    variables.setdefault(f"prev_build_id_{host}", info.get("buildId", ""))
+                    variables.setdefault(f"prev_git_sha_{host}", info.get("gitSha", ""))
+                except (OSError, ValueError):
+                    pass
+                variables.setdefault(f"prev_build_id_{host}", "unknown")
+                variables.setdefault(f"prev_git_sha_{host}", "unknown")
+        check_steps(steps, variables)
+
+        print(f"deploying {variables['build_id']} (git {sha[:12]}): {len(steps)} steps on "
+              f"{len({step['host'] for step in steps.values()})} hosts, logs in {log_dir}", flush=True)
+        orchestrator = Orchestrator(plan, steps, variables, log_dir, args.dry_run)
+        if args.dry_run:
+            for name, step in steps.items():
+                deps = ", ".join(step["deps"]) or "-"
+                print(f"  {name} on {step['host']} after [{deps}]: {fill(step['run'], variables)}")
+                if step.get("health"):
+                    print(f"      gate: {fill(step['health']['url'], variables)}")
+            return 0
+
+        started = time.monotonic()
+        with ops_trace.tracing(args.trace, args.profile), DowntimeMonitor(gates) as monitor:
+            ok = orchestrator.run()
+            if not ok and not args.no_rollback:
+                print("\nrolling back", flush=True)
+                with ops_trace.span("rollback"):
+                    orchestrator.rollback()
+        total = time.monotonic() - started
+        print_timeline(orchestrator.results, total)
+        if orchestrator.skipped:
+            print(f"not started: {', '.join(orchestrator.skipped)}")
+        for url, stats in monitor.stats.items():
+            print(f"downtime {url}: longest {stats['longest']:.1f}s, total {stats['total']:.1f}s "
+                  f"({stats['failures']}/{stats['checks']} checks failed)")
+        print("OK: deploy finished" if ok else "ERROR: deploy failed" + ("" if args.no_rollback else ", rolled back"))
+        return 0 if ok else 1
+    except DeployError as e:
+        print(f"ERROR: {e}")
+        return 2
+    finally:
+        if args.fake:
+            stop_fake_backends(workdir)
+            for process in processes:
+                process.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Local mock of the backend /api/diag/* routes for testing ops tools offline
+
+Responses mirror the shapes returned by backend/src/routes/diagRoutes.ts.
+Any non-empty Bearer token is accepted and its value is used as the userId.
+The server speaks HTTP/1.1 keep-alive like the real Express app. A few
+non-diag routes (/api/channels/*, /api/media/*) are served with canned
+payloads so load tests have a realistic mix; --error-rate makes a share of
+requests fail with 500.
+
+/api/media/* answers Range requests (206 with Content-Range, ETag and
+If-Range) like express.static, and --media-bps caps each connection's
+send rate the way a CDN does, for testing segmented downloads.
+
+buildinfo reports startedAt as the request time unless STARTED_AT is set,
+like the real route, and a random container-id style hostname per server,
+so a new server looks like a recreated container.
+
+Usage: python3 diag_mock_server.py [--port 7777] [--delay 0.05] [--error-rate 0.01] [--media-bps 1048576]
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+MOCK_CHANNELS = [
+    {"id": "G8AXDO7PQn8nyU81nmm1", "exists": True, "name": "Main channel"},
+    {"id": "mockChannel000000002", "exists": True, "name": "Second channel"},
+]
+
+
+class DiagMockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "DiagMock/1.0"
+    # Headers and body go out as separate writes
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_bytes(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_media(self, body):
+        """Serve body honouring Range/If-Range, throttled to server.media_bps"""
+        etag = self.server.media_etag
+        start, end = 0, len(body) - 1
+        status = 200
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range", "").strip())
+        if match and self.headers.get("If-Range", etag) == etag and any(match.groups()):
+            first, last = match.groups()
+            if first:
+                start, end = int(first), min(int(last), end) if last else end
+            else:
+                start = max(0, len(body) - int(last))
+            if start > end:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(body)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+        self.send_response(status)
+        self.send_header("Content-Type", "video/mp4")
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(body)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        if self.command == "HEAD":
+            return
+        view = memoryview(body)[start:end + 1]
+        bps = self.server.media_bps
+        chunk = 65536 if not bps else max(1024, min(65536, bps // 20))
+        started = time.monotonic()
+        for offset in range(0, len(view), chunk):
+            self.wfile.write(view[offset:offset + chunk])
+            if bps:
+                ahead = (offset + chunk) / bps - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def user_id(self):
+        header = self.headers.get("Authorization", "")
+        if not header.startswith("Bearer ") or not header[7:].strip():
+            return None
+        return header[7:].strip()[:28]
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_HEAD(self):
+        if not self.path.startswith("/api/media/"):
+            self.send_response(405)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.handle_request("HEAD")
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        self.handle_request("POST")
+
+    def handle_request(self, method):
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        url = urlsplit(self.path)
+        path = url.path.rstrip("/")
+        query = parse_qs(url.query)
+        self.server.count_request(path)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            return self.send_json(500, {"error": "INTERNAL", "message": "injected mock failure"})
+        if path.startswith("/api/media/"):
+            return self.send_media(self.server.media_body)
+        if path == "/api/diag/buildinfo":
+            return self.send_json(200, self.server.buildinfo())
+
+        user_id = self.user_id()
+        if user_id is None:
+            return self.send_json(401, {"error": "UNAUTHORIZED", "message": "Missing Bearer token"})
+
+        if path == "/api/diag/whoami":
+            return self.send_json(200, {"success": True, "userId": user_id, "hasUser": True,
+                                        "userEmail": "mock@example.com"})
+        if path == "/api/diag/channels":
+            return self.send_json(200, {"success": True, "userId": user_id,
+                                        "firestorePath": f"users/{user_id}/channels",
+                                        "count": len(MOCK_CHANNELS), "channels": MOCK_CHANNELS})
+        if path.startswith("/api/diag/channel/"):
+            channel_id = path.rsplit("/", 1)[1]
+            known = {channel["id"]: channel for channel in MOCK_CHANNELS}
+            channel = known.get(channel_id)
+            return self.send_json(200, {
+                "success": True, "userId": user_id, "channelId": channel_id,
+                "firestorePath": f"users/{user_id}/channels/{channel_id}",
+                "exists": channel is not None,
+                "data": {"name": channel["name"], "hasGoogleDriveFolderId": False} if channel else None,
+            })
+        if path == "/api/diag/storage":
+            return self.send_json(200, {
+                "success": True,
+                "storage": {"root": "/app/storage", "resolvedRoot": "/app/storage", "exists": True,
+                            "writable": True, "freeSpaceBytes": None, "freeSpaceGB": None},
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            })
+        if path == "/api/diag/parse-getvideo":
+            url_param = (query.get("url") or [""])[0]
+            if not url_param:
+                return self.send_json(400, {"error": "BAD_REQUEST", "message": "URL parameter is required"})
+            return self.send_json(200, {"success": True, "url": url_param,
+                                        "videoUrl": "https://cdn.example.com/video.mp4",
+                                        "videoType": "mp4", "htmlLength": 1024})
+        if path in ("/api/channels", "/api/channels/schedule", "/api/channels/export"):
+            return self.send_json(200, {"success": True, "channels": MOCK_CHANNELS})
+        if path == "/api/diag/download" and method == "POST":
+            return self.send_json(200, {"success": True, "message": "mock download accepted"})
+        return self.send_json(404, {"error": "Not Found", "path": path})
+
+
+class DiagMockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, verbose=False, build_id=None, git_sha=None, hostname=None,
+                 error_rate=0.0, media_size=64 * 1024, media_bps=0):
+        super().__init__(address, DiagMockHandler)
+        self.delay = delay
+        self.error_rate = error_rate
+        # varied bytes so a misplaced range shows up in a checksum
+        self.media_body = random.Random(media_size).randbytes(media_size)
+        self.media_etag = '"' + hashlib.sha1(self.media_body).hexdigest()[:16] + '"'
+        self.media_bps = media_bps
+        self.verbose = verbose
+        self.build_id = build_id or os.environ.get("BUILD_ID", "mock-build")
+        self.git_sha = git_sha or os.environ.get("GIT_SHA", "unknown")
+        self.hostname = hostname or os.urandom(6).hex()
+        self.started_at = os.environ.get("STARTED_AT")
+        self.requests = {}
+        self.lock = threading.Lock()
+
+    def count_request(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def buildinfo(self):
+        return {
+            "buildId": self.build_id,
+            "gitSha": self.git_sha,
+            "image": "shortsai-backend:mock",
+            "hostname": self.hostname,
+            "version": "mock",
+            "startedAt": self.started_at or time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "nodeVersion": "v20.0.0",
+            "platform": "linux",
+            "arch": "x64",
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs):
+    """Start a mock server on a background thread, returns the server"""
+    server = DiagMockServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--delay", type=float, default=0.0, help="artificial latency per request, seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--media-size", type=int, default=64 * 1024, help="bytes returned by /api/media/*")
+    parser.add_argument("--media-bps", type=int, default=0, help="per-connection send rate for /api/media/*")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = DiagMockServer((args.host, args.port), delay=args.delay, verbose=args.verbose,
+                            error_rate=args.error_rate, media_size=args.media_size, media_bps=args.media_bps)
+    print(f"Diag mock listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,712 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Minimal, deterministic Docker build context for the backend image, with a layer cache forecast
+
+`docker-compose build backend` sends the whole backend directory to the
+daemon as build context: storage/ and tmp/ (the container's volumes, videos
+included), node_modules, the deploy notes. The Dockerfile only copies
+package*.json, tsconfig.json, src/ and public/. This tool reads the
+COPY/ADD instructions and packs just the files they use into a tar stream,
+honouring .dockerignore. The stream is byte-for-byte the same for the same
+sources: sorted entries, mtime SOURCE_DATE_EPOCH (default 0), uid/gid 0,
+modes 0644/0755. Entries are grouped by the COPY that needs them, in
+Dockerfile order, so the package*.json behind `RUN npm install` come first.
+
+Each COPY is hashed over the paths, modes and sha256 of its files, and
+every other instruction over its text. Comparing with the last packed
+build, recorded in --state, shows which step misses Docker's cache first
+and which steps it drags along:
+
+  builder  COPY package*.json ./    cached
+  builder  RUN npm install          cached
+  builder  COPY src ./src           REBUILD  2 files changed: src/routes/diag.ts, ...
+
+COPY --from=STAGE of files that came from the context (the runner's
+package*.json) is traced back to those files, assuming RUN steps leave them
+alone. So an edit in src/ does not mark the runner's npm install as
+rebuilt. Copies of build output (/app/dist) rebuild whenever their stage
+does.
+
+Commands:
+  plan    packed context size and the layer forecast
+  pack    write the tar (-o FILE, or - for stdout) and record the state
+  build   pipe the tar into `docker build -t IMAGE -` (over ssh with --host)
+          and record the state; `docker-compose up -d backend` then starts
+          the new image
+  ignore  print a .dockerignore that admits only what the Dockerfile
+          copies, so a plain docker-compose build gets the same context
+  bench   plain context (everything not in .dockerignore) against the
+          packed one: files, bytes, tar time and, with --runs, real
+          `docker build` times
+
+Examples:
+  python3 docker_context.py plan backend
+  python3 docker_context.py pack backend -o /tmp/backend.tar
+  python3 docker_context.py build /volume1/docker/shortsai/backend --docker "sudo /usr/local/bin/docker"
+  python3 docker_context.py build backend --host adminv@192.168.100.222 --docker "sudo /usr/local/bin/docker"
+  python3 docker_context.py ignore backend > backend/.dockerignore
+  python3 docker_context.py bench /volume1/docker/shortsai/backend --runs 2 --docker "sudo /usr/local/bin/docker"
+"""
+import argparse
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shlex
+import stat
+import subprocess
+import sys
+import tarfile
+import time
+
+from ops_common import format_size
+
+DEFAULT_STATE = os.path.expanduser("~/.shortsai_docker_context.json")
+# pinned by `image:` in backend/docker-compose.yml (compose v1 would name it
+# {project}_{service}, v2 {project}-{service})
+DEFAULT_IMAGE = "backend_backend"
+GLOB_CHARS = re.compile(r"[*?\[\\]")
+
+
+def clean(path):
+    """Context-relative POSIX path the way Docker normalises patterns ("" for the root)"""
+    path = posixpath.normpath(path.strip().replace(os.sep, "/")).lstrip("/")
+    return "" if path == "." else path
+
+
+def pattern_regex(pattern, double_star=True):
+    """Regex for a Go filepath.Match pattern, plus ** for .dockerignore"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "*" and double_star and pattern.startswith("**", i):
+            i += 2
+            if pattern.startswith("/", i):
+                i += 1
+                out.append("(?:.*/)?")
+            else:
+                out.append(".*")
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[" and pattern.find("]", i + 2) != -1:
+            end = pattern.find("]", i + 2)
+            out.append("[" + pattern[i + 1:end].replace("\\", "\\\\") + "]")
+            i = end
+        elif char == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return re.compile("".join(out) + r"\Z")
+
+
+def with_parents(path):
+    """path and each of its parent directories"""
+    parts = path.split("/")
+    return ["/".join(parts[:n]) for n in range(len(parts), 0, -1)]
+
+
+class DockerIgnore:
+    """.dockerignore rules: last match wins, !pattern re-includes, a match on a parent counts"""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.patterns = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            exclusion = line.startswith("!")
+            pattern = clean(line[1:] if exclusion else line)
+            if pattern:
+                self.patterns.append((pattern_regex(pattern), exclusion))
+        self.has_exclusions = any(exclusion for _, exclusion in self.patterns)
+
+    @classmethod
+    def load(cls, context):
+        try:
+            with open(os.path.join(context, ".dockerignore"), encoding="utf-8") as f:
+                return cls(f.read().splitlines())
+        except FileNotFoundError:
+            return cls([])
+
+    def ignored(self, path):
+        candidates = with_parents(path)
+        matched = False
+        for regex, exclusion in self.patterns:
+            if any(regex.match(candidate) for candidate in candidates):
+                matched = not exclusion
+        return matched
+
+    def prune(self, path):
+        """A directory that is ignored and cannot have re-included files is not walked"""
+        return not self.has_exclusions and self.ignored(path)
+
+
+class ContextFile:
+    """A file (or symlink) in the build context"""
+
+    def __init__(self, context, relative):
+        self.relative = relative
+        self.path = os.path.join(context, relative)
+        info = os.lstat(self.path)
+        self.symlink = stat.S_ISLNK(info.st_mode)
+        self.executable = bool(info.st_mode & 0o111)
+        self.size = 0 if self.symlink else info.st_size
+        self._sha256 = None
+
+    @property
+    def mode(self):
+        return 0o777 if self.symlink else (0o755 if self.executable else 0o644)
+
+    @property
+    def sha256(self):
+        if self._sha256 is None:
+            digest = hashlib.sha256()
+            if self.symlink:
+                digest.update(os.readlink(self.path).encode("utf-8"))
+            else:
+                with open(self.path, "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        digest.update(block)
+            self._sha256 = digest.hexdigest()
+        return self._sha256
+
+
+class Context:
+    """The build context directory with its .dockerignore, files cached by path"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.ignore = DockerIgnore.load(self.root)
+        self.files = {}
+
+    def file(self, relative):
+        if relative not in self.files:
+            self.files[relative] = ContextFile(self.root, relative)
+        return self.files[relative]
+
+    def walk(self, start=""):
+        """Files under start (a context-relative file or directory) that .dockerignore admits"""
+        full = os.path.join(self.root, start)
+        if not os.path.isdir(full) or os.path.islink(full):
+            return [self.file(start)] if os.path.lexists(full) and not self.ignore.ignored(start) else []
+        found = []
+        for dirpath, dirnames, filenames in os.walk(full):
+            relative_dir = clean(os.path.relpath(dirpath, self.root))
+            dirnames[:] = sorted(d for d in dirnames
+                                 if not self.ignore.prune(posixpath.join(relative_dir, d)))
+            for name in sorted(filenames + [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]):
+                relative = posixpath.join(relative_dir, name)
+                if not self.ignore.ignored(relative):
+                    found.append(self.file(relative))
+        return found
+
+    def expand(self, source):
+        """Context paths a COPY source matches (globs per path component, no **)"""
+        matches = [""]
+        for component in clean(source).split("/") if clean(source) else []:
+            if not GLOB_CHARS.search(component):
+                matches = [posixpath.join(m, component) for m in matches
+                           if os.path.lexists(os.path.join(self.root, m, component))]
+                continue
+            regex = pattern_regex(component, double_star=False)
+            expanded = []
+            for match in matches:
+                try:
+                    names = sorted(os.listdir(os.path.join(self.root, match)))
+                except (NotADirectoryError, FileNotFoundError):
+                    continue
+                expanded.extend(posixpath.join(match, name) for name in names if regex.match(name))
+            matches = expanded
+        return [match for match in matches if not match or not self.ignore.ignored(match)]
+
+
+class Step:
+    """One Dockerfile instruction and, for COPY/ADD, the files it brings in"""
+
+    def __init__(self, stage, index, keyword, text, workdir):
+        self.stage = stage
+        self.index = index
+        self.keyword = keyword
+        self.text = text
+        self.workdir = workdir
+        self.flags = {}
+        self.sources = []
+        self.dest = None
+        self.files = {}
+        self.from_stage = None
+        self.hash = None
+
+    @property
+    def label(self):
+        return f"{self.keyword} {self.text.split(None, 1)[1] if ' ' in self.text else ''}".strip()
+
+
+class Stage:
+    def __init__(self, index, base, name):
+        self.index = index
+        self.base = base
+        self.name = name or str(index)
+        self.steps = []
+        self.image = {}
+        self.chain = None
+
+
+def read_instructions(path):
+    """Instructions with line continuations joined and comments dropped"""
+    instructions = []
+    buffer = ""
+    with open(path, encoding="utf-8") as f:
+        for raw in f.read().splitlines():
+            line = raw.strip()
+            if line.startswith("#") or (not buffer and not line):
+                continue
+            if line.endswith("\\"):
+                buffer += line[:-1].rstrip() + " "
+                continue
+            buffer += line
+            if buffer.strip():
+                instructions.append(buffer.strip())
+            buffer = ""
+    if buffer.strip():
+        instructions.append(buffer.strip())
+    return instructions
+
+
+def split_copy(arguments):
+    """(flags, sources, dest) of COPY/ADD arguments, JSON array form included"""
+    match = re.match(r"((?:--\S+\s+)*)(.*)", arguments, re.S)
+    flags = {}
+    for flag in match.group(1).split():
+        key, _, value = flag[2:].partition("=")
+        flags[key] = value
+    body = match.group(2).strip()
+    parts = json.loads(body) if body.startswith("[") else body.split()
+    return flags, parts[:-1], parts[-1] if parts else ""
+
+
+def image_path(workdir, dest, relative_in_source, into_directory):
+    """Where a copied file lands in the image"""
+    target = dest if dest.startswith("/") else posixpath.join(workdir, dest)
+    if into_directory or relative_in_source:
+        target = posixpath.join(target, relative_in_source)
+    return posixpath.normpath(target)
+
+
+def parse_dockerfile(context, dockerfile):
+    """Stages with their steps; COPY steps resolved against the context"""
+    stages = []
+    by_name = {}
+    for text in read_instructions(dockerfile):
+        keyword, _, arguments = text.partition(" ")
+        keyword = keyword.upper()
+        arguments = arguments.strip()
+        if keyword == "FROM":
+            words = arguments.split()
+            name = words[2] if len(words) >= 3 and words[1].upper() == "AS" else None
+            stage = Stage(len(stages), words[0] if words else "", name)
+            stages.append(stage)
+            by_name[stage.name] = by_name[str(stage.index)] = stage
+            workdir = by_name[stage.base].steps[-1].workdir if stage.base in by_name and by_name[stage.base].steps else "/"
+            stage.image = dict(by_name[stage.base].image) if stage.base in by_name else {}
+            stage.steps.append(Step(stage, 0, keyword, text, workdir))
+            continue
+        if not stages:
+            continue
+        stage = stages[-1]
+        workdir = stage.steps[-1].workdir
+        if keyword == "WORKDIR":
+            workdir = posixpath.normpath(posixpath.join(workdir, arguments))
+        step = Step(stage, len(stage.steps), keyword, text, workdir)
+        stage.steps.append(step)
+        if keyword not in ("COPY", "ADD"):
+            continue
+        step.flags, step.sources, step.dest = split_copy(arguments)
+        if "from" in step.flags:
+            step.from_stage = by_name.get(step.flags["from"])
+            continue
+        matched = []
+        for source in step.sources:
+            if re.match(r"[a-z]+://", source):
+                continue
+            matched.extend(context.expand(source))
+        into_directory = step.dest.endswith("/") or step.dest in (".", "./") or len(matched) > 1
+        for match in matched:
+            for file in context.walk(match):
+                inside = posixpath.relpath(file.relative, match) if file.relative != match else ""
+                if not inside:
+                    inside = posixpath.basename(file.relative) if into_directory else ""
+                target = image_path(workdir, step.dest, inside, into_directory)
+                step.files[file.relative] = file
+                stage.image[target] = file
+    return stages
+
+
+def hash_items(items):
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(item.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def compute_hashes(stages):
+    """Fill in step.hash (instruction plus content) and stage.chain"""
+    for stage in stages:
+        chain = []
+        for step in stage.steps:
+            items = [step.text]
+            if step.keyword == "FROM" and step.stage.base in {s.name for s in stages[:stage.index]}:
+                items.append(next(s.chain for s in stages if s.name == step.stage.base))
+            elif step.from_stage is not None:
+                copied = traced_files(step)
+                if copied is None:
+                    items.append(step.from_stage.chain)
+                else:
+                    step.files = copied
+                    items += [f"{path}:{file.mode:o}:{file.sha256}" for path, file in sorted(copied.items())]
+            elif step.files:
+                items += [f"{path}:{file.mode:o}:{file.sha256}" for path, file in sorted(step.files.items())]
+            step.hash = hash_items(items)
+            chain.append(step.hash)
+        stage.chain = hash_items(chain)
+
+
+def traced_files(step):
+    """{image path: ContextFile} a COPY --from takes from context files, None for build output"""
+    copied = {}
+    for source in step.sources:
+        regex = pattern_regex(posixpath.normpath(posixpath.join("/", source)), double_star=False)
+        found = {path: file for path, file in step.from_stage.image.items()
+                 if any(regex.match(candidate) for candidate in ["/" + p for p in with_parents(path.lstrip("/"))])}
+        if not found:
+            return None
+        copied.update(found)
+    return copied
+
+
+def forecast(stages, previous):
+    """[(step, status, reason)] where status is cached, REBUILD or new"""
+    before = {(entry["stage"], entry["index"]): entry for entry in (previous or {}).get("steps", [])}
+    rebuilt = {}
+    results = []
+    for stage in stages:
+        broken = f"stage {stage.base} rebuilt" if rebuilt.get(stage.base) else None
+        for step in stage.steps:
+            entry = before.get((stage.index, step.index))
+            if previous is None:
+                results.append((step, "new", "no previous build recorded"))
+                continue
+            if broken and step.keyword != "FROM":
+                results.append((step, "REBUILD", f"after {broken}"))
+                continue
+            if entry is None or entry["text"] != step.text:
+                reason = "new instruction" if entry is None else "instruction changed"
+            elif entry["hash"] != step.hash:
+                reason = changed_files(entry.get("files", {}), step.files) or (
+                    f"stage {step.from_stage.name} rebuilt" if step.from_stage else "base stage rebuilt")
+            else:
+                results.append((step, "cached", ""))
+                continue
+            results.append((step, "REBUILD", reason))
+            broken = broken or f"{stage.name} {step.label}"
+        rebuilt[stage.name] = broken is not None
+    return results
+
+
+def changed_files(before, files, limit=3):
+    current = {path: file.sha256 for path, file in files.items()}
+    changed = sorted(path for path in current if before.get(path) != current[path])
+    removed = sorted(path for path in before if path not in current)
+    if not changed and not removed:
+        return ""
+    parts = []
+    if changed:
+        parts.append(f"{len(changed)} changed: {', '.join(changed[:limit])}{', ...' if len(changed) > limit else ''}")
+    if removed:
+        parts.append(f"{len(removed)} removed: {', '.join(removed[:limit])}{', ...' if len(removed) > limit else ''}")
+    return "; ".join(parts)
+
+
+def packed_files(context, dockerfile, stages):
+    """Context files in tar order: the Dockerfile, then each COPY's files in Dockerfile order"""
+    ordered = {}
+    for relative in (clean(os.path.relpath(dockerfile, context.root)), ".dockerignore"):
+        if os.path.exists(os.path.join(context.root, relative)):
+            ordered[relative] = context.file(relative)
+    for stage in stages:
+        for step in stage.steps:
+            if step.from_stage is None:
+                for path in sorted(step.files):
+                    ordered.setdefault(path, step.files[path])
+    return list(ordered.values())
+
+
+def plain_files(context):
+    """What `docker build DIR` sends: everything .dockerignore admits"""
+    return context.walk("")
+
+
+def write_tar(fileobj, files, epoch):
+    """Deterministic tar stream of files (parent directories included)"""
+    added = set()
+    with tarfile.open(fileobj=fileobj, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+        for file in files:
+            for directory in reversed(with_parents(file.relative)[1:]):
+                if directory not in added:
+                    added.add(directory)
+                    tar.addfile(tar_info(directory, tarfile.DIRTYPE, 0o755, epoch))
+            if file.symlink:
+                info = tar_info(file.relative, tarfile.SYMTYPE, file.mode, epoch)
+                info.linkname = os.readlink(file.path)
+                tar.addfile(info)
+                continue
+            with open(file.path, "rb") as f:
+                info = tar_info(file.relative, tarfile.REGTYPE, file.mode, epoch)
+                info.size = os.fstat(f.fileno()).st_size
+                tar.addfile(info, f)
+
+
+def tar_info(name, kind, mode, epoch):
+    info = tarfile.TarInfo(name)
+    info.type = kind
+    info.mode = mode
+    info.mtime = epoch
+    info.uid = info.gid = 0
+    info.uname = info.gname = ""
+    return info
+
+
+class CountingSink:
+    """Write target that only counts bytes (for sizes and benchmarks)"""
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data)
+        return len(data)
+
+
+def load_state(path, key):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get(key)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_state(path, key, stages):
+    try:
+        with open(path, encoding="utf-8") as f:
+            states = json.load(f)
+    except (FileNotFoundError, ValueError):
+        states = {}
+    steps = []
+    for stage in stages:
+        for step in stage.steps:
+            entry = {"stage": stage.index, "index": step.index, "text": step.text, "hash": step.hash}
+            if step.files:
+                entry["files"] = {path: file.sha256 for path, file in step.files.items()}
+            steps.append(entry)
+    states[key] = {"saved": time.strftime("%Y-%m-%dT%H:%M:%S"), "steps": steps}
+    temp = path + ".tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(states, f, indent=1)
+    os.replace(temp, path)
+
+
+def print_forecast(results, out):
+    width = max(len(step.stage.name) for step, _, _ in results)
+    first = next(((step, reason) for step, status, reason in results if status == "REBUILD"), None)
+    for step, status, reason in results:
+        label = step.label if len(step.label) <= 48 else step.label[:45] + "..."
+        print(f"{step.stage.name:<{width}}  {label:<48} {status:<7} {reason}".rstrip(), file=out)
+    if results and results[0][1] == "new":
+        print("\nno previous build recorded, pack or build once to start forecasting", file=out)
+    elif first:
+        print(f"\nfirst cache miss: {first[0].stage.name} {first[0].label} ({first[1]})", file=out)
+    else:
+        print("\nevery step cached", file=out)
+
+
+def docker_build_command(args, stdin_context):
+    command = shlex.split(args.docker) + ["build", "-t", args.image]
+    for build_arg in args.build_arg or []:
+        command += ["--build-arg", build_arg]
+    if stdin_context:
+        command += ["-f", args.dockerfile_relative, "-"]
+    else:
+        command += ["-f", args.dockerfile, args.context]
+    if getattr(args, "host", None):
+        return ["ssh", args.host, shlex.join(command)]
+    return command
+
+
+def run_build(args, files, epoch):
+    """Stream the tar into docker build, returns (exit code, seconds, bytes)"""
+    started = time.monotonic()
+    process = subprocess.Popen(docker_build_command(args, True), stdin=subprocess.PIPE)
+    sink = CountingWriter(process.stdin)
+    try:
+        write_tar(sink, files, epoch)
+        process.stdin.close()
+    except BrokenPipeError:
+        pass
+    return process.wait(), time.monotonic() - started, sink.bytes
+
+
+class CountingWriter:
+    def __init__(self, target):
+        self.target = target
+        self.bytes = 0
+
+    def write(self, data):
+        self.target.write(data)
+        self.bytes += len(data)
+        return len(data)
+
+
+def bench(args, context, stages, epoch):
+    """Plain against packed context: size and tar time, optionally real docker builds"""
+    rows = []
+    for title, collect in (("plain", lambda: plain_files(Context(context.root))),
+                           ("packed", lambda: packed_files(context, args.dockerfile, stages))):
+        started = time.monotonic()
+        files = collect()
+        sink = CountingSink()
+        write_tar(sink, files, epoch)
+        rows.append((title, len(files), sink.bytes, time.monotonic() - started))
+    print(f"{'context':<8} {'files':>8} {'tar bytes':>12} {'tar time':>9}")
+    for title, count, size, seconds in rows:
+        print(f"{title:<8} {count:>8} {format_size(size):>12} {seconds:>8.2f}s")
+    plain, packed = rows
+    print(f"packed context is {packed[2] / max(plain[2], 1):.1%} of the plain one "
+          f"({format_size(plain[2] - packed[2])} less to send)")
+    if not args.runs:
+        return 0
+    timings = {"plain": [], "packed": []}
+    for run in range(args.runs):
+        for title in ("plain", "packed"):
+            started = time.monotonic()
+            if title == "plain":
+                code = subprocess.run(docker_build_command(args, False)).returncode
+            else:
+                code = run_build(args, packed_files(context, args.dockerfile, stages), epoch)[0]
+            seconds = time.monotonic() - started
+            if code != 0:
+                print(f"ERROR: {title} docker build exited with {code}")
+                return 1
+            timings[title].append(seconds)
+            print(f"run {run + 1} {title}: docker build {seconds:.1f}s", flush=True)
+    for title, values in timings.items():
+        values.sort()
+        print(f"{title:<8} docker build median {values[len(values) // 2]:.1f}s, min {values[0]:.1f}s")
+    return 0
+
+
+def ignore_file(context, dockerfile, stages):
+    """.dockerignore text admitting only what the Dockerfile copies"""
+    lines = ["# generated by docker_context.py ignore: everything but what the Dockerfile copies", "*"]
+    lines.append("!" + clean(os.path.relpath(dockerfile, context.root)))
+    for stage in stages:
+        for step in stage.steps:
+            if step.keyword in ("COPY", "ADD") and step.from_stage is None and "from" not in step.flags:
+                lines.extend("!" + clean(source) for source in step.sources if clean(source))
+    # the old rules still apply inside what is let through (later lines win)
+    lines.extend(line.strip() for line in context.ignore.lines if line.strip() and not line.startswith("#"))
+    return "\n".join(dict.fromkeys(lines)) + "\n"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    commands = {
+        "plan": sub.add_parser("plan", help="packed context size and which layers will rebuild"),
+        "pack": sub.add_parser("pack", help="write the packed context as a tar"),
+        "build": sub.add_parser("build", help="docker build from the packed context"),
+        "ignore": sub.add_parser("ignore", help="print an allow-list .dockerignore"),
+        "bench": sub.add_parser("bench", help="compare the plain and the packed context"),
+    }
+    for name, command in commands.items():
+        command.add_argument("context", nargs="?", default="backend", help="build context directory (default: %(default)s)")
+        command.add_argument("-f", "--file", help="Dockerfile (default: CONTEXT/Dockerfile)")
+        command.add_argument("--state", default=DEFAULT_STATE, help="last packed build per context (default: %(default)s)")
+        if name in ("build", "bench"):
+            command.add_argument("--docker", default="docker", help="docker command (default: %(default)s)")
+            command.add_argument("--image", default=DEFAULT_IMAGE, help="image tag (default: %(default)s)")
+            command.add_argument("--build-arg", action="append", metavar="NAME=VALUE")
+    commands["pack"].add_argument("-o", "--output", required=True, help="tar file, - for stdout")
+    commands["pack"].add_argument("--no-save", action="store_true", help="do not record this context as built")
+    commands["build"].add_argument("--host", help="run docker build over ssh on this host")
+    commands["bench"].add_argument("--runs", type=int, default=0,
+                                   help="also time N docker builds of each context (default: sizes only)")
+    args = parser.parse_args(argv)
+    args.context = os.path.abspath(args.context)
+    args.dockerfile = os.path.abspath(args.file or os.path.join(args.context, "Dockerfile"))
+    args.dockerfile_relative = clean(os.path.relpath(args.dockerfile, args.context))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isfile(args.dockerfile):
+        print(f"ERROR: no Dockerfile at {args.dockerfile}")
+        return 2
+    if args.dockerfile_relative.startswith(".."):
+        print(f"ERROR: {args.dockerfile} is outside the context {args.context}")
+        return 2
+    epoch = int(os.environ.get("SOURCE_DATE_EPOCH", "0"))
+    context = Context(args.context)
+    stages = parse_dockerfile(context, args.dockerfile)
+    compute_hashes(stages)
+    key = f"{args.context}:{args.dockerfile_relative}"
+    files = packed_files(context, args.dockerfile, stages)
+    # progress goes to stderr when the tar itself goes to stdout
+    out = sys.stderr if args.command == "pack" and args.output == "-" else sys.stdout
+
+    if args.command == "ignore":
+        sys.stdout.write(ignore_file(context, args.dockerfile, stages))
+        return 0
+    if args.command == "bench":
+        return bench(args, context, stages, epoch)
+
+    previous = load_state(args.state, key)
+    results = forecast(stages, previous)
+    print(f"packed context: {len(files)} files, {format_size(sum(file.size for file in files))}", file=out)
+    print_forecast(results, out)
+    if args.command == "plan":
+        return 0
+
+    if args.command == "pack":
+        if args.output == "-":
+            write_tar(sys.stdout.buffer, files, epoch)
+            sys.stdout.buffer.flush()
+        else:
+            temp = args.output + ".tmp"
+            with open(temp, "wb") as f:
+                write_tar(f, files, epoch)
+            os.replace(temp, args.output)
+            print(f"OK: {args.output} ({format_size(os.path.getsize(args.output))})", file=out)
+        if not args.no_save:
+            save_state(args.state, key, stages)
+        return 0
+
+    code, seconds, sent = run_build(args, files, epoch)
+    if code != 0:
+        print(f"ERROR: docker build exited with {code} after {seconds:.1f}s")
+        return 1
+    save_state(args.state, key, stages)
+    print(f"OK: {args.image} built from {format_size(sent)} of context in {seconds:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
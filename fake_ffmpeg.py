@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stand-in for ffmpeg when testing ops tools offline
+
+Burns CPU in proportion to the input size (FAKE_FFMPEG_BPS bytes of input
+per CPU second), then copies the first input to the output path (the last
+argument), so callers see the same timing shape as a transcode: CPU bound,
+slower under nice, faster with more cores. Inputs named "*corrupt*" fail
+like ffmpeg does on invalid data. -t SECONDS cuts the copy at the same
+bytes-per-second of media fake_ffprobe.py assumes (FAKE_FFPROBE_BPS).
+
+Usage: inbox_worker.py ROOT --ffmpeg "python3 fake_ffmpeg.py"
+"""
+import hashlib
+import os
+import shutil
+import sys
+import time
+
+
+def main(argv):
+    args = argv[1:]
+    inputs = [args[i + 1] for i, arg in enumerate(args[:-1]) if arg == "-i"]
+    output = args[-1]
+    if not inputs or output in inputs:
+        print("At least one output file must be specified", file=sys.stderr)
+        return 1
+    source = inputs[0]
+    if "corrupt" in os.path.basename(source):
+        print(f"{source}: Invalid data found when processing input", file=sys.stderr)
+        return 1
+    try:
+        size = os.path.getsize(source)
+    except OSError as e:
+        print(f"{source}: {e.strerror}", file=sys.stderr)
+        return 1
+
+    bps = float(os.environ.get("FAKE_FFMPEG_BPS", "20000000"))
+    limit = size
+    if "-t" in args:
+        media_bps = float(os.environ.get("FAKE_FFPROBE_BPS", "250000"))
+        limit = min(size, int(float(args[args.index("-t") + 1]) * media_bps))
+    budget = time.process_time() + limit / bps
+    block = b"\0" * 65536
+    digest = hashlib.sha256()
+    while time.process_time() < budget:
+        digest.update(block)
+
+    with open(source, "rb") as fin, open(output, "wb") as fout:
+        if limit == size:
+            shutil.copyfileobj(fin, fout, 1024 * 1024)
+        else:
+            fout.write(fin.read(limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
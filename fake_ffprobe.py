@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Stand-in for `ffprobe ... -of json FILE` when testing ops tools offline
+
+Prints the same JSON shape as ffprobe with format/stream entries derived
+deterministically from the file: duration from the size (FAKE_FFPROBE_BPS
+bytes per second), 1080x1920 h264 + aac for video extensions, mp3 audio
+only for audio ones. Empty files and names containing "corrupt" fail like
+ffprobe does on invalid data. FAKE_FFPROBE_DELAY adds per-call latency.
+
+Usage: media_probe.py scan ROOT --ffprobe "python3 fake_ffprobe.py"
+"""
+import json
+import os
+import sys
+import time
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".wav")
+
+
+def main(argv):
+    path = argv[-1]
+    delay = float(os.environ.get("FAKE_FFPROBE_DELAY", "0"))
+    if delay:
+        time.sleep(delay)
+    try:
+        size = os.path.getsize(path)
+    except OSError as e:
+        print(f"{path}: {e.strerror}", file=sys.stderr)
+        return 1
+    if size == 0 or "corrupt" in os.path.basename(path):
+        print(f"{path}: Invalid data found when processing input", file=sys.stderr)
+        return 1
+
+    duration = size / float(os.environ.get("FAKE_FFPROBE_BPS", "250000"))
+    bit_rate = str(int(size * 8 / duration))
+    streams = []
+    if not path.lower().endswith(AUDIO_EXTENSIONS):
+        streams.append({"index": 0, "codec_name": "h264", "codec_type": "video", "width": 1080,
+                        "height": 1920, "r_frame_rate": "30/1", "duration": f"{duration:.6f}"})
+        streams.append({"index": 1, "codec_name": "aac", "codec_type": "audio", "duration": f"{duration:.6f}",
+                        "bit_rate": "128000"})
+    else:
+        streams.append({"index": 0, "codec_name": "mp3", "codec_type": "audio", "duration": f"{duration:.6f}",
+                        "bit_rate": bit_rate})
+    print(json.dumps({"streams": streams,
+                      "format": {"duration": f"{duration:.6f}", "bit_rate": bit_rate, "size": str(size)}},
+                     indent=4))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Loopback stand-in for ssh when testing the uploaders offline
+
+Accepts the ssh command lines the upload scripts build (options, one
+destination, the remote command) and runs the command locally through
+/bin/sh -c, the way sshd hands it to the login shell, so the remote side
+hits the same execve limits a real NAS would (128 KB per argument,
+ARG_MAX in total). stdin, stdout and stderr are relayed through pipes and
+counted:
+
+  FAKE_SSH_LOG      append one JSON line per connection: command, stdin,
+                    stdout and stderr bytes, connect and total seconds
+  FAKE_SSH_CONNECT  seconds a new connection takes (key exchange and auth,
+                    default 0.1); a live ControlPath master skips it
+  FAKE_SSH_BPS      cap on stdin bytes per second (default: unlimited)
+
+-t prints ssh's "Pseudo-terminal will not be allocated" warning when stdin
+is not a terminal, like the real client.
+
+Usage: put a wrapper named "ssh" first on PATH, as bench_transfer.py does:
+  printf '#!/bin/sh\nexec python3 %s "$@"\n' $PWD/fake_ssh.py > BIN/ssh && chmod +x BIN/ssh
+  PATH=BIN:$PATH python3 upload_to_synology.py
+"""
+import errno
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+# options that take an argument (from ssh(1))
+ARG_OPTIONS = set("BbcDEeFIiJLlmOoPpQRSWw")
+
+
+def parse_command_line(args):
+    """Split ssh arguments into (options dict, destination, remote command)"""
+    options = {"flags": set(), "o": []}
+    index = 0
+    while index < len(args) and args[index].startswith("-") and args[index] != "--":
+        arg = args[index]
+        position = 1
+        while position < len(arg):
+            letter = arg[position]
+            if letter in ARG_OPTIONS:
+                value = arg[position + 1:] or (args[index + 1] if index + 1 < len(args) else "")
+                if not arg[position + 1:]:
+                    index += 1
+                if letter == "o":
+                    options["o"].append(value)
+                else:
+                    options[letter] = value
+                break
+            options["flags"].add(letter)
+            position += 1
+        index += 1
+    if index < len(args) and args[index] == "--":
+        index += 1
+    if index >= len(args):
+        return options, None, ""
+    return options, args[index], " ".join(args[index + 1:])
+
+
+def control_marker(options, destination):
+    """Path standing in for the ControlMaster socket, or None without multiplexing"""
+    settings = dict(option.split("=", 1) for option in options["o"] if "=" in option)
+    if settings.get("ControlMaster", "no") == "no" or "ControlPath" not in settings:
+        return None, 0
+    digest = hashlib.sha1(destination.encode("utf-8")).hexdigest()
+    persist = settings.get("ControlPersist", "0")
+    persist = 0 if persist in ("no", "0") else (1e9 if persist == "yes" else float(persist.rstrip("s")))
+    return settings["ControlPath"].replace("%C", digest) + ".fake", persist
+
+
+def pump(source, sink, counter, key, bps=0):
+    """Copy source fd to sink fd until EOF, counting bytes (and throttling)"""
+    started = time.monotonic()
+    try:
+        while True:
+            data = os.read(source, 65536)
+            if not data:
+                break
+            counter[key] += len(data)
+            if bps:
+                ahead = counter[key] / bps - (time.monotonic() - started)
+                if ahead > 0:
+                    time.sleep(ahead)
+            view = memoryview(data)
+            while view:
+                written = os.write(sink, view)
+                view = view[written:]
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        if key == "stdin":
+            try:
+                os.close(sink)
+            except OSError:
+                pass
+
+
+def main(argv):
+    options, destination, command = parse_command_line(argv[1:])
+    if destination is None:
+        print("usage: ssh [options] destination [command]", file=sys.stderr)
+        return 255
+    if not command:
+        print("fake_ssh: interactive sessions are not supported", file=sys.stderr)
+        return 255
+    if "t" in options["flags"] and not os.isatty(0):
+        print("Pseudo-terminal will not be allocated because stdin is not a terminal.", file=sys.stderr)
+
+    started = time.monotonic()
+    marker, persist = control_marker(options, destination)
+    connect = 0.0
+    if marker is None or not os.path.exists(marker) or time.time() - os.path.getmtime(marker) > persist:
+        connect = float(os.environ.get("FAKE_SSH_CONNECT", "0.1"))
+        time.sleep(connect)
+    if marker is not None:
+        with open(marker, "a"):
+            os.utime(marker)
+
+    counter = {"stdin": 0, "stdout": 0, "stderr": 0}
+    pipes = [os.pipe() for _ in range(3)]
+    try:
+        pid = os.fork()
+    except OSError as e:
+        print(f"fake_ssh: fork: {e.strerror}", file=sys.stderr)
+        return 255
+    if pid == 0:
+        os.dup2(pipes[0][0], 0)
+        os.dup2(pipes[1][1], 1)
+        os.dup2(pipes[2][1], 2)
+        for read_fd, write_fd in pipes:
+            os.close(read_fd)
+            os.close(write_fd)
+        try:
+            os.execv("/bin/sh", ["sh", "-c", command])
+        except OSError as e:
+            # what sshd's child prints when the shell cannot be started
+            message = "Argument list too long" if e.errno == errno.E2BIG else e.strerror
+            os.write(2, f"sh: {message}\n".encode("utf-8"))
+            os._exit(126 if e.errno != errno.E2BIG else 1)
+    os.close(pipes[0][0])
+    os.close(pipes[1][1])
+    os.close(pipes[2][1])
+    threads = [
+        threading.Thread(target=pump, args=(0, pipes[0][1], counter, "stdin",
+                                            float(os.environ.get("FAKE_SSH_BPS", "0"))), daemon=True),
+        threading.Thread(target=pump, args=(pipes[1][0], 1, counter, "stdout")),
+        threading.Thread(target=pump, args=(pipes[2][0], 2, counter, "stderr")),
+    ]
+    for thread in threads:
+        thread.start()
+    _, status = os.waitpid(pid, 0)
+    for thread in threads[1:]:
+        thread.join()
+    code = os.waitstatus_to_exitcode(status)
+
+    if marker is not None:
+        os.utime(marker)
+    log = os.environ.get("FAKE_SSH_LOG")
+    if log:
+        entry = {"destination": destination, "command": len(command.encode("utf-8")), **counter,
+                 "connect": round(connect, 3), "seconds": round(time.monotonic() - started, 3), "exit": code}
+        fd = os.open(log, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (json.dumps(entry) + "\n").encode("utf-8"))
+        finally:
+            os.close(fd)
+    return code if code >= 0 else 255
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
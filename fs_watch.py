@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Recursive directory watcher: inotify where available, polling otherwise
+
+Watcher(root).wait(timeout) blocks until something changes under root and
+returns a batch of (event, path) pairs, event being "write" (a file was
+closed after writing or moved in, i.e. it is complete) or "delete" (removed
+or moved away). Both backends report the same events:
+
+  inotify  one watch per directory through ctypes (no extra packages);
+           new directories are watched as they appear and files already
+           in them are reported. A queue overflow falls back to a rescan.
+  poll     re-lists only directories whose mtime changed (see
+           storage_index.scan_dir) and reports a new or changed file once
+           its size and mtime stayed the same for one interval, so a file
+           still being written is not picked up half done. Files rewritten
+           in place do not change their directory's mtime and are missed,
+           unless rewrites=True, which re-lists every directory each poll
+           (fine for a source tree, too slow for the storage root).
+
+Dot-files are ignored (editors' swap files and the temp files of atomic
+writers); pass accept= to filter further.
+
+Usage: python3 fs_watch.py DIR [--poll] [--interval 1.0]   (prints events)
+"""
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+import time
+
+from storage_index import scan_dir
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def visible(name):
+    return not name.startswith(".")
+
+
+def walk_files(root, accept=None):
+    """Every visible file under root, honouring accept(path)"""
+    files = []
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+        for entry in entries:
+            if not visible(entry.name):
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and (accept is None or accept(entry.path)):
+                files.append(entry.path)
+    return files
+
+
+class InotifyWatcher:
+    backend = "inotify"
+
+    def __init__(self, root, accept=None):
+        self.root = root
+        self.accept = accept
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        try:
+            self.add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def add_tree(self, top):
+        """Watch top and every directory below it, returns files already there"""
+        files = []
+        stack = [top]
+        while stack:
+            directory = stack.pop()
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                code = ctypes.get_errno()
+                if code in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                # ENOSPC: fs.inotify.max_user_watches is exhausted
+                raise OSError(code, f"inotify_add_watch {directory}: {os.strerror(code)}")
+            self.dirs[wd] = directory
+            try:
+                entries = list(os.scandir(directory))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            for entry in entries:
+                if not visible(entry.name):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append(entry.path)
+        return files
+
+    def read_events(self):
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def wait(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        batch = []
+        for wd, mask, name in self.read_events():
+            if mask & IN_Q_OVERFLOW:
+                batch.extend(("write", path) for path in self.add_tree(self.root))
+                continue
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or not name or not visible(name):
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    batch.extend(("write", file) for file in self.add_tree(path))
+                elif mask & IN_MOVED_FROM:
+                    batch.append(("delete", path))
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                batch.append(("write", path))
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                batch.append(("delete", path))
+        return self.filter(batch)
+
+    def filter(self, batch):
+        seen, result = set(), []
+        for event, path in batch:
+            if (event, path) in seen or (event == "write" and self.accept and not self.accept(path)):
+                continue
+            seen.add((event, path))
+            result.append((event, path))
+        return result
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollWatcher:
+    backend = "poll"
+
+    def __init__(self, root, accept=None, interval=1.0, rewrites=False):
+        self.root = root
+        self.accept = accept
+        self.interval = interval
+        self.rewrites = rewrites
+        self.dirs = {}
+        self.children = {}
+        self.listing = {}
+        self.unsettled = {}
+        self.next_poll = time.monotonic() + interval
+        self.rescan(report=False)
+
+    def rescan(self, report=True):
+        """Re-list changed directories; returns delete events and marks new files unsettled"""
+        deleted = []
+        listed = set()
+        stack = [self.root]
+        while stack:
+            directory = stack.pop()
+            mtime, files, subdirs = scan_dir(directory, None if self.rewrites else self.dirs.get(directory))
+            if mtime is None:
+                continue
+            listed.add(directory)
+            self.dirs[directory] = mtime
+            if files is not None:
+                before = self.listing.get(directory, {})
+                present = {os.path.join(directory, name): (size, file_mtime)
+                           for name, size, file_mtime in files if visible(name)}
+                for path in before.keys() - present.keys():
+                    self.unsettled.pop(path, None)
+                    deleted.append(("delete", path))
+                if report:
+                    for path, signature in present.items():
+                        if before.get(path) != signature:
+                            self.unsettled[path] = signature
+                self.listing[directory] = present
+                self.children[directory] = [os.path.join(directory, name) for name in subdirs if visible(name)]
+            stack.extend(self.children.get(directory, ()))
+        for directory in [path for path in self.dirs if path not in listed]:
+            del self.dirs[directory]
+            self.children.pop(directory, None)
+            for path in self.listing.pop(directory, {}):
+                self.unsettled.pop(path, None)
+                deleted.append(("delete", path))
+        return deleted
+
+    def wait(self, timeout=None):
+        delay = self.next_poll - time.monotonic()
+        if timeout is not None and delay > timeout:
+            time.sleep(max(timeout, 0))
+            return []
+        time.sleep(max(delay, 0))
+        self.next_poll = time.monotonic() + self.interval
+        settled = []
+        for path, seen in list(self.unsettled.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.unsettled[path]
+                continue
+            current = (stat.st_size, stat.st_mtime_ns)
+            if current == seen:
+                del self.unsettled[path]
+                if self.accept is None or self.accept(path):
+                    settled.append(("write", path))
+            else:
+                self.unsettled[path] = current
+        # files found now are reported on the next poll, once they have settled
+        return settled + self.rescan()
+
+    def close(self):
+        pass
+
+
+def Watcher(root, backend="auto", interval=1.0, accept=None, rewrites=False):
+    """InotifyWatcher if possible (backend "auto" or "inotify"), else PollWatcher"""
+    if backend in ("auto", "inotify"):
+        try:
+            return InotifyWatcher(root, accept)
+        except (OSError, AttributeError) as e:
+            if backend == "inotify":
+                raise
+            print(f"WARNING: inotify unavailable ({e}), polling every {interval}s", file=sys.stderr)
+    return PollWatcher(root, accept, interval, rewrites)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="directory to watch recursively")
+    parser.add_argument("--poll", action="store_true", help="force the polling backend")
+    parser.add_argument("--interval", type=float, default=1.0, help="poll interval in seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    watcher = Watcher(args.root, "poll" if args.poll else "auto", args.interval)
+    print(f"watching {args.root} ({watcher.backend})", flush=True)
+    try:
+        while True:
+            for event, path in watcher.wait():
+                print(f"{time.strftime('%H:%M:%S')} {event} {path}", flush=True)
+    except KeyboardInterrupt:
+        return 0
+    finally:
+        watcher.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
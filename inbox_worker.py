@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Batch ffmpeg preprocessing of channel inbox videos outside the backend container
+
+The backend runs ffmpeg inline (trimAudio, loopAndTrimAudio, concatSegments,
+overlayAudio in backend/src/utils/ffmpegUtils.ts), competing with API
+requests for the same CPUs. This worker watches every channel inbox under
+the storage root (fs_watch: inotify, polling fallback), queues one job per
+new video and profile, and runs them as separate ffmpeg processes:
+
+  normalize  1080x1920 30fps H.264/AAC, loudness-normalised, faststart
+  faststart  remux with the moov atom up front (-c copy)
+  trim       cut to --trim-seconds (-c copy, as trimAudio does)
+
+At most -j jobs run at once; the default is half the CPUs the container may
+use (cgroup quota or affinity), and each ffmpeg gets CPUs / jobs threads.
+Jobs run under nice (and ionice when available) so API traffic wins when
+the box is busy. Results go to the channel's processed/ directory, next to
+inbox/, as {videoId}.{profile}.mp4, so the backend never mistakes them for
+new inbox videos. They are written to a hidden .part file (not *.mp4) and
+published with os.replace, so readers never see a partial output;
+originals are never modified. A video
+whose output is newer than it is skipped, so restarts do not redo work, and
+a failed video is only retried once it changes. When an inbox video is
+deleted or moved away (e.g. to uploaded/) its outputs are deleted too, and
+outputs left without a source are swept at startup, so processed/ does not
+grow forever.
+
+Queue depth, running jobs and job-time percentiles are printed every
+--report seconds and, with --status-file, written there as JSON.
+
+Examples:
+  python3 inbox_worker.py /volume1/docker/shortsai/backend/storage --profile faststart
+  python3 inbox_worker.py /volume1/.../storage --profile normalize -j 2 --nice 15 --status-file /tmp/inbox.json
+  python3 inbox_worker.py /tmp/storage --once --ffmpeg "python3 fake_ffmpeg.py"
+"""
+import argparse
+import json
+import os
+import queue
+import shlex
+import shutil
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from fs_watch import Watcher, walk_files
+from ops_common import Histogram, format_size
+from storage_index import VIDEO_EXTENSIONS, classify
+
+DEFAULT_FFMPEG = "ffmpeg"
+PROFILES = ("normalize", "faststart", "trim")
+NORMALIZE_FILTER = ("scale=1080:1920:force_original_aspect_ratio=decrease,"
+                    "pad=1080:1920:(ow-iw)/2:(oh-ih)/2,fps=30")
+IONICE_CLASSES = {"none": None, "best-effort": ["-c", "2", "-n", "7"], "idle": ["-c", "3"]}
+RECENT_JOBS = 50
+# channel subdirectory for outputs, a sibling of inbox/
+OUTPUT_DIR = "processed"
+
+
+def available_cpus():
+    """CPUs this process may use: the cgroup v2/v1 quota if set, else the affinity mask"""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            return max(1, min(cpus, round(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0:
+            return max(1, min(cpus, round(quota / period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def profile_args(profile, threads, trim_seconds=None):
+    """ffmpeg arguments between the input and the output for a profile"""
+    if profile == "normalize":
+        return ["-vf", NORMALIZE_FILTER, "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+                "-pix_fmt", "yuv420p", "-af", "loudnorm=I=-14:TP=-1.5:LRA=11", "-c:a", "aac", "-b:a", "128k",
+                "-movflags", "+faststart", "-threads", str(threads)]
+    if profile == "faststart":
+        return ["-c", "copy", "-movflags", "+faststart"]
+    if profile == "trim":
+        return ["-t", str(trim_seconds), "-c", "copy", "-movflags", "+faststart"]
+    raise ValueError(f"unknown profile {profile}")
+
+
+def output_path(root, path, profile):
+    """.../channels/{channel}/processed/{videoId}.{profile}.mp4 for .../channels/{channel}/inbox/{videoId}.mp4"""
+    parts = os.path.relpath(path, root).split(os.sep)
+    parts[5] = OUTPUT_DIR
+    stem, _ = os.path.splitext(os.path.join(root, *parts))
+    return f"{stem}.{profile}.mp4"
+
+
+def is_output(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.splitext(stem)[1][1:] in PROFILES
+
+
+def has_source(root, path):
+    """Whether the inbox still holds a video for the output path (any extension)"""
+    parts = os.path.relpath(path, root).split(os.sep)
+    parts[5] = "inbox"
+    stem = os.path.splitext(os.path.splitext(os.path.join(root, *parts))[0])[0]
+    return any(os.path.exists(stem + ext) for ext in VIDEO_EXTENSIONS)
+
+
+def sweep_outputs(root):
+    """Delete outputs whose inbox video is gone, returns how many"""
+    def accept(path):
+        parts = os.path.relpath(path, root).split(os.sep)
+        return len(parts) >= 7 and parts[5] == OUTPUT_DIR and is_output(path)
+
+    removed = 0
+    for path in walk_files(root, accept):
+        if not has_source(root, path):
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+class InboxWorker:
+    """Job queue plus -j runner threads, each driving one ffmpeg process at a time"""
+
+    def __init__(self, root, profiles, workers, ffmpeg=None, nice=10, ionice="best-effort",
+                 threads=None, trim_seconds=None, status_file=None, log=print):
+        self.root = root
+        self.profiles = profiles
+        self.workers = workers
+        self.ffmpeg = ffmpeg or [DEFAULT_FFMPEG]
+        self.nice = ["nice", "-n", str(nice)] if nice and shutil.which("nice") else []
+        self.ionice = (["ionice"] + IONICE_CLASSES[ionice]) if IONICE_CLASSES[ionice] and shutil.which("ionice") \
+            else []
+        self.threads = threads or max(1, available_cpus() // workers)
+        self.trim_seconds = trim_seconds
+        self.status_file = status_file
+        self.log = log
+        self.queue = queue.Queue()
+        self.queued = set()
+        self.failed = {}
+        self.running = {}
+        self.lock = threading.Lock()
+        self.counts = {"done": 0, "failed": 0, "skipped": 0}
+        self.bytes_in = 0
+        self.histogram = Histogram()
+        self.recent = []
+        self.started = time.time()
+        self.runners = [threading.Thread(target=self.run_forever, daemon=True) for _ in range(workers)]
+        for runner in self.runners:
+            runner.start()
+
+    def wanted(self, path):
+        """A video in a channel inbox that is not one of our outputs"""
+        if not path.lower().endswith(VIDEO_EXTENSIONS) or is_output(path):
+            return False
+        return classify(os.path.relpath(path, self.root).replace(os.sep, "/"))[3] == "inbox"
+
+    def submit(self, path):
+        """Queue the profiles whose output is missing or older than path, returns how many"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return 0
+        added = 0
+        for profile in self.profiles:
+            job = (path, profile)
+            signature = (stat.st_size, stat.st_mtime_ns)
+            with self.lock:
+                if job in self.queued or job in self.running or self.failed.get(job) == signature:
+                    continue
+            try:
+                if os.stat(output_path(self.root, path, profile)).st_mtime_ns >= stat.st_mtime_ns:
+                    continue
+            except FileNotFoundError:
+                pass
+            with self.lock:
+                self.queued.add(job)
+            self.queue.put(job)
+            added += 1
+        return added
+
+    def forget(self, path):
+        """Drop the failures and outputs of a deleted inbox video, returns the outputs removed"""
+        with self.lock:
+            for profile in PROFILES:
+                self.failed.pop((path, profile), None)
+        removed = 0
+        for profile in PROFILES:
+            final = output_path(self.root, path, profile)
+            # another video with the same id but a different extension shares the output
+            if has_source(self.root, final):
+                continue
+            try:
+                os.unlink(final)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def run_forever(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            with self.lock:
+                self.queued.discard(job)
+                self.running[job] = time.monotonic()
+            try:
+                result = self.run_job(*job)
+            finally:
+                with self.lock:
+                    self.running.pop(job, None)
+            self.record(job, result)
+            self.queue.task_done()
+
+    def command(self, src, temp, profile):
+        # -f mp4 because the temp name does not end in .mp4
+        return (self.nice + self.ionice + self.ffmpeg + ["-hide_banner", "-nostdin", "-loglevel", "error", "-y", "-i", src]
+                + profile_args(profile, self.threads, self.trim_seconds) + ["-f", "mp4", temp])
+
+    def run_job(self, src, profile):
+        """Run ffmpeg into a hidden temp file and publish it, returns a result dict"""
+        result = {"path": src, "profile": profile, "ok": False, "error": None}
+        try:
+            stat = os.stat(src)
+        except FileNotFoundError:
+            result["error"] = "gone"
+            return result
+        result["size"] = stat.st_size
+        result["signature"] = (stat.st_size, stat.st_mtime_ns)
+        final = output_path(self.root, src, profile)
+        temp = os.path.join(os.path.dirname(final),
+                            f".{os.path.basename(final)}.{os.getpid()}-{threading.get_ident()}.part")
+        started = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(final), exist_ok=True)
+            process = subprocess.Popen(self.command(src, temp, profile), stdin=subprocess.DEVNULL,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+        stderr = process.stderr.read()
+        process.stderr.close()
+        # wait4 instead of wait() to get the CPU time of this ffmpeg alone
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        result["seconds"] = time.monotonic() - started
+        result["cpu_seconds"] = usage.ru_utime + usage.ru_stime
+        if process.returncode != 0:
+            lines = stderr.decode(errors="replace").strip().splitlines()
+            result["error"] = lines[-1] if lines else f"ffmpeg exited with {process.returncode}"
+            try:
+                os.unlink(temp)
+            except FileNotFoundError:
+                pass
+            return result
+        try:
+            now = os.stat(src)
+        except FileNotFoundError:
+            now = None
+        if now is None or (now.st_size, now.st_mtime_ns) != result["signature"]:
+            # still being written (e.g. picked up from a new directory); redo once it settles
+            os.unlink(temp)
+            result["error"] = "changed" if now else "gone"
+            return result
+        try:
+            with open(temp, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(temp, final)
+        except OSError as e:
+            result["error"] = str(e)
+            return result
+        result["ok"] = True
+        return result
+
+    def record(self, job, result):
+        with self.lock:
+            if result["ok"] or result["error"] == "gone":
+                self.failed.pop(job, None)
+            if result["ok"]:
+                self.counts["done"] += 1
+                self.bytes_in += result["size"]
+                self.histogram.record(int(result["seconds"] * 1e6))
+            elif result["error"] in ("gone", "changed"):
+                self.counts["skipped"] += 1
+            else:
+                self.counts["failed"] += 1
+                self.failed[job] = result.get("signature")
+            self.recent.append({key: value for key, value in result.items() if key != "signature"})
+            del self.recent[:-RECENT_JOBS]
+        if result["ok"]:
+            rate = result["size"] / 1e6 / max(result["seconds"], 1e-9)
+            self.log(f"OK: {result['profile']} {result['path']} {result['seconds']:.2f}s "
+                     f"(cpu {result['cpu_seconds']:.2f}s, {rate:.1f} MB/s)")
+        elif result["error"] == "changed":
+            self.submit(result["path"])
+        elif result["error"] != "gone":
+            self.log(f"ERROR: {result['profile']} {result['path']}: {result['error']}")
+
+    def status(self):
+        with self.lock:
+            now = time.monotonic()
+            return {
+                "queued": len(self.queued),
+                "running": [{"path": path, "profile": profile, "seconds": round(now - started, 2)}
+                            for (path, profile), started in self.running.items()],
+                **self.counts,
+                "workers": self.workers,
+                "threadsPerJob": self.threads,
+                "bytesIn": self.bytes_in,
+                "jobSecondsP50": self.histogram.percentile(50) / 1e6 if self.histogram.total else None,
+                "jobSecondsP95": self.histogram.percentile(95) / 1e6 if self.histogram.total else None,
+                "uptimeSeconds": round(time.time() - self.started, 1),
+                "recent": list(self.recent[-10:]),
+            }
+
+    def report(self):
+        status = self.status()
+        if self.status_file:
+            temp = f"{self.status_file}.tmp"
+            with open(temp, "w") as f:
+                json.dump(status, f, indent=2)
+            os.replace(temp, self.status_file)
+        percentiles = (f"job p50 {status['jobSecondsP50']:.2f}s p95 {status['jobSecondsP95']:.2f}s"
+                       if status["jobSecondsP50"] is not None else "no jobs yet")
+        return (f"queue {status['queued']}, running {len(status['running'])}, done {status['done']}, "
+                f"failed {status['failed']}, {format_size(status['bytesIn'])} in; {percentiles}")
+
+    def join(self):
+        self.queue.join()
+
+    def stop(self):
+        """Let running jobs finish, drop the rest of the queue"""
+        while True:
+            try:
+                self.queue.get_nowait()
+                self.queue.task_done()
+            except queue.Empty:
+                break
+        for _ in self.runners:
+            self.queue.put(None)
+        for runner in self.runners:
+            runner.join()
+
+
+def backlog(root, accept):
+    """Existing inbox videos, oldest first"""
+    files = []
+    for path in walk_files(root, accept):
+        try:
+            files.append((os.stat(path).st_mtime_ns, path))
+        except FileNotFoundError:
+            continue
+    return [path for _, path in sorted(files)]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="storage root (contains videos/ and music_clips/)")
+    parser.add_argument("--profile", action="append", choices=PROFILES, help="job per video, repeatable "
+                        "(default: normalize)")
+    parser.add_argument("--trim-seconds", type=float, help="duration for the trim profile")
+    parser.add_argument("-j", "--workers", type=int, default=max(1, available_cpus() // 2),
+                        help="concurrent ffmpeg processes (default: half the CPUs, %(default)s)")
+    parser.add_argument("--threads", type=int, help="ffmpeg -threads per job (default: CPUs / workers)")
+    parser.add_argument("--nice", type=int, default=10, help="niceness added to ffmpeg (default: %(default)s)")
+    parser.add_argument("--ionice", choices=tuple(IONICE_CLASSES), default="best-effort",
+                        help="I/O class for ffmpeg (default: best-effort, lowest priority)")
+    parser.add_argument("--ffmpeg", default=DEFAULT_FFMPEG, help="ffmpeg command (default: %(default)s)")
+    parser.add_argument("--once", action="store_true", help="process the current backlog and exit")
+    parser.add_argument("--poll", action="store_true", help="poll instead of inotify")
+    parser.add_argument("--interval", type=float, default=2.0, help="poll interval in seconds")
+    parser.add_argument("--report", type=float, default=30, help="status line every N seconds")
+    parser.add_argument("--status-file", help="write the status as JSON to this file on every report")
+    args = parser.parse_args(argv)
+    if "trim" in (args.profile or []) and not args.trim_seconds:
+        parser.error("--profile trim needs --trim-seconds")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.root):
+        print(f"ERROR: {args.root} is not a directory")
+        return 2
+    worker = InboxWorker(args.root, args.profile or ["normalize"], args.workers, shlex.split(args.ffmpeg),
+                         args.nice, args.ionice, args.threads, args.trim_seconds, args.status_file,
+                         log=lambda line: print(line, flush=True))
+    # watch before listing the backlog so nothing written in between is missed
+    watcher = None if args.once else Watcher(args.root, "poll" if args.poll else "auto", args.interval,
+                                             accept=worker.wanted)
+    swept = sweep_outputs(args.root)
+    queued = sum(worker.submit(path) for path in backlog(args.root, worker.wanted))
+    print(f"{swept} orphaned outputs deleted, {queued} jobs queued from the backlog, {args.workers} workers x {worker.threads} threads"
+          + (f", watching ({watcher.backend})" if watcher else ""), flush=True)
+
+    if args.once:
+        worker.join()
+        worker.stop()
+        print(worker.report())
+        return 1 if worker.counts["failed"] else 0
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    next_report = time.monotonic() + args.report
+    try:
+        while not stop.is_set():
+            for event, path in watcher.wait(timeout=min(1.0, args.report)):
+                if event == "write":
+                    worker.submit(path)
+                elif event == "delete" and worker.wanted(path) and worker.forget(path):
+                    print(f"OK: deleted the outputs of {path}", flush=True)
+            if time.monotonic() >= next_report:
+                print(worker.report(), flush=True)
+                next_report = time.monotonic() + args.report
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    print("stopping: waiting for running jobs", flush=True)
+    worker.stop()
+    print(worker.report())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Open-loop load generator and latency benchmark for the backend API
+
+Requests are fired on a fixed (or Poisson) schedule regardless of how fast
+responses come back, and latency is measured from the scheduled send time,
+so a slow server shows up as latency instead of silently lowering the rate.
+Each route keeps an HDR-style log-linear histogram (constant memory, ~1.6%
+relative precision) for p50/p95/p99, and failures are classified as
+connect/timeout/protocol errors or HTTP 4xx/5xx.
+
+A mix entry is WEIGHT:METHOD:PATH, e.g. 5:GET:/api/diag/channels.
+
+Examples:
+  python3 load_generator.py --fake-server --rate 200 --duration 10
+  DIAG_TOKEN=... python3 load_generator.py --url http://192.168.100.222:7777 --rate 50 --json build-a.json
+  python3 load_generator.py --url ... --compare build-a.json --json build-b.json
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import socket
+import ssl
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+from ops_common import DEFAULT_TOKEN_FILE, PERCENTILES, Histogram, read_token
+
+DEFAULT_MIX = [
+    (5, "GET", "/api/diag/channels"),
+    (3, "GET", "/api/channels/schedule"),
+    (2, "GET", "/api/media/mock-user/mock-channel/clip.mp4"),
+    (1, "GET", "/api/diag/buildinfo"),
+]
+
+
+class HttpError(Exception):
+    def __init__(self, kind, message):
+        super().__init__(message)
+        self.kind = kind
+
+
+class AsyncConnectionPool:
+    """Keep-alive HTTP/1.1 connections to one origin over asyncio streams"""
+
+    def __init__(self, base_url, max_connections=64, timeout=10.0):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(max_connections)
+        self.opened = 0
+
+    async def _connect(self):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self.ssl), self.timeout)
+        except asyncio.TimeoutError:
+            raise HttpError("connect-timeout", "connect timed out")
+        except OSError as e:
+            raise HttpError("connect-error", str(e))
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.opened += 1
+        return reader, writer
+
+    async def request(self, method, path, headers):
+        """Returns (status, body size); raises HttpError on transport failures"""
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise HttpError("timeout", f"no free connection in {self.timeout}s")
+        try:
+            conn = self.idle.pop() if self.idle else await self._connect()
+            try:
+                status, size, keep_alive = await asyncio.wait_for(
+                    self._exchange(conn, method, path, headers), self.timeout)
+            except asyncio.TimeoutError:
+                conn[1].close()
+                raise HttpError("timeout", f"no response in {self.timeout}s")
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                conn[1].close()
+                raise HttpError("protocol-error", f"{type(e).__name__}: {e}")
+            except asyncio.CancelledError:
+                conn[1].close()
+                raise
+            if keep_alive:
+                self.idle.append(conn)
+            else:
+                conn[1].close()
+            return status, size
+        finally:
+            self.slots.release()
+
+    async def _exchange(self, conn, method, path, headers):
+        reader, writer = conn
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", "Content-Length: 0"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ValueError("connection closed before response")
+        parts = status_line.split(None, 2)
+        if len(parts) < 2:
+            raise ValueError(f"malformed status line {status_line!r}")
+        status = int(parts[1])
+        response_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        size = 0
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                chunk_size = int((await reader.readline()).split(b";")[0], 16)
+                if chunk_size == 0:
+                    await reader.readline()
+                    break
+                size += len(await reader.readexactly(chunk_size + 2)) - 2
+        elif "content-length" in response_headers:
+            remaining = int(response_headers["content-length"])
+            while remaining:
+                data = await reader.read(min(remaining, 1 << 16))
+                if not data:
+                    raise ValueError("connection closed mid-body")
+                remaining -= len(data)
+                size += len(data)
+        else:
+            size = len(await reader.read())
+            return status, size, False
+        keep_alive = response_headers.get("connection", "").lower() != "close"
+        return status, size, keep_alive
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle = []
+
+
+class RouteStats:
+    def __init__(self):
+        self.histogram = Histogram()
+        self.errors = {}
+        self.bytes = 0
+        self.requests = 0
+
+    def error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+
+async def run_load(base_url, mix, rate, duration, warmup=0.0, headers=None, max_inflight=1000,
+                   poisson=False, timeout=10.0, max_connections=64, seed=1):
+    """Fire requests open-loop for warmup + duration seconds, returns (stats, info)"""
+    rng = random.Random(seed)
+    pool = AsyncConnectionPool(base_url, max_connections, timeout)
+    weights = [weight for weight, _, _ in mix]
+    stats = {f"{method} {path}": RouteStats() for _, method, path in mix}
+    headers = headers or {}
+    loop = asyncio.get_running_loop()
+    inflight = set()
+    sent = 0
+    dropped = 0
+
+    async def one(route, method, path, scheduled, measured):
+        route_stats = stats[route]
+        try:
+            status, size = await pool.request(method, path, headers)
+        except HttpError as e:
+            if measured:
+                route_stats.error(e.kind)
+            return
+        except asyncio.CancelledError:
+            # still running when the run ended: it is part of the tail, not lost
+            if measured:
+                route_stats.error("timeout")
+            raise
+        if not measured:
+            return
+        route_stats.histogram.record((loop.time() - scheduled) * 1e6)
+        route_stats.bytes += size
+        if status >= 500:
+            route_stats.error("http-5xx")
+        elif status >= 400:
+            route_stats.error("http-4xx")
+
+    start = loop.time() + 0.05
+    end = start + warmup + duration
+    measure_from = start + warmup
+    scheduled = start
+    while scheduled < end:
+        delay = scheduled - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        _, method, path = rng.choices(mix, weights)[0]
+        route = f"{method} {path}"
+        measured = scheduled >= measure_from
+        if measured:
+            stats[route].requests += 1
+        if len(inflight) >= max_inflight:
+            if measured:
+                stats[route].error("client-overload")
+                dropped += 1
+        else:
+            task = asyncio.ensure_future(one(route, method, path, scheduled, measured))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+            sent += 1
+        scheduled += rng.expovariate(rate) if poisson else 1.0 / rate
+
+    if inflight:
+        _, pending = await asyncio.wait(inflight, timeout=timeout + 1)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    pool.close()
+    info = {"sent": sent, "dropped": dropped, "connections": pool.opened,
+            "elapsed_s": loop.time() - start, "target_rate": rate, "duration_s": duration}
+    return stats, info
+
+
+def build_report(stats, info):
+    total = Histogram()
+    routes = {}
+    for route, route_stats in stats.items():
+        total.merge(route_stats.histogram)
+        errors = sum(route_stats.errors.values())
+        requests = route_stats.requests
+        routes[route] = {
+            **route_stats.histogram.summary_ms(),
+            "requests": requests,
+            "errors": route_stats.errors,
+            "error_rate": errors / requests if requests else 0.0,
+            "bytes": route_stats.bytes,
+        }
+    return {
+        "info": info,
+        "achieved_rate": total.total / info["duration_s"] if info["duration_s"] else 0.0,
+        "total": total.summary_ms(),
+        "routes": routes,
+    }
+
+
+def print_report(report, baseline=None):
+    info = report["info"]
+    print(f"target {info['target_rate']:.0f} req/s, achieved {report['achieved_rate']:.1f} req/s, "
+          f"{info['sent']} sent, {info['dropped']} dropped, {info['connections']} connection(s)")
+    header = f"{'route':<48} {'count':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'err%':>6}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["routes"].items()) + [("TOTAL", report["total"])]
+    for route, row in rows:
+        error_rate = row.get("error_rate")
+        errors = f"{error_rate * 100:>5.1f}%" if error_rate is not None else ""
+        line = (f"{route[:48]:<48} {row['count']:>7} {row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} "
+                f"{row['p99_ms']:>8.2f} {row['max_ms']:>8.2f} {errors:>6}")
+        if baseline:
+            base = baseline["total"] if route == "TOTAL" else baseline["routes"].get(route)
+            if base and base.get("p99_ms"):
+                line += f"  p99 {(row['p99_ms'] / base['p99_ms'] - 1) * 100:+.0f}% vs baseline"
+        print(line)
+    for route, row in report["routes"].items():
+        if row["errors"]:
+            details = ", ".join(f"{kind}={count}" for kind, count in sorted(row["errors"].items()))
+            print(f"errors {route}: {details}")
+
+
+def write_csv(report, path):
+    fields = ["route", "requests", "count", "error_rate", "min_ms", "mean_ms"] + \
+        [f"p{p:g}_ms" for p in PERCENTILES] + ["max_ms", "bytes"]
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
+        writer.writeheader()
+        for route, row in report["routes"].items():
+            writer.writerow({"route": route, **row})
+
+
+def parse_mix(entries):
+    mix = []
+    for entry in entries:
+        weight, method, path = entry.split(":", 2)
+        mix.append((float(weight), method.upper(), path))
+    return mix
+
+
+def start_fake_server(delay, error_rate):
+    """Run diag_mock_server.py in a subprocess, returns (process, base_url)"""
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diag_mock_server.py")
+    process = subprocess.Popen(
+        [sys.executable, script, "--port", str(port), "--delay", str(delay), "--error-rate", str(error_rate)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("fake server did not start")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:7777", help="backend base URL (default: %(default)s)")
+    parser.add_argument("--mix", action="append", metavar="WEIGHT:METHOD:PATH",
+                        help="weighted route (repeatable, default: a diag/channels/media mix)")
+    parser.add_argument("--rate", type=float, default=50.0, help="requests per second (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds (default: %(default)s)")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds first (default: %(default)s)")
+    parser.add_argument("--poisson", action="store_true", help="exponential inter-arrival times")
+    parser.add_argument("--connections", type=int, default=64, help="max open connections (default: %(default)s)")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="drop arrivals beyond this (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=10.0, help="per request seconds (default: %(default)s)")
+    parser.add_argument("--token", help="Bearer token (default: $DIAG_TOKEN or --token-file)")
+    parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE)
+    parser.add_argument("--json", metavar="FILE", help="write the report as JSON")
+    parser.add_argument("--csv", metavar="FILE", help="write per-route rows as CSV")
+    parser.add_argument("--compare", metavar="FILE", help="JSON report of a previous run to compare p99 against")
+    parser.add_argument("--fake-server", action="store_true", help="run against a local diag_mock_server.py")
+    parser.add_argument("--fake-delay", type=float, default=0.005, help="fake server latency (default: %(default)s)")
+    parser.add_argument("--fake-error-rate", type=float, default=0.0, help="fake server 500 share")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    token = read_token(args.token, args.token_file) or ("load-test" if args.fake_server else None)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    fake = None
+    url = args.url
+    if args.fake_server:
+        fake, url = start_fake_server(args.fake_delay, args.fake_error_rate)
+    try:
+        print(f"Load test {url}: {args.rate:g} req/s for {args.duration:g}s (+{args.warmup:g}s warmup)")
+        stats, info = asyncio.run(run_load(
+            url, mix, args.rate, args.duration, args.warmup, headers, args.max_inflight,
+            args.poisson, args.timeout, args.connections, args.seed))
+    finally:
+        if fake:
+            fake.terminate()
+            fake.wait()
+
+    report = build_report(stats, info)
+    report["url"] = url
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.csv:
+        write_csv(report, args.csv)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
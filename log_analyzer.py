@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Streaming analyzer for backend container logs
+
+Reads `docker logs` output (plain, with or without -t timestamps) or Docker
+json-file logs line by line, reassembles the multi-line records that
+`Logger.info(message, meta)` produces through console.log/util.inspect,
+parses the meta object and groups records by requestId. Reports per-route
+request and error counts, the top failure messages and the latency between
+correlated events of a request (first to last event, plus --span pairs).
+
+Memory stays constant: open requests live in a bounded LRU table, failure
+messages in a fixed-size top-k counter and latencies in fixed histograms.
+
+Examples:
+  docker logs -t shortsai-backend 2>&1 | python3 log_analyzer.py -
+  python3 log_analyzer.py /var/lib/docker/containers/<id>/<id>-json.log --mmap
+  python3 log_analyzer.py --docker shortsai-backend --follow --report-interval 30
+  python3 log_analyzer.py backend.log --span "fetchAndSaveToServer: start" "fetchAndSaveToServer: URL download success"
+"""
+import argparse
+import json
+import mmap
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from ops_common import Histogram
+
+TIMESTAMP_RE = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})? ")
+# Fields read from util.inspect meta: key: 'str' | "str" | number/bool/null
+META_KEYS = ("requestId", "method", "originalUrl", "path", "statusCode", "error", "errorMessage")
+META_PAIR_RE = re.compile(
+    r"""\b(""" + "|".join(META_KEYS) + r""")['"]?:\s*(?:'((?:[^'\\\n]|\\.)*)'|"((?:[^"\\\n]|\\.)*)"|(-?\d+(?:\.\d+)?|true|false|null|undefined)\b)""")
+QUOTED_RE = re.compile(r"""'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"|`(?:[^`\\\n]|\\.)*`""")
+ID_SEGMENT_RE = re.compile(r"^(?:\d+|[0-9a-fA-F-]{16,}|(?=[^/]*\d)[A-Za-z0-9_-]{16,})$")
+ERROR_WORDS = ("error", "failed", "exception", "not_found", "not found")
+MAX_RECORD_LINES = 400
+
+
+# --- input -----------------------------------------------------------------
+
+def iter_file_lines(path, use_mmap=False):
+    """Yield decoded lines of a file, optionally through mmap"""
+    if use_mmap and os.path.getsize(path) > 0:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            readline = mm.readline
+            while True:
+                line = readline()
+                if not line:
+                    return
+                yield line.decode("utf-8", errors="replace")
+    else:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            yield from f
+
+
+def follow_file(path, poll_interval=0.5):
+    """tail -F: yield new lines forever, reopening the file after rotation"""
+    handle = open(path, "r", encoding="utf-8", errors="replace")
+    handle.seek(0, os.SEEK_END)
+    inode = os.fstat(handle.fileno()).st_ino
+    pending = ""
+    while True:
+        chunk = handle.readline()
+        if chunk:
+            pending += chunk
+            if pending.endswith("\n"):
+                yield pending
+                pending = ""
+            continue
+        try:
+            if os.stat(path).st_ino != inode:
+                handle.close()
+                handle = open(path, "r", encoding="utf-8", errors="replace")
+                inode = os.fstat(handle.fileno()).st_ino
+                continue
+        except FileNotFoundError:
+            pass
+        yield None  # idle tick, lets the caller print periodic reports
+        time.sleep(poll_interval)
+
+
+def docker_lines(container, follow=False):
+    command = ["docker", "logs", "-t"] + (["-f"] if follow else []) + [container]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding="utf-8", errors="replace")
+    try:
+        yield from process.stdout
+    finally:
+        process.terminate()
+
+
+def unwrap_line(line):
+    """(raw timestamp or None, stream or None, text) of one raw log line"""
+    if line.startswith('{"log":'):
+        try:
+            entry = json.loads(line)
+            return entry.get("time"), entry.get("stream"), entry.get("log", "").rstrip("\n")
+        except ValueError:
+            pass
+    line = line.rstrip("\n")
+    match = TIMESTAMP_RE.match(line)
+    if match:
+        return match.group(0).strip(), None, line[match.end():]
+    return None, None, line
+
+
+_second_cache = {}
+
+
+def parse_timestamp(value):
+    """Epoch seconds of an RFC 3339 timestamp (nanosecond precision allowed)"""
+    if not value:
+        return None
+    match = TIMESTAMP_RE.match(value + " ")
+    if not match:
+        return None
+    base, fraction, zone = match.groups()
+    key = (base, zone)
+    seconds = _second_cache.get(key)
+    if seconds is None:
+        offset = "+00:00" if zone in (None, "Z") else zone
+        try:
+            seconds = datetime.fromisoformat(f"{base}{offset}").timestamp()
+        except ValueError:
+            return None
+        if len(_second_cache) > 4096:
+            _second_cache.clear()
+        _second_cache[key] = seconds
+    return seconds + (float(fraction) if fraction else 0.0)
+
+
+def iter_records(lines):
+    """Group raw lines into records: (epoch timestamp, stream, text)
+
+    A record starts on a non-indented line; indented lines (stack traces)
+    and lines needed to close an open {...} belong to the current record.
+    None items in lines are passed through as idle ticks.
+    """
+    current = None
+    depth = 0
+    for raw in lines:
+        if raw is None:
+            if current is not None and depth <= 0:
+                yield current[0], current[1], "\n".join(current[2])
+                current = None
+            yield None
+            continue
+        timestamp, stream, text = unwrap_line(raw)
+        continues = current is not None and (depth > 0 or text[:1] in (" ", "\t", "}", "]"))
+        if continues and len(current[2]) < MAX_RECORD_LINES:
+            current[2].append(text)
+            depth += brace_delta(text)
+            continue
+        if current is not None:
+            yield current[0], current[1], "\n".join(current[2])
+        current = [parse_timestamp(timestamp), stream, [text]]
+        depth = brace_delta(text)
+    if current is not None:
+        yield current[0], current[1], "\n".join(current[2])
+
+
+def brace_delta(text):
+    """Open minus closed brackets outside of quoted strings"""
+    if "'" in text or '"' in text or "`" in text:
+        text = QUOTED_RE.sub("", text)
+    return text.count("{") + text.count("[") - text.count("}") - text.count("]")
+
+
+# --- meta parsing ----------------------------------------------------------
+
+def split_record(text):
+    """(message, meta dict) of a Logger record
+
+    JSON meta is decoded fully. util.inspect output is not valid JSON, so only
+    the scalar fields the analyzer needs (META_KEYS) are pulled out with one
+    regex; the first occurrence wins, which is the top-level one in practice.
+    """
+    candidates = [index for index in (text.find(" {"), text.find(" [")) if index > 0]
+    if not candidates:
+        return text.split("\n", 1)[0], {}
+    index = min(candidates)
+    message = text[:index]
+    meta_text = text[index + 1:]
+    if meta_text.startswith('{"'):
+        try:
+            meta = json.loads(meta_text)
+            if isinstance(meta, dict):
+                return message, meta
+        except ValueError:
+            pass
+    meta = {}
+    for name, single, double, scalar in META_PAIR_RE.findall(meta_text):
+        if name in meta:
+            continue
+        if scalar:
+            meta[name] = int(scalar) if scalar.lstrip("-").isdigit() else scalar
+        else:
+            meta[name] = single or double
+    return message, meta
+
+
+# --- aggregation -----------------------------------------------------------
+
+class TopK:
+    """Space-saving heavy hitters counter with fixed capacity"""
+
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key, count=1):
+        if key in self.counts or len(self.counts) < self.capacity:
+            self.counts[key] = self.counts.get(key, 0) + count
+            return
+        victim = min(self.counts, key=self.counts.get)
+        self.counts[key] = self.counts.pop(victim) + count
+
+    def most_common(self, n):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.client_errors = 0
+        self.duration = Histogram()
+
+
+def normalize_path(path):
+    path = path.split("?", 1)[0]
+    return "/".join(":id" if ID_SEGMENT_RE.match(part) else part for part in path.split("/"))
+
+
+def normalize_message(message):
+    message = re.sub(r"\d+", "N", message)
+    return message[:160]
+
+
+class LogAnalyzer:
+    def __init__(self, max_open=20000, spans=None):
+        self.max_open = max_open
+        self.spans = spans or []
+        self.open = OrderedDict()
+        self.routes = {}
+        self.failures = TopK()
+        self.span_histograms = {f"{a} -> {b}": Histogram() for a, b in self.spans}
+        self.records = 0
+        self.with_request = 0
+        self.first_ts = None
+        self.last_ts = None
+
+    def route(self, name):
+        stats = self.routes.get(name)
+        if stats is None:
+            stats = self.routes[name] = RouteStats()
+        return stats
+
+    def add(self, timestamp, stream, text):
+        self.records += 1
+        if timestamp is not None:
+            self.first_ts = timestamp if self.first_ts is None else self.first_ts
+            self.last_ts = timestamp
+        message, meta = split_record(text)
+        lowered = message.lower()
+        is_failure = stream == "stderr" or any(word in lowered for word in ERROR_WORDS) \
+            or "error" in meta or "errorMessage" in meta
+        if is_failure:
+            self.failures.add(normalize_message(message))
+
+        request_id = meta.get("requestId") if isinstance(meta, dict) else None
+        if not request_id or request_id == "unknown":
+            return
+        self.with_request += 1
+        state = self.open.get(request_id)
+        if state is None:
+            state = {"route": None, "first": timestamp, "last": timestamp, "status": None,
+                     "failed": False, "marks": {}}
+            self.open[request_id] = state
+            if len(self.open) > self.max_open:
+                self.finish(*self.open.popitem(last=False))
+        else:
+            self.open.move_to_end(request_id)
+        if timestamp is not None:
+            state["first"] = state["first"] if state["first"] is not None else timestamp
+            state["last"] = timestamp
+        if message == "INCOMING REQUEST" and meta.get("method"):
+            state["route"] = f"{meta['method']} {normalize_path(str(meta.get('originalUrl') or meta.get('path') or ''))}"
+        if isinstance(meta.get("statusCode"), int):
+            state["status"] = meta["statusCode"]
+        if message.startswith("[404 NOT FOUND]"):
+            state["status"] = 404
+        elif message == "Global error handler":
+            state["status"] = 500
+        if is_failure:
+            state["failed"] = True
+        if timestamp is not None:
+            for start, end in self.spans:
+                if message.startswith(start):
+                    state["marks"].setdefault(start, timestamp)
+                elif message.startswith(end) and start in state["marks"]:
+                    elapsed = timestamp - state["marks"].pop(start)
+                    self.span_histograms[f"{start} -> {end}"].record(elapsed * 1e6)
+
+    def finish(self, request_id, state):
+        stats = self.route(state["route"] or "(unknown route)")
+        stats.requests += 1
+        status = state["status"]
+        if (status is not None and status >= 500) or (state["failed"] and (status is None or status < 400)):
+            stats.errors += 1
+        elif status is not None and status >= 400:
+            stats.client_errors += 1
+        if state["first"] is not None and state["last"] is not None:
+            stats.duration.record((state["last"] - state["first"]) * 1e6)
+
+    def flush(self):
+        while self.open:
+            self.finish(*self.open.popitem(last=False))
+
+    def report(self, top=15):
+        routes = {}
+        for name, stats in sorted(self.routes.items(), key=lambda item: -item[1].requests):
+            routes[name] = {
+                "requests": stats.requests,
+                "errors": stats.errors,
+                "client_errors": stats.client_errors,
+                "error_rate": stats.errors / stats.requests if stats.requests else 0.0,
+                "p50_ms": stats.duration.percentile(50) / 1000,
+                "p95_ms": stats.duration.percentile(95) / 1000,
+                "p99_ms": stats.duration.percentile(99) / 1000,
+            }
+        return {
+            "records": self.records,
+            "records_with_request_id": self.with_request,
+            "open_requests": len(self.open),
+            "time_range": [self.first_ts, self.last_ts],
+            "routes": routes,
+            "top_failures": self.failures.most_common(top),
+            "spans": {name: hist.summary_ms() for name, hist in self.span_histograms.items()},
+        }
+
+
+def print_report(report):
+    print(f"\n{report['records']} records, {report['records_with_request_id']} with requestId, "
+          f"{report['open_requests']} requests still open")
+    print(f"{'route':<52} {'reqs':>7} {'5xx/err':>8} {'4xx':>6} {'err%':>6} {'p50ms':>8} {'p95ms':>8}")
+    for name, row in report["routes"].items():
+        print(f"{name[:52]:<52} {row['requests']:>7} {row['errors']:>8} {row['client_errors']:>6} "
+              f"{row['error_rate'] * 100:>5.1f}% {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f}")
+    if report["top_failures"]:
+        print("\nTop failure messages:")
+        for message, count in report["top_failures"]:
+            print(f"  {count:>7}  {message}")
+    for name, summary in report["spans"].items():
+        print(f"\nSpan {name}: n={summary['count']} p50={summary['p50_ms']:.1f}ms "
+              f"p95={summary['p95_ms']:.1f}ms max={summary['max_ms']:.1f}ms")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("paths", nargs="*", help="log files, '-' for stdin")
+    parser.add_argument("--docker", metavar="CONTAINER", help="read `docker logs -t CONTAINER`")
+    parser.add_argument("--follow", action="store_true", help="keep reading new lines (file or --docker)")
+    parser.add_argument("--mmap", action="store_true", help="read on-disk files through mmap")
+    parser.add_argument("--span", nargs=2, action="append", metavar=("START", "END"),
+                        help="measure time between two messages of the same requestId (repeatable)")
+    parser.add_argument("--max-open", type=int, default=20000, help="requests tracked at once (default: %(default)s)")
+    parser.add_argument("--report-interval", type=float, default=0, help="print a report every N seconds when following")
+    parser.add_argument("--top", type=int, default=15, help="failure messages to show (default: %(default)s)")
+    parser.add_argument("--json", metavar="FILE", help="write the final report as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    analyzer = LogAnalyzer(args.max_open, [tuple(span) for span in args.span or []])
+
+    def sources():
+        if args.docker:
+            yield docker_lines(args.docker, args.follow)
+        for path in args.paths or ([] if args.docker else ["-"]):
+            if path == "-":
+                yield sys.stdin
+            elif args.follow:
+                yield follow_file(path)
+            else:
+                yield iter_file_lines(path, args.mmap)
+
+    last_report = time.monotonic()
+    try:
+        for lines in sources():
+            for record in iter_records(lines):
+                if record is not None:
+                    analyzer.add(*record)
+                if args.report_interval and time.monotonic() - last_report >= args.report_interval:
+                    print_report(analyzer.report(args.top))
+                    last_report = time.monotonic()
+    except KeyboardInterrupt:
+        pass
+
+    analyzer.flush()
+    report = analyzer.report(args.top)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
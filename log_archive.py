@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Compressed, indexed archive of backend container logs
+
+ingest reads `docker logs -t` output, files or stdin, and regroups the
+lines into whole Logger records (multi-line util.inspect meta and stack
+traces stay together, see log_analyzer.iter_records). Records are packed
+into blocks of about --block-size raw bytes. Each block is compressed on
+its own (zstd when the zstandard package is installed, zlib otherwise) and
+appended to the current segment file:
+
+  DIR/catalog.json          segments with their time range, sizes and codec
+  DIR/seg-000001.log.zst    concatenated compressed blocks
+  DIR/seg-000001.blocks     block table: offset, length, first/last time
+  DIR/seg-000001.keys       sorted (hash of field=value, block) pairs
+  DIR/seg-000001.keys.runs  the same pairs while the segment is open, one
+                            sorted run appended per block
+  DIR/seg-000001.runs       where each of those runs ends
+
+The keys are an inverted index of the requestId, userId and channelId
+values found in each record's meta. That covers the fields
+apply_all_changes.py adds to fetchAndSaveToServer logging, and the ids in
+firestorePath. A lookup binary-searches each segment's keys file through
+mmap, or each run of an open segment; sealing merges the runs into .keys.
+Only the blocks that contain the id are decompressed, and only segments
+and blocks overlapping --since/--until are considered. Finding one request
+in a month of logs is a few page reads per segment.
+
+Every file of a segment is append-only until it is sealed, so a block
+costs its own size in writes. The catalog is the commit point: it records
+the number of blocks and runs, and reopening an unsealed segment truncates
+whatever was appended after the last catalog save. A segment is sealed
+after --segment-size raw bytes, after --segment-age, or at MAX_KEY_RUNS
+blocks, whichever comes first, so an open segment never has more runs to
+search than that. With --follow a
+partly filled block is flushed every --flush-interval seconds, so fresh
+logs become searchable quickly. --docker resumes after the last archived
+timestamp.
+
+Examples:
+  python3 log_archive.py ingest --archive /volume1/logs/backend --docker shortsai-backend --follow
+  docker logs -t shortsai-backend 2>&1 | python3 log_archive.py ingest --archive logs/ -
+  python3 log_archive.py search --archive logs/ --request 5f0c2e1a-... [--since 7d]
+  python3 log_archive.py search --archive logs/ --user UID --channel CID --grep CHANNEL_NOT_FOUND
+  python3 log_archive.py stats --archive logs/
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import mmap
+import os
+import queue
+import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from log_analyzer import follow_file, iter_file_lines, iter_records
+from ops_common import format_size, parse_duration
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZSTD_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+ID_FIELDS = ("requestId", "userId", "channelId")
+ID_RE = re.compile(r"""\b(requestId|userId|channelId)['"]?\s*:\s*['"]([^'"\s]{1,128})['"]""")
+FIRESTORE_PATH_RE = re.compile(r"""\busers/([A-Za-z0-9_-]{1,128})(?:/channels/([A-Za-z0-9_-]{1,128}))?""")
+KEY = struct.Struct("<QI")
+RUN = struct.Struct("<Q")
+BLOCK = struct.Struct("<QIIdd")
+RECORD_SEPARATOR = "\x1e"
+DEFAULT_BLOCK_SIZE = 256 * 1024
+DEFAULT_SEGMENT_SIZE = 64 * 1024 * 1024
+DEFAULT_SEGMENT_AGE = 86400
+# blocks (key runs) per segment; with --follow flushing every 10s that is about 6h
+MAX_KEY_RUNS = 2048
+
+
+def key_hash(field, value):
+    return int.from_bytes(hashlib.blake2b(f"{field}={value}".encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def record_ids(text):
+    """{(field, value)} of the ids a record mentions"""
+    ids = {(field, value) for field, value in ID_RE.findall(text)}
+    if "users/" in text:
+        for user, channel in FIRESTORE_PATH_RE.findall(text):
+            ids.add(("userId", user))
+            if channel:
+                ids.add(("channelId", channel))
+    return ids
+
+
+def index_keys(ids):
+    """Index entries for a record's ids: each id, plus each user/channel pair
+
+    The pair keys let a --user --channel search go straight to the blocks
+    where that channel of that user was logged, instead of intersecting two
+    long lists (most blocks mention most users).
+    """
+    keys = set(ids)
+    users = [value for field, value in ids if field == "userId"]
+    channels = [value for field, value in ids if field == "channelId"]
+    keys.update(("userId+channelId", f"{user}/{channel}") for user in users for channel in channels)
+    return keys
+
+
+def lookup_keys(ids):
+    """Index entries to intersect for a search, using the pair key when possible"""
+    fields = dict(ids)
+    if "userId" in fields and "channelId" in fields:
+        rest = [(field, value) for field, value in ids if field not in ("userId", "channelId")]
+        return rest + [("userId+channelId", f"{fields['userId']}/{fields['channelId']}")]
+    return list(ids)
+
+
+def compressor(codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress
+    return lambda data: zlib.compress(data, 6)
+
+
+def decompressor(codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("this segment is zstd compressed, install the zstandard package")
+        return zstandard.ZstdDecompressor().decompress
+    return zlib.decompress
+
+
+def iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def atomic_write(path, data):
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, path)
+
+
+def append(path, data):
+    with open(path, "ab") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def truncate(path, size):
+    with open(path, "ab") as f:
+        f.truncate(size)
+
+
+def read_table(path, record, count=None):
+    """Fixed-size records of a file, only the first count if given"""
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb") as f:
+        data = f.read() if count is None else f.read(count * record.size)
+    return [record.unpack_from(data, offset) for offset in range(0, len(data) - record.size + 1, record.size)]
+
+
+def load_catalog(archive):
+    path = os.path.join(archive, "catalog.json")
+    if not os.path.exists(path):
+        return {"version": 1, "segments": []}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class ArchiveWriter:
+    """Appends records to the newest segment, sealing it when full"""
+
+    def __init__(self, archive, block_size=DEFAULT_BLOCK_SIZE, segment_size=DEFAULT_SEGMENT_SIZE, codec=None,
+                 segment_age=DEFAULT_SEGMENT_AGE):
+        self.archive = archive
+        self.block_size = block_size
+        self.segment_size = segment_size
+        self.segment_age = segment_age
+        self.codec = codec or ("zstd" if zstandard is not None else "zlib")
+        self.compress = compressor(self.codec)
+        os.makedirs(archive, exist_ok=True)
+        self.catalog = load_catalog(archive)
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_keys = set()
+        self.segment = None
+        segments = self.catalog["segments"]
+        if segments and not segments[-1]["sealed"] and segments[-1]["codec"] == self.codec:
+            self.open_segment(segments[-1])
+        self.last_time = segments[-1]["last"] if segments else None
+
+    def open_segment(self, entry):
+        """Continue an unsealed segment as of the last catalog save"""
+        self.segment = entry
+        base = os.path.join(self.archive, entry["name"])
+        self.blocks = read_table(base + ".blocks", BLOCK, entry["blocks"])
+        if "runs" in entry:
+            self.runs = [end for end, in read_table(base + ".runs", RUN, entry["runs"])]
+            self.keys = read_table(base + ".keys.runs", KEY, self.runs[-1] if self.runs else 0)
+        else:
+            # a single sorted .keys file, carried over as the first run
+            self.keys = read_table(base + ".keys", KEY)
+            self.runs = [len(self.keys)]
+            atomic_write(base + ".keys.runs", b"".join(KEY.pack(*key) for key in self.keys))
+            atomic_write(base + ".runs", RUN.pack(len(self.keys)))
+            entry["runs"] = 1
+        entry.setdefault("opened", time.time())
+        # drop what a crash left after the last catalog save, those records are
+        # not counted anywhere (and --docker resumes before them)
+        end = self.blocks[-1][0] + self.blocks[-1][1] if self.blocks else 0
+        truncate(base + self.extension, end)
+        truncate(base + ".blocks", len(self.blocks) * BLOCK.size)
+        truncate(base + ".keys.runs", len(self.keys) * KEY.size)
+        truncate(base + ".runs", len(self.runs) * RUN.size)
+
+    @property
+    def extension(self):
+        return ".log.zst" if self.segment["codec"] == "zstd" else ".log.zz"
+
+    def new_segment(self):
+        number = len(self.catalog["segments"]) + 1
+        entry = {"name": f"seg-{number:06d}", "codec": self.codec, "first": None, "last": None, "blocks": 0,
+                 "records": 0, "raw_bytes": 0, "stored_bytes": 0, "runs": 0, "opened": time.time(),
+                 "sealed": False}
+        # files a crash left before the catalog listed this segment would shift every offset
+        for name in os.listdir(self.archive):
+            if name.startswith(entry["name"] + "."):
+                os.remove(os.path.join(self.archive, name))
+        self.catalog["segments"].append(entry)
+        self.segment = entry
+        self.blocks = []
+        self.keys = []
+        self.runs = []
+
+    def add(self, timestamp, stream, text):
+        if timestamp is None:
+            timestamp = self.last_time or time.time()
+        self.last_time = max(self.last_time or timestamp, timestamp)
+        record = f"{timestamp:.6f}\t{stream or ''}\t{text}{RECORD_SEPARATOR}".encode("utf-8", errors="replace")
+        self.pending.append((timestamp, record))
+        self.pending_bytes += len(record)
+        self.pending_keys.update(index_keys(record_ids(text)))
+        if self.pending_bytes >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        """Compress the pending records into a block and update the segment index"""
+        if not self.pending:
+            return
+        if self.segment is None:
+            self.new_segment()
+        raw = b"".join(record for _, record in self.pending)
+        data = self.compress(raw)
+        first = min(timestamp for timestamp, _ in self.pending)
+        last = max(timestamp for timestamp, _ in self.pending)
+        base = os.path.join(self.archive, self.segment["name"])
+        offset = self.blocks[-1][0] + self.blocks[-1][1] if self.blocks else 0
+        append(base + self.extension, data)
+        block = (offset, len(data), len(raw), first, last)
+        run = sorted((key_hash(field, value), len(self.blocks)) for field, value in self.pending_keys)
+        append(base + ".blocks", BLOCK.pack(*block))
+        append(base + ".keys.runs", b"".join(KEY.pack(*key) for key in run))
+        append(base + ".runs", RUN.pack(len(self.keys) + len(run)))
+        self.blocks.append(block)
+        self.keys.extend(run)
+        self.runs.append(len(self.keys))
+
+        entry = self.segment
+        entry["first"] = first if entry["first"] is None else min(entry["first"], first)
+        entry["last"] = last if entry["last"] is None else max(entry["last"], last)
+        entry["blocks"] = len(self.blocks)
+        entry["records"] += len(self.pending)
+        entry["raw_bytes"] += len(raw)
+        entry["stored_bytes"] += len(data)
+        entry["runs"] = len(self.runs)
+        sealed = (entry["raw_bytes"] >= self.segment_size or len(self.runs) >= MAX_KEY_RUNS
+                  or time.time() - entry["opened"] >= self.segment_age)
+        if sealed:
+            self.keys.sort()
+            atomic_write(base + ".keys", b"".join(KEY.pack(*key) for key in self.keys))
+            entry["sealed"] = True
+            del entry["runs"], entry["opened"]
+            self.segment = None
+        self.save_catalog()
+        if sealed:
+            os.remove(base + ".keys.runs")
+            os.remove(base + ".runs")
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_keys = set()
+
+    def save_catalog(self):
+        atomic_write(os.path.join(self.archive, "catalog.json"),
+                     json.dumps(self.catalog, indent=1).encode("utf-8"))
+
+    def close(self):
+        self.flush()
+
+
+class SegmentReader:
+    """Block table and key index of one segment, read through mmap"""
+
+    def __init__(self, archive, entry):
+        self.entry = entry
+        base = os.path.join(archive, entry["name"])
+        self.data_path = base + (".log.zst" if entry["codec"] == "zstd" else ".log.zz")
+        # files of an open segment may already hold a block the catalog does not list yet
+        self.blocks = read_table(base + ".blocks", BLOCK, entry["blocks"])
+        if "runs" in entry:
+            self.keys_path = base + ".keys.runs"
+            ends = [end for end, in read_table(base + ".runs", RUN, entry["runs"])]
+            self.runs = [(start, end) for start, end in zip([0] + ends[:-1], ends) if end > start]
+        else:
+            self.keys_path = base + ".keys"
+            self.runs = [(0, os.path.getsize(self.keys_path) // KEY.size)]
+        self.decompress = decompressor(entry["codec"])
+
+    def blocks_with(self, hashes):
+        """Block numbers holding every one of the key hashes"""
+        result = None
+        if not any(end > start for start, end in self.runs):
+            return set()
+        with open(self.keys_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as keys:
+            view = KeyView(keys, self.runs[-1][1])
+            for wanted in hashes:
+                found = set()
+                for start, end in self.runs:
+                    index = bisect.bisect_left(view, wanted, start, end)
+                    while index < end:
+                        key, block = KEY.unpack_from(keys, index * KEY.size)
+                        if key != wanted:
+                            break
+                        found.add(block)
+                        index += 1
+                result = found if result is None else result & found
+                if not result:
+                    return set()
+        return result
+
+    def read_block(self, number):
+        offset, length, _, _, _ = self.blocks[number]
+        with open(self.data_path, "rb") as f:
+            f.seek(offset)
+            data = f.read(length)
+        try:
+            raw = self.decompress(data)
+            records = []
+            for chunk in raw.decode("utf-8", errors="replace").split(RECORD_SEPARATOR):
+                if chunk:
+                    timestamp, stream, text = chunk.split("\t", 2)
+                    records.append((float(timestamp), stream or None, text))
+        except (zlib.error, ValueError) + ZSTD_ERRORS as e:
+            raise RuntimeError(f"{self.data_path}: block {number} is corrupt ({e})")
+        return records
+
+
+class KeyView:
+    """Sequence of the hash column of a keys file, for bisect"""
+
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return KEY.unpack_from(self.buffer, index * KEY.size)[0]
+
+
+def search(archive, ids=(), since=None, until=None, grep=None, scan=False):
+    """Matching records in time order, plus (blocks read, blocks considered)
+
+    ids is a list of (field, value); a record matches when it mentions all
+    of them (and grep, a regex, if given). scan=True ignores the key index
+    and decompresses every block in the time range, for comparison.
+    """
+    catalog = load_catalog(archive)
+    pattern = re.compile(grep) if grep else None
+    hashes = [key_hash(field, value) for field, value in lookup_keys(ids)]
+    wanted = set(ids)
+    matches = []
+    read = considered = 0
+    for entry in catalog["segments"]:
+        if entry["first"] is None or (since and entry["last"] < since) or (until and entry["first"] > until):
+            continue
+        reader = SegmentReader(archive, entry)
+        in_range = [number for number, (_, _, _, first, last) in enumerate(reader.blocks)
+                    if not (since and last < since) and not (until and first > until)]
+        considered += len(in_range)
+        if hashes and not scan:
+            in_range = sorted(reader.blocks_with(hashes).intersection(in_range))
+        for number in in_range:
+            read += 1
+            for timestamp, stream, text in reader.read_block(number):
+                if (since and timestamp < since) or (until and timestamp > until):
+                    continue
+                if wanted and not (all(value in text for _, value in wanted) and wanted <= record_ids(text)):
+                    continue
+                if pattern and not pattern.search(text):
+                    continue
+                matches.append((timestamp, stream, text))
+    matches.sort(key=lambda record: record[0])
+    return matches, read, considered
+
+
+def docker_lines_since(container, since=None, follow=False):
+    """`docker logs -t` lines, starting after an epoch timestamp"""
+    command = ["docker", "logs", "-t"] + (["-f"] if follow else [])
+    if since:
+        command += ["--since", iso(since)]
+    process = subprocess.Popen(command + [container], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding="utf-8", errors="replace")
+    try:
+        yield from process.stdout
+    finally:
+        process.terminate()
+
+
+def with_ticks(lines, interval):
+    """Pass lines through, yielding None when interval passed without one (for flushing)"""
+    items = queue.Queue(maxsize=10000)
+
+    def reader():
+        for line in lines:
+            items.put(line)
+        items.put(StopIteration)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        try:
+            item = items.get(timeout=interval)
+        except queue.Empty:
+            yield None
+            continue
+        if item is StopIteration:
+            return
+        yield item
+
+
+def parse_time(text):
+    """Epoch seconds of a duration back from now (7d) or an ISO timestamp"""
+    try:
+        return time.time() - parse_duration(text)
+    except argparse.ArgumentTypeError:
+        pass
+    try:
+        value = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad time: {text} (7d, or 2026-01-31T12:00:00Z)")
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def ingest(args):
+    writer = ArchiveWriter(args.archive, args.block_size, args.segment_size, args.codec, args.segment_age)
+    resume = writer.last_time if args.docker else None
+
+    def sources():
+        if args.docker:
+            yield docker_lines_since(args.docker, resume, args.follow)
+        for path in args.paths or ([] if args.docker else ["-"]):
+            if path == "-":
+                yield sys.stdin
+            elif args.follow:
+                yield follow_file(path)
+            else:
+                yield iter_file_lines(path)
+
+    started = time.perf_counter()
+    records = skipped = 0
+    try:
+        for lines in sources():
+            if args.follow:
+                lines = with_ticks(lines, args.flush_interval)
+            for record in iter_records(lines):
+                if record is None:
+                    writer.flush()
+                    continue
+                timestamp = record[0]
+                if resume and timestamp is not None and timestamp <= resume:
+                    skipped += 1
+                    continue
+                writer.add(*record)
+                records += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    print(f"OK: {records} records archived in {elapsed:.1f}s"
+          + (f", {skipped} already archived" if skipped else "") + f" ({writer.codec})")
+    return 0
+
+
+def print_stats(archive):
+    catalog = load_catalog(archive)
+    segments = catalog["segments"]
+    if not segments:
+        print(f"no segments in {archive}")
+        return
+    print(f"{'segment':<12} {'codec':<5} {'first':<20} {'last':<20} {'blocks':>6} {'records':>9} "
+          f"{'raw':>10} {'stored':>10} {'ratio':>6} {'keys':>8}")
+    totals = [0, 0, 0, 0, 0]
+    for entry in segments:
+        keys_path = os.path.join(archive, entry["name"] + ".keys")
+        if "runs" in entry:
+            ends = read_table(os.path.join(archive, entry["name"] + ".runs"), RUN, entry["runs"])
+            keys = ends[-1][0] if ends else 0
+        else:
+            keys = os.path.getsize(keys_path) // KEY.size if os.path.exists(keys_path) else 0
+        ratio = entry["raw_bytes"] / entry["stored_bytes"] if entry["stored_bytes"] else 0
+        first = iso(entry["first"])[:19] if entry["first"] else "-"
+        last = iso(entry["last"])[:19] if entry["last"] else "-"
+        print(f"{entry['name']:<12} {entry['codec']:<5} {first:<20} {last:<20} {entry['blocks']:>6} "
+              f"{entry['records']:>9} {format_size(entry['raw_bytes']):>10} "
+              f"{format_size(entry['stored_bytes']):>10} {ratio:>5.1f}x {keys:>8}"
+              + ("" if entry["sealed"] else "  (open)"))
+        for index, value in enumerate((entry["blocks"], entry["records"], entry["raw_bytes"],
+                                       entry["stored_bytes"], keys)):
+            totals[index] += value
+    ratio = totals[2] / totals[3] if totals[3] else 0
+    print(f"{'total':<12} {'':<5} {'':<20} {'':<20} {totals[0]:>6} {totals[1]:>9} {format_size(totals[2]):>10} "
+          f"{format_size(totals[3]):>10} {ratio:>5.1f}x {totals[4]:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = sub.add_parser("ingest", help="archive log lines")
+    ingest_parser.add_argument("--archive", required=True, help="archive directory")
+    ingest_parser.add_argument("paths", nargs="*", help="log files, '-' for stdin")
+    ingest_parser.add_argument("--docker", metavar="CONTAINER", help="read `docker logs -t CONTAINER`")
+    ingest_parser.add_argument("--follow", action="store_true", help="keep reading new lines")
+    ingest_parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE,
+                               help="raw bytes per compressed block (default: %(default)s)")
+    ingest_parser.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE,
+                               help="raw bytes per segment file (default: %(default)s)")
+    ingest_parser.add_argument("--segment-age", type=parse_duration, default=DEFAULT_SEGMENT_AGE,
+                               help="seal a segment this long after it was started (default: 1d)")
+    ingest_parser.add_argument("--codec", choices=["zstd", "zlib"],
+                               help="block compression (default: zstd if installed, else zlib)")
+    ingest_parser.add_argument("--flush-interval", type=float, default=10,
+                               help="with --follow, seconds before a partial block is written (default: %(default)s)")
+
+    search_parser = sub.add_parser("search", help="find records by id, time range and regex")
+    search_parser.add_argument("--archive", required=True)
+    search_parser.add_argument("--request", help="requestId")
+    search_parser.add_argument("--user", help="userId")
+    search_parser.add_argument("--channel", help="channelId")
+    search_parser.add_argument("--since", type=parse_time, help="7d, 6h, or an ISO timestamp")
+    search_parser.add_argument("--until", type=parse_time, help="7d, 6h, or an ISO timestamp")
+    search_parser.add_argument("--grep", help="regex the record text must match")
+    search_parser.add_argument("--scan", action="store_true", help="ignore the index (linear scan, for comparison)")
+    search_parser.add_argument("--limit", type=int, default=0, help="print at most N records (newest)")
+    search_parser.add_argument("--json", action="store_true", help="one JSON object per record")
+
+    stats_parser = sub.add_parser("stats", help="segments, sizes and compression ratio")
+    stats_parser.add_argument("--archive", required=True)
+    args = parser.parse_args(argv)
+    if args.command == "ingest" and args.codec == "zstd" and zstandard is None:
+        parser.error("--codec zstd needs the zstandard package")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "ingest":
+        return ingest(args)
+    if args.command == "stats":
+        print_stats(args.archive)
+        return 0
+
+    ids = [(field, value) for field, value in
+           (("requestId", args.request), ("userId", args.user), ("channelId", args.channel)) if value]
+    if not ids and not args.grep and not args.since:
+        print("ERROR: give at least one of --request, --user, --channel, --grep or --since")
+        return 2
+    started = time.perf_counter()
+    try:
+        matches, read, considered = search(args.archive, ids, args.since, args.until, args.grep, args.scan)
+    except (OSError, RuntimeError, re.error) as e:
+        print(f"ERROR: {e}")
+        return 2
+    elapsed = (time.perf_counter() - started) * 1000
+    shown = matches[-args.limit:] if args.limit else matches
+    for timestamp, stream, text in shown:
+        if args.json:
+            print(json.dumps({"time": iso(timestamp), "stream": stream, "log": text}, ensure_ascii=False))
+        else:
+            print(f"{iso(timestamp)} {text}")
+    print(f"{len(matches)} records, {read}/{considered} blocks decompressed in {elapsed:.1f} ms",
+          file=sys.stderr)
+    return 0 if matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
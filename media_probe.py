@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Cached ffprobe metadata for every clip in the storage tree
+
+`scan` walks the storage root and runs ffprobe (the same stream fields
+getVideoInfo/getAudioInfo in backend/src/utils/ffmpegUtils.ts read) on a
+bounded pool of at most -j concurrent processes. Results are cached in
+SQLite keyed by (path, size, mtime), so a re-scan only probes new or
+changed files; entries for files that disappeared are dropped and the
+cache is capped at --max-entries by evicting the least recently used.
+`query` aggregates duration and size per kind/channel/codec/resolution
+straight from the cache.
+
+Examples:
+  python3 media_probe.py scan /volume1/docker/shortsai/backend/storage -j 4
+  python3 media_probe.py query --kind inbox --by resolution
+  python3 media_probe.py query --by codec --json
+  python3 media_probe.py scan /tmp/storage --ffprobe "python3 fake_ffprobe.py"
+"""
+import argparse
+import json
+import os
+import shlex
+import sqlite3
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ops_common import format_size
+from storage_index import VIDEO_EXTENSIONS, classify, print_rows
+
+DEFAULT_DB = os.path.expanduser("~/.shortsai_media_probe.sqlite")
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".wav")
+MEDIA_EXTENSIONS = VIDEO_EXTENSIONS + AUDIO_EXTENSIONS
+PROBE_ENTRIES = ("format=duration,bit_rate:"
+                 "stream=codec_type,codec_name,width,height,r_frame_rate,duration,bit_rate")
+PROBE_TIMEOUT = 60
+GROUP_COLUMNS = {
+    "kind": ["kind"],
+    "channel": ["user_key", "channel_key"],
+    "codec": ["video_codec", "audio_codec"],
+    "resolution": ["width", "height"],
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS probes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    user_key TEXT,
+    channel_key TEXT,
+    kind TEXT,
+    duration REAL,
+    width INTEGER,
+    height INTEGER,
+    fps REAL,
+    video_codec TEXT,
+    audio_codec TEXT,
+    bit_rate INTEGER,
+    error TEXT,
+    probed_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS probes_used ON probes(used_at);
+"""
+
+
+def parse_probe(data):
+    """Flat metadata dict from ffprobe JSON, following getVideoInfo/getAudioInfo"""
+    streams = data.get("streams") or []
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    main = video or audio or {}
+    fps = None
+    if video and video.get("r_frame_rate"):
+        num, _, den = video["r_frame_rate"].partition("/")
+        try:
+            fps = float(num) / float(den or 1) if float(den or 1) else None
+        except ValueError:
+            fps = None
+    duration = main.get("duration") or (data.get("format") or {}).get("duration")
+    bit_rate = (data.get("format") or {}).get("bit_rate") or main.get("bit_rate")
+    return {
+        "duration": float(duration) if duration not in (None, "N/A") else None,
+        "width": int(video["width"]) if video and video.get("width") else None,
+        "height": int(video["height"]) if video and video.get("height") else None,
+        "fps": fps,
+        "video_codec": video.get("codec_name") if video else None,
+        "audio_codec": audio.get("codec_name") if audio else None,
+        "bit_rate": int(bit_rate) if bit_rate not in (None, "N/A") else None,
+    }
+
+
+def run_ffprobe(ffprobe, path, timeout=PROBE_TIMEOUT):
+    """(metadata dict, error or None) of one file"""
+    command = ffprobe + ["-v", "error", "-show_entries", PROBE_ENTRIES, "-of", "json", path]
+    try:
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True,
+                                timeout=timeout, text=True, errors="replace")
+    except subprocess.TimeoutExpired:
+        return {}, f"timeout after {timeout}s"
+    except OSError as e:
+        return {}, f"cannot run {ffprobe[0]}: {e}"
+    if result.returncode != 0:
+        return {}, (result.stderr.strip().splitlines() or [f"exit code {result.returncode}"])[-1]
+    try:
+        return parse_probe(json.loads(result.stdout)), None
+    except (ValueError, KeyError, TypeError) as e:
+        return {}, f"unreadable ffprobe output: {e}"
+
+
+def walk_media(root):
+    """(relative path, size, mtime_ns) of media files under root"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, PermissionError):
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and entry.name.lower().endswith(MEDIA_EXTENSIONS):
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                yield os.path.relpath(entry.path, root).replace(os.sep, "/"), stat.st_size, stat.st_mtime_ns
+
+
+class ProbeCache:
+    """SQLite cache of probe results with LRU eviction"""
+
+    def __init__(self, db_path, max_entries=500000):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self.max_entries = max_entries
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def fingerprints(self, root):
+        prefix = root.rstrip("/") + "/"
+        rows = self.db.execute("SELECT path, size, mtime_ns FROM probes WHERE path >= ? AND path < ?",
+                               (prefix, root.rstrip("/") + "0"))
+        return {path: (size, mtime) for path, size, mtime in rows}
+
+    def store(self, path, size, mtime_ns, relpath, metadata, error):
+        now = time.time()
+        _, user_key, channel_key, kind, _ = classify(relpath)
+        self.db.execute(
+            "INSERT OR REPLACE INTO probes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (path, size, mtime_ns, user_key, channel_key, kind, metadata.get("duration"),
+             metadata.get("width"), metadata.get("height"), metadata.get("fps"),
+             metadata.get("video_codec"), metadata.get("audio_codec"), metadata.get("bit_rate"),
+             error, now, now))
+
+    def touch(self, paths):
+        now = time.time()
+        self.db.executemany("UPDATE probes SET used_at = ? WHERE path = ?", ((now, path) for path in paths))
+
+    def forget(self, paths):
+        self.db.executemany("DELETE FROM probes WHERE path = ?", ((path,) for path in paths))
+
+    def evict(self):
+        """Drop least recently used entries beyond max_entries, returns how many"""
+        count = self.db.execute("SELECT COUNT(*) FROM probes").fetchone()[0]
+        excess = count - self.max_entries
+        if excess <= 0:
+            return 0
+        self.db.execute("DELETE FROM probes WHERE path IN "
+                        "(SELECT path FROM probes ORDER BY used_at LIMIT ?)", (excess,))
+        return excess
+
+    def query(self, by="kind", kind=None, channel=None):
+        columns = GROUP_COLUMNS[by]
+        conditions, params = ["error IS NULL"], []
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if channel:
+            conditions.append("(channel_key = ? OR channel_key LIKE ? ESCAPE '\\')")
+            params += [channel, "%\\_\\_" + channel.replace("_", "\\_").replace("%", "\\%")]
+        group = ", ".join(columns)
+        rows = self.db.execute(
+            f"SELECT {group}, COUNT(*), COALESCE(SUM(duration), 0), SUM(size), AVG(fps) FROM probes "
+            f"WHERE {' AND '.join(conditions)} GROUP BY {group} ORDER BY SUM(duration) DESC",
+            params).fetchall()
+        return [dict(zip(columns, row[:len(columns)]),
+                     files=row[-4], hours=round(row[-3] / 3600, 2), bytes=row[-2],
+                     avgFps=round(row[-1], 2) if row[-1] else None)
+                for row in rows]
+
+    def errors(self, limit=50):
+        rows = self.db.execute("SELECT path, error FROM probes WHERE error IS NOT NULL "
+                               "ORDER BY probed_at DESC LIMIT ?", (limit,))
+        return [{"path": path, "error": error} for path, error in rows]
+
+
+def scan(cache, root, ffprobe, workers=4, timeout=PROBE_TIMEOUT, progress=None):
+    """Probe new or changed media under root, returns statistics"""
+    started = time.perf_counter()
+    root = os.path.abspath(root)
+    known = cache.fingerprints(root)
+    todo, hits = [], []
+    for relpath, size, mtime in walk_media(root):
+        path = os.path.join(root, relpath)
+        if known.pop(path, None) == (size, mtime):
+            hits.append(path)
+        else:
+            todo.append((path, size, mtime, relpath))
+    walked = time.perf_counter()
+    cache.touch(hits)
+    cache.forget(known)
+
+    probed = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_ffprobe, ffprobe, item[0], timeout): item for item in todo}
+        for future in as_completed(futures):
+            path, size, mtime, relpath = futures[future]
+            metadata, error = future.result()
+            cache.store(path, size, mtime, relpath, metadata, error)
+            probed += 1
+            failed += error is not None
+            if progress and probed % 200 == 0:
+                progress(probed, len(todo))
+    evicted = cache.evict()
+    cache.db.commit()
+    return {"files": len(hits) + len(todo), "cached": len(hits), "probed": probed, "failed": failed,
+            "removed": len(known), "evicted": evicted, "walk_seconds": walked - started,
+            "seconds": time.perf_counter() - started}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB, help="cache file (default: %(default)s)")
+    parser.add_argument("--max-entries", type=int, default=500000, help="LRU cap of the cache")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan_parser = commands.add_parser("scan", parents=[output], help="probe new/changed files under a root")
+    scan_parser.add_argument("root", help="storage root")
+    scan_parser.add_argument("-j", "--workers", type=int, default=4, help="concurrent ffprobe processes")
+    scan_parser.add_argument("--ffprobe", default=os.environ.get("FFPROBE", "ffprobe"),
+                             help="ffprobe command (default: $FFPROBE or ffprobe)")
+    scan_parser.add_argument("--timeout", type=float, default=PROBE_TIMEOUT, help="seconds per file")
+
+    query = commands.add_parser("query", parents=[output], help="aggregate cached metadata")
+    query.add_argument("--by", choices=sorted(GROUP_COLUMNS), default="kind")
+    query.add_argument("--kind", help="only inbox, uploaded, ...")
+    query.add_argument("--channel", help="only this channelId or channel folder key")
+
+    errors = commands.add_parser("errors", parents=[output], help="files ffprobe could not read")
+    errors.add_argument("--limit", type=int, default=50)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    cache = ProbeCache(args.db, args.max_entries)
+    try:
+        if args.command == "scan":
+            if not os.path.isdir(args.root):
+                print(f"ERROR: {args.root} is not a directory")
+                return 2
+            stats = scan(cache, args.root, shlex.split(args.ffprobe), args.workers, args.timeout,
+                         progress=None if args.json else
+                         lambda done, total: print(f"  probed {done}/{total}", flush=True))
+            if args.json:
+                print(json.dumps(stats))
+            else:
+                print(f"OK: {stats['files']} files, {stats['cached']} cached, {stats['probed']} probed "
+                      f"({stats['failed']} failed), {stats['removed']} removed, {stats['evicted']} evicted "
+                      f"in {stats['seconds']:.2f}s")
+            return 0
+
+        if args.command == "query":
+            result = cache.query(args.by, args.kind, args.channel)
+            columns = GROUP_COLUMNS[args.by] + ["files", "hours", "bytes", "avgFps"]
+        else:
+            result = cache.errors(args.limit)
+            columns = ["path", "error"]
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print_rows(result, columns)
+            if args.command == "query":
+                total = sum(row["hours"] for row in result)
+                print(f"\ntotal: {sum(row['files'] for row in result)} files, {total:.2f} h, "
+                      f"{format_size(sum(row['bytes'] for row in result))}")
+        return 0
+    finally:
+        cache.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Collect backend metrics into a fixed-size round-robin store, query them, show a dashboard
+
+run polls /api/diag/buildinfo and /api/diag/storage on one keep-alive
+connection, and the backend container's cgroup files: CPU usage and
+throttling, memory, pids, block I/O, OOM kills. This is what `docker stats`
+reads, cgroup v2 or v1. Every sample goes into each archive of the store
+(RRDtool style):
+
+  10s x 360    last hour at full resolution
+  1m  x 1440   last day
+  10m x 1008   last week
+  1h  x 8760   last year
+
+Each archive is a numpy memmap of rows [bucket time, avg..., max...,
+count...]. A sample updates the row of its bucket in place, with a running
+average, the maximum and the sample count, so memory and disk use never
+grow. A row older than one archive lap is overwritten. query and dashboard
+read the same files while run is writing them, from another process.
+Counters are stored as rates: CPU in cores, I/O in bytes/s, and restarts
+(buildId or hostname changed) and OOM kills per sample.
+
+A sample costs two small HTTP requests and a handful of file reads every
+--interval seconds. collector_cpu records what the collector itself uses.
+
+--fake runs against a local diag_mock_server.py and a fake cgroup v2
+directory whose counters move like a busy backend, to try everything
+offline.
+
+Examples:
+  python3 metrics_collector.py run --db /volume1/docker/shortsai/metrics \\
+      --api http://127.0.0.1:3000 --container shortsai-backend
+  python3 metrics_collector.py run --db /tmp/metrics --fake --interval 1
+  python3 metrics_collector.py dashboard --db /tmp/metrics --since 1h [--watch 5]
+  python3 metrics_collector.py query --db /tmp/metrics mem_bytes --since 1d --max [--json]
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from ops_common import DEFAULT_TOKEN_FILE, format_size, instance_key, parse_duration, read_token
+
+# name, unit, description
+METRICS = [
+    ("api_up", "bool", "buildinfo answered 200"),
+    ("buildinfo_ms", "ms", "buildinfo latency"),
+    ("storage_ms", "ms", "storage latency"),
+    ("storage_ok", "bool", "storage root exists and is writable"),
+    ("restarts", "count", "buildId/hostname changed since the previous sample"),
+    ("cpu_cores", "cores", "CPU used by the container"),
+    ("cpu_throttled", "ratio", "share of the time the container was throttled"),
+    ("mem_bytes", "bytes", "container memory"),
+    ("mem_ratio", "ratio", "memory / limit"),
+    ("pids", "count", "processes in the container"),
+    ("io_read_bps", "bytes/s", "block device reads"),
+    ("io_write_bps", "bytes/s", "block device writes"),
+    ("oom_kills", "count", "OOM kills since the previous sample"),
+    ("collector_cpu", "ratio", "CPU used by this collector"),
+]
+METRIC_NAMES = [name for name, _, _ in METRICS]
+DEFAULT_ARCHIVES = "10s:360,1m:1440,10m:1008,1h:8760"
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def parse_archives(text):
+    """"10s:360,1m:1440" -> [(10, 360), (60, 1440)], finest first"""
+    archives = []
+    for spec in text.split(","):
+        step, _, rows = spec.partition(":")
+        archives.append((int(parse_duration(step)), int(rows)))
+    return sorted(archives)
+
+
+class Store:
+    """Round-robin archives of METRICS, one memmap file per archive"""
+
+    def __init__(self, path, archives=None, metrics=METRIC_NAMES, create=False):
+        self.path = path
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            wanted = {"metrics": list(metrics), "archives": [list(a) for a in archives]} if archives else None
+            if create and wanted and (meta["metrics"] != wanted["metrics"] or meta["archives"] != wanted["archives"]):
+                raise ValueError(f"{path} was created with other metrics or archives, use --reset to recreate it")
+        elif create:
+            os.makedirs(path, exist_ok=True)
+            meta = {"version": 1, "metrics": list(metrics), "archives": [list(a) for a in archives]}
+            for step, rows in archives:
+                array = np.lib.format.open_memmap(self.archive_path(step), mode="w+", dtype=np.float64,
+                                                  shape=(rows, 1 + 3 * len(metrics)))
+                array[:, 0] = np.nan
+                array.flush()
+                del array
+            with open(meta_path + ".tmp", "w") as f:
+                json.dump(meta, f)
+            os.replace(meta_path + ".tmp", meta_path)
+        else:
+            raise FileNotFoundError(f"no metrics store in {path}")
+        self.metrics = meta["metrics"]
+        self.archives = [tuple(a) for a in meta["archives"]]
+        self.arrays = [np.load(self.archive_path(step), mmap_mode="r+" if create else "r")
+                       for step, _ in self.archives]
+
+    def archive_path(self, step):
+        return os.path.join(self.path, f"rra-{step}s.npy")
+
+    def record(self, t, values):
+        """Add one sample (a list aligned with metrics, NaN for missing) at time t"""
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        m = len(self.metrics)
+        for (step, rows), array in zip(self.archives, self.arrays):
+            bucket = t - t % step
+            row = array[int(bucket // step) % rows]
+            if row[0] != bucket:
+                row[0] = bucket
+                row[1:] = np.nan
+                row[1 + 2 * m:] = 0
+            avg, peak, count = row[1:1 + m], row[1 + m:1 + 2 * m], row[1 + 2 * m:]
+            count[present] += 1
+            first = present & (count == 1)
+            avg[first] = values[first]
+            peak[first] = values[first]
+            more = present & (count > 1)
+            avg[more] += (values[more] - avg[more]) / count[more]
+            peak[more] = np.maximum(peak[more], values[more])
+
+    def flush(self):
+        for array in self.arrays:
+            array.flush()
+
+    def pick_archive(self, start, now):
+        """Finest archive still holding data back to start"""
+        for index, (step, rows) in enumerate(self.archives):
+            if now - start <= step * rows:
+                return index
+        return len(self.archives) - 1
+
+    def query(self, metric, start, end, peak=False, archive=None):
+        """(times, values, step) of one metric between start and end, oldest first"""
+        index = self.pick_archive(start, end) if archive is None else archive
+        step, _ = self.archives[index]
+        array = np.asarray(self.arrays[index])
+        m = len(self.metrics)
+        column = self.metrics.index(metric)
+        times = array[:, 0]
+        mask = (times >= start - start % step) & (times <= end)
+        rows = array[mask]
+        rows = rows[np.argsort(rows[:, 0])]
+        values = rows[:, 1 + (m if peak else 0) + column].copy()
+        values[rows[:, 1 + 2 * m + column] == 0] = np.nan
+        return rows[:, 0], values, step
+
+    def latest(self):
+        """{metric: last value} from the finest archive"""
+        array = np.asarray(self.arrays[0])
+        m = len(self.metrics)
+        order = np.argsort(np.nan_to_num(array[:, 0], nan=-1))[::-1]
+        result = {}
+        for row in array[order]:
+            if np.isnan(row[0]):
+                break
+            for column, name in enumerate(self.metrics):
+                if name not in result and row[1 + 2 * m + column] > 0:
+                    result[name] = (row[0], row[1 + column])
+            if len(result) == m:
+                break
+        return result
+
+
+def read_number(path):
+    try:
+        with open(path) as f:
+            text = f.read().strip()
+    except OSError:
+        return None
+    if text == "max":
+        return math.inf
+    try:
+        return float(text.split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def read_keyed(path):
+    """"key value" lines -> dict"""
+    result = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    try:
+                        result[parts[0]] = float(parts[1])
+                    except ValueError:
+                        pass
+    except OSError:
+        pass
+    return result
+
+
+class Cgroup:
+    """Cumulative counters and gauges of one container cgroup (v2 or v1)"""
+
+    def __init__(self, path, v1_subpath=""):
+        self.path = path
+        self.v1 = os.path.isdir(os.path.join(path, "memory")) and not os.path.exists(os.path.join(path, "cpu.stat"))
+        self.v1_subpath = v1_subpath
+
+    def file(self, controller, name):
+        if self.v1:
+            return os.path.join(self.path, controller, self.v1_subpath, name)
+        return os.path.join(self.path, name)
+
+    def read(self):
+        """{name: value}; cpu_usec, throttled_usec, io_* and oom_kills are cumulative"""
+        if self.v1:
+            cpu = read_number(self.file("cpuacct", "cpuacct.usage"))
+            stat = read_keyed(self.file("cpu", "cpu.stat"))
+            memory = read_number(self.file("memory", "memory.usage_in_bytes"))
+            limit = read_number(self.file("memory", "memory.limit_in_bytes"))
+            oom = read_keyed(self.file("memory", "memory.oom_control")).get("oom_kill")
+            pids = read_number(self.file("pids", "pids.current"))
+            io_read = io_write = None
+            try:
+                with open(self.file("blkio", "blkio.throttle.io_service_bytes")) as f:
+                    io_read = io_write = 0.0
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) == 3 and parts[1] == "Read":
+                            io_read += float(parts[2])
+                        elif len(parts) == 3 and parts[1] == "Write":
+                            io_write += float(parts[2])
+            except OSError:
+                pass
+            return {"cpu_usec": cpu / 1000 if cpu is not None else None,
+                    "throttled_usec": stat["throttled_time"] / 1000 if "throttled_time" in stat else None,
+                    "mem_bytes": memory, "mem_limit": limit if limit and limit < 2 ** 60 else None,
+                    "pids": pids, "io_read": io_read, "io_write": io_write, "oom_kills": oom}
+        stat = read_keyed(self.file("cpu", "cpu.stat"))
+        io_read = io_write = None
+        try:
+            with open(self.file("io", "io.stat")) as f:
+                io_read = io_write = 0.0
+                for line in f:
+                    for field in line.split()[1:]:
+                        key, _, value = field.partition("=")
+                        if key == "rbytes":
+                            io_read += float(value)
+                        elif key == "wbytes":
+                            io_write += float(value)
+        except OSError:
+            pass
+        limit = read_number(self.file("memory", "memory.max"))
+        return {"cpu_usec": stat.get("usage_usec"), "throttled_usec": stat.get("throttled_usec"),
+                "mem_bytes": read_number(self.file("memory", "memory.current")),
+                "mem_limit": limit if limit and limit != math.inf else None,
+                "pids": read_number(self.file("pids", "pids.current")),
+                "io_read": io_read, "io_write": io_write,
+                "oom_kills": read_keyed(self.file("memory", "memory.events")).get("oom_kill")}
+
+
+def find_cgroup(container, root="/sys/fs/cgroup"):
+    """Cgroup of a running docker container, returns (path, v1 subpath)"""
+    result = subprocess.run(["docker", "inspect", "-f", "{{.Id}}", container], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"docker inspect {container}: {result.stderr.strip()}")
+    container_id = result.stdout.strip()
+    for candidate in (f"system.slice/docker-{container_id}.scope", f"docker/{container_id}"):
+        if os.path.exists(os.path.join(root, candidate, "cpu.stat")):
+            return os.path.join(root, candidate), ""
+    if os.path.isdir(os.path.join(root, "memory", "docker", container_id)):
+        return root, f"docker/{container_id}"
+    raise RuntimeError(f"no cgroup found for container {container_id[:12]} under {root}")
+
+
+class Api:
+    """Keep-alive client for the two diag endpoints"""
+
+    def __init__(self, base_url, token=None, timeout=5):
+        url = urlsplit(base_url)
+        self.https = url.scheme == "https"
+        self.host = url.hostname
+        self.port = url.port or (443 if self.https else 80)
+        self.prefix = url.path.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.conn = None
+
+    def get(self, path, auth=False):
+        """(status, parsed JSON or None, milliseconds); status None on connection errors"""
+        headers = {"Accept": "application/json"}
+        if auth and self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        started = time.perf_counter()
+        for attempt in range(2):
+            if self.conn is None:
+                connection = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+                self.conn = connection(self.host, self.port, timeout=self.timeout)
+            try:
+                self.conn.request("GET", self.prefix + path, headers=headers)
+                response = self.conn.getresponse()
+                body = response.read()
+                if response.will_close:
+                    self.close()
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = None
+                return response.status, data, (time.perf_counter() - started) * 1000
+            except (OSError, http.client.HTTPException):
+                self.close()
+                if attempt:
+                    return None, None, (time.perf_counter() - started) * 1000
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class Collector:
+    """Turns API answers and cgroup counters into one METRICS sample"""
+
+    def __init__(self, api, cgroup):
+        self.api = api
+        self.cgroup = cgroup
+        self.previous = None
+        self.build = None
+
+    def sample(self):
+        now = time.time()
+        values = dict.fromkeys(METRIC_NAMES, math.nan)
+        if self.api:
+            status, info, ms = self.api.get("/api/diag/buildinfo")
+            values["api_up"] = 1.0 if status == 200 else 0.0
+            if status == 200 and info:
+                values["buildinfo_ms"] = ms
+                build = instance_key(info)
+                values["restarts"] = float(self.build is not None and build != self.build)
+                self.build = build
+            if self.api.token:
+                status, info, ms = self.api.get("/api/diag/storage", auth=True)
+                if status == 200 and info:
+                    values["storage_ms"] = ms
+                    storage = info.get("storage", {})
+                    values["storage_ok"] = float(bool(storage.get("exists") and storage.get("writable")))
+        counters = self.cgroup.read() if self.cgroup else {}
+        if counters.get("mem_bytes") is not None:
+            values["mem_bytes"] = counters["mem_bytes"]
+            if counters.get("mem_limit"):
+                values["mem_ratio"] = counters["mem_bytes"] / counters["mem_limit"]
+        if counters.get("pids") is not None:
+            values["pids"] = counters["pids"]
+        cpu = time.process_time()
+        if self.previous is not None:
+            then, then_cpu, before = self.previous
+            elapsed = max(now - then, 1e-6)
+
+            def rate(key, scale=1.0):
+                if counters.get(key) is None or before.get(key) is None or counters[key] < before[key]:
+                    return math.nan
+                return (counters[key] - before[key]) * scale / elapsed
+
+            values["cpu_cores"] = rate("cpu_usec", 1e-6)
+            values["cpu_throttled"] = rate("throttled_usec", 1e-6)
+            values["io_read_bps"] = rate("io_read")
+            values["io_write_bps"] = rate("io_write")
+            if counters.get("oom_kills") is not None and before.get("oom_kills") is not None:
+                values["oom_kills"] = max(counters["oom_kills"] - before["oom_kills"], 0)
+            # from the end of the previous sample, so this sample's requests and reads count
+            values["collector_cpu"] = (cpu - then_cpu) / elapsed
+        self.previous = (now, cpu, counters)
+        return now, [values[name] for name in METRIC_NAMES]
+
+
+class FakeCgroup:
+    """cgroup v2 files whose counters move like a busy backend"""
+
+    def __init__(self, path, limit=1024 ** 3):
+        self.path = path
+        self.limit = limit
+        self.cpu = self.throttled = self.read = self.written = 0.0
+        self.memory = 300e6
+        self.oom = 0
+        self.last = time.time()
+        os.makedirs(path, exist_ok=True)
+        self.write("memory.max", str(limit))
+        self.tick()
+
+    def write(self, name, text):
+        temp = os.path.join(self.path, f".{name}.tmp")
+        with open(temp, "w") as f:
+            f.write(text)
+        os.replace(temp, os.path.join(self.path, name))
+
+    def tick(self):
+        now = time.time()
+        elapsed, self.last = now - self.last, now
+        load = 0.3 + 0.25 * math.sin(now / 60) + random.uniform(0, 0.3)
+        self.cpu += elapsed * load * 1e6
+        if load > 0.7:
+            self.throttled += elapsed * (load - 0.7) * 1e6
+        self.memory = min(max(self.memory + random.gauss(0, 5e6), 150e6), self.limit)
+        self.read += elapsed * random.uniform(0, 2e6)
+        self.written += elapsed * random.uniform(0, 5e5)
+        if self.memory >= self.limit * 0.99:
+            self.oom += 1
+            self.memory = 300e6
+        self.write("cpu.stat", f"usage_usec {int(self.cpu)}\nuser_usec {int(self.cpu * 0.8)}\n"
+                               f"system_usec {int(self.cpu * 0.2)}\nnr_periods 0\nnr_throttled 0\n"
+                               f"throttled_usec {int(self.throttled)}\n")
+        self.write("memory.current", f"{int(self.memory)}\n")
+        self.write("memory.events", f"low 0\nhigh 0\nmax 0\noom {self.oom}\noom_kill {self.oom}\n")
+        self.write("pids.current", f"{random.randint(20, 30)}\n")
+        self.write("io.stat", f"8:0 rbytes={int(self.read)} wbytes={int(self.written)} rios=0 wios=0\n")
+
+
+def format_value(value, unit):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "-"
+    if unit == "bytes":
+        return format_size(value)
+    if unit == "bytes/s":
+        return f"{format_size(value)}/s"
+    if unit == "ms":
+        return f"{value:.1f}ms"
+    if unit == "ratio":
+        return f"{value * 100:.1f}%"
+    if unit == "cores":
+        return f"{value:.2f}"
+    return f"{value:g}" if value == int(value) else f"{value:.2f}"
+
+
+def sparkline(values, width):
+    """Unicode bar chart of values resampled to width columns, blanks for gaps"""
+    if len(values) == 0:
+        return ""
+    bins = np.array_split(values, min(width, len(values)))
+    means = np.array([np.nanmean(b) if np.any(~np.isnan(b)) else np.nan for b in bins])
+    valid = means[~np.isnan(means)]
+    if len(valid) == 0:
+        return " " * len(means)
+    low, high = valid.min(), valid.max()
+    span = high - low or 1.0
+    return "".join(" " if np.isnan(v) else SPARK[min(int((v - low) / span * len(SPARK)), len(SPARK) - 1)]
+                   for v in means)
+
+
+def dashboard(store, since, width=40):
+    now = time.time()
+    latest = store.latest()
+    units = {name: unit for name, unit, _ in METRICS}
+    lines = []
+    first = next(iter(latest.values()), (None,))[0]
+    stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(first)) if first else "no data"
+    index = store.pick_archive(now - since, now)
+    lines.append(f"last sample {stamp}, range {format_duration(since)} "
+                 f"at {format_duration(store.archives[index][0])} resolution")
+    lines.append(f"{'metric':<14} {'last':>10} {'min':>10} {'avg':>10} {'max':>10}  trend")
+    for name in store.metrics:
+        unit = units.get(name, "")
+        _, avg, _ = store.query(name, now - since, now, archive=index)
+        _, peak, _ = store.query(name, now - since, now, peak=True, archive=index)
+        has = np.any(~np.isnan(avg))
+        low = float(np.nanmin(avg)) if has else math.nan
+        mean = float(np.nanmean(avg)) if has else math.nan
+        high = float(np.nanmax(peak)) if has else math.nan
+        last = latest.get(name, (None, math.nan))[1]
+        lines.append(f"{name:<14} {format_value(last, unit):>10} {format_value(low, unit):>10} "
+                     f"{format_value(mean, unit):>10} {format_value(high, unit):>10}  {sparkline(avg, width)}")
+    return "\n".join(lines)
+
+
+def format_duration(seconds):
+    for unit, size in (("d", 86400), ("h", 3600), ("m", 60)):
+        if seconds >= size and seconds % size == 0:
+            return f"{int(seconds // size)}{unit}"
+    return f"{seconds:g}s"
+
+
+def run(args):
+    archives = parse_archives(args.archives)
+    if args.reset and os.path.exists(args.db):
+        shutil.rmtree(args.db)
+    try:
+        store = Store(args.db, archives, create=True)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 2
+
+    server = fake = None
+    workdir = None
+    api_url, cgroup = args.api, None
+    token = read_token(args.token, args.token_file)
+    if args.fake:
+        from diag_mock_server import start_mock_server
+        server = start_mock_server()
+        api_url, token = server.url, token or "metrics"
+        workdir = tempfile.mkdtemp(prefix="fake-cgroup-")
+        fake = FakeCgroup(workdir)
+        cgroup = Cgroup(workdir)
+    elif args.cgroup:
+        cgroup = Cgroup(args.cgroup, args.cgroup_subpath or "")
+    elif args.container:
+        try:
+            cgroup = Cgroup(*find_cgroup(args.container, args.cgroup_root))
+        except (RuntimeError, OSError) as e:
+            print(f"ERROR: {e}")
+            return 2
+    api = Api(api_url, token) if api_url else None
+    collector = Collector(api, cgroup)
+    print(f"collecting every {args.interval:g}s into {args.db}: api {api_url or '-'}"
+          f"{' (+storage)' if token else ''}, cgroup {cgroup.path if cgroup else '-'}"
+          f"{' (v1)' if cgroup and cgroup.v1 else ''}", flush=True)
+
+    stop = threading.Event()
+    deadline = time.monotonic() + args.duration if args.duration else None
+    samples = 0
+    last_flush = time.monotonic()
+    try:
+        while not stop.is_set():
+            if fake:
+                fake.tick()
+            t, values = collector.sample()
+            store.record(t, values)
+            samples += 1
+            if time.monotonic() - last_flush >= args.flush_every:
+                store.flush()
+                last_flush = time.monotonic()
+            if args.once or (deadline and time.monotonic() >= deadline):
+                break
+            # sleep to the next multiple of the interval so samples line up with buckets
+            stop.wait(args.interval - time.time() % args.interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.flush()
+        if api:
+            api.close()
+        if server:
+            server.shutdown()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print(f"OK: {samples} samples written to {args.db}")
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="collect samples until interrupted")
+    run_parser.add_argument("--db", required=True, help="store directory")
+    run_parser.add_argument("--api", help="backend base URL, e.g. http://127.0.0.1:3000")
+    run_parser.add_argument("--token", help="Bearer token for /api/diag/storage (default: $DIAG_TOKEN or --token-file)")
+    run_parser.add_argument("--token-file", default=DEFAULT_TOKEN_FILE)
+    run_parser.add_argument("--container", help="docker container whose cgroup to read")
+    run_parser.add_argument("--cgroup", help="cgroup directory (v2), or the v1 hierarchy root with --cgroup-subpath")
+    run_parser.add_argument("--cgroup-subpath", help="v1: container path inside each controller, e.g. docker/ID")
+    run_parser.add_argument("--cgroup-root", default="/sys/fs/cgroup", help="where --container is looked up")
+    run_parser.add_argument("--interval", type=float, default=10, help="seconds between samples (default: %(default)s)")
+    run_parser.add_argument("--archives", default=DEFAULT_ARCHIVES,
+                            help="STEP:ROWS list, finest first (default: %(default)s)")
+    run_parser.add_argument("--flush-every", type=float, default=60, help="seconds between msyncs")
+    run_parser.add_argument("--duration", type=parse_duration, help="stop after this long")
+    run_parser.add_argument("--once", action="store_true", help="take one sample and exit (cron mode)")
+    run_parser.add_argument("--reset", action="store_true", help="recreate the store")
+    run_parser.add_argument("--fake", action="store_true", help="use a local mock server and fake cgroup files")
+
+    query_parser = sub.add_parser("query", help="print one metric over a time range")
+    query_parser.add_argument("--db", required=True)
+    query_parser.add_argument("metric", choices=METRIC_NAMES)
+    query_parser.add_argument("--since", type=parse_duration, default=3600, help="range back from now (default: 1h)")
+    query_parser.add_argument("--until", type=parse_duration, default=0, help="end of range back from now")
+    query_parser.add_argument("--max", action="store_true", help="per-bucket maximum instead of average")
+    query_parser.add_argument("--json", action="store_true")
+
+    dash_parser = sub.add_parser("dashboard", help="text dashboard of every metric")
+    dash_parser.add_argument("--db", required=True)
+    dash_parser.add_argument("--since", type=parse_duration, default=3600, help="range back from now (default: 1h)")
+    dash_parser.add_argument("--width", type=int, default=40, help="trend column width")
+    dash_parser.add_argument("--watch", type=float, help="redraw every N seconds")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "run":
+        return run(args)
+    try:
+        store = Store(args.db)
+    except FileNotFoundError as e:
+        print(f"ERROR: {e}")
+        return 2
+    if args.command == "query":
+        now = time.time()
+        times, values, step = store.query(args.metric, now - args.since, now - args.until, peak=args.max)
+        if args.json:
+            print(json.dumps({"metric": args.metric, "step": step, "points": [
+                [int(t), None if math.isnan(v) else v] for t, v in zip(times, values)]}))
+            return 0
+        unit = dict((name, unit) for name, unit, _ in METRICS)[args.metric]
+        for t, v in zip(times, values):
+            print(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))}  {format_value(v, unit)}")
+        print(f"{len(times)} points at {format_duration(step)}")
+        return 0
+    while True:
+        text = dashboard(store, args.since, args.width)
+        if not args.watch:
+            print(text)
+            return 0
+        print("\033[2J\033[H" + text, flush=True)
+        try:
+            time.sleep(args.watch)
+        except KeyboardInterrupt:
+            return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Helpers shared by the ops scripts
+
+Size and duration parsing/formatting, the latency histogram, the diag API
+token lookup and backend buildinfo, kept here so a script only imports
+what it uses instead of another tool's whole module (and its imports).
+
+Examples:
+  from ops_common import format_size, parse_duration
+  format_size(1536)          # "1.5KB"
+  parse_duration("10m")      # 600.0
+"""
+import argparse
+import json
+import math
+import os
+import re
+import urllib.request
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+PERCENTILES = (50, 90, 95, 99, 99.9)
+DEFAULT_TOKEN_FILE = os.path.expanduser("~/.shortsai_token")
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(size) < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024
+    return f"{size:.1f}TB"
+
+
+def parse_size(text):
+    """Bytes of "4096", "4K", "1.5M" or "2GB"; raises ArgumentTypeError"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)B?", text.strip().upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad size: {text}")
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_duration(text):
+    """Seconds of "90", "90s", "10m", "6h", "7d" or "2w"; raises ArgumentTypeError"""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([smhdw]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad duration: {text} (e.g. 90s, 10m, 6h, 7d)")
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
+
+
+def read_token(token, token_file):
+    if token:
+        return token.strip()
+    if os.environ.get("DIAG_TOKEN"):
+        return os.environ["DIAG_TOKEN"].strip()
+    if token_file and os.path.exists(token_file):
+        with open(token_file, "r", encoding="utf-8") as f:
+            return f.read().strip()
+    return None
+
+
+def fetch_buildinfo(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+def instance_key(info):
+    """(buildId, hostname) identifying one backend container
+
+    startedAt is not usable: diagRoutes.ts falls back to the current time on
+    every request unless STARTED_AT is set, and likewise buildId to
+    "manual-<now>" without BUILD_ID. The hostname is the container id, which
+    changes whenever compose recreates the container.
+    """
+    build_id = info.get("buildId")
+    if isinstance(build_id, str) and build_id.startswith("manual-"):
+        build_id = None
+    return build_id, info.get("hostname")
+
+
+class Histogram:
+    """Log-linear latency histogram in microseconds (HDR-style)
+
+    Values below 2**bits are exact; above that each power of two is split in
+    2**(bits-1) buckets, so memory is fixed and relative error <= 2**(1-bits).
+    """
+
+    def __init__(self, bits=7, max_value_us=1 << 36):
+        self.bits = bits
+        self.half = 1 << (bits - 1)
+        self.max_value = max_value_us
+        self.counts = [0] * (self._index(max_value_us) + 1)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def _index(self, value):
+        shift = max(0, value.bit_length() - self.bits)
+        return shift * self.half + (value >> shift)
+
+    def _value(self, index):
+        """Midpoint of the bucket at index"""
+        if index < 2 * self.half:
+            return index
+        shift = index // self.half - 1
+        mantissa = index - shift * self.half
+        return ((mantissa << shift) + ((mantissa + 1) << shift) - 1) // 2
+
+    def record(self, value_us):
+        value = min(max(0, int(value_us)), self.max_value)
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+
+    def percentile(self, percent):
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percent / 100 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value(index), self.max)
+        return self.max
+
+    def summary_ms(self):
+        return {
+            "count": self.total,
+            "min_ms": (self.min or 0) / 1000,
+            "mean_ms": self.sum / self.total / 1000 if self.total else 0.0,
+            "max_ms": self.max / 1000,
+            **{f"p{p:g}_ms": self.percentile(p) / 1000 for p in PERCENTILES},
+        }
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Span timing and counters for the ops scripts, written as a Chrome trace
+
+Scripts mark the steps worth seeing and count what they move:
+
+  with ops_trace.span("encode", file=path):
+      ...
+  ops_trace.count("bytes_sent", len(data))
+
+Nothing is recorded until tracing is switched on, which the scripts do
+from their --trace/--profile flags (see add_arguments and tracing):
+
+  --trace out.json   trace-event JSON, open in chrome://tracing or
+                     https://ui.perfetto.dev; spans per thread plus counter
+                     tracks, and one span per subprocess (ssh calls, with
+                     the command in the args)
+  --profile out.prof cProfile of the main thread, for python3 -m pstats
+
+When tracing is on the script also prints the slowest span names and the
+counter totals at exit.
+
+Usage: python3 ops_trace.py out.json   (prints the summary of a saved trace)
+"""
+import argparse
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """Collects trace events from every thread of the process"""
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.threads = {}
+
+    def now(self):
+        """Microseconds since the tracer was created"""
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def tid(self):
+        ident = threading.get_ident()
+        with self.lock:
+            if ident not in self.threads:
+                self.threads[ident] = len(self.threads) + 1
+                self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid,
+                                    "tid": self.threads[ident], "args": {"name": threading.current_thread().name}})
+            return self.threads[ident]
+
+    def complete(self, name, cat, start, end, args=None, tid=None):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": round(start, 1), "dur": round(end - start, 1),
+                 "pid": self.pid, "tid": tid or self.tid()}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def count(self, name, value=1):
+        tid = self.tid()
+        with self.lock:
+            total = self.counters[name] = self.counters.get(name, 0) + value
+            self.events.append({"name": name, "ph": "C", "ts": round(self.now(), 1), "pid": self.pid,
+                                "tid": tid, "args": {name: total}})
+
+    def instant(self, name, args=None):
+        event = {"name": name, "ph": "i", "s": "t", "ts": round(self.now(), 1), "pid": self.pid, "tid": self.tid()}
+        if args:
+            event["args"] = args
+        with self.lock:
+            self.events.append(event)
+
+    def write(self, path):
+        with self.lock:
+            document = {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                        "otherData": {"argv": sys.argv, "counters": dict(self.counters)}}
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+
+
+TRACER = Tracer()
+
+
+class Span:
+    """Context manager timing one step; extra args land in the trace event"""
+
+    def __init__(self, name, cat, args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = TRACER.now()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = f"{exc_type.__name__}: {exc}"
+        TRACER.complete(self.name, self.cat, self.start, TRACER.now(), self.args)
+
+    def set(self, **args):
+        """Add args known only once the step ran (status, bytes, ...)"""
+        self.args.update(args)
+
+
+class _NoSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(name, cat="ops", **args):
+    """Time a block: with span("encode", file=path) as s: ... s.set(bytes=n)"""
+    if not TRACER.enabled:
+        return NO_SPAN
+    return Span(name, cat, args)
+
+
+def count(name, value=1):
+    """Add value to a counter (bytes_sent, retries, ...)"""
+    if TRACER.enabled:
+        TRACER.count(name, value)
+
+
+def instant(name, **args):
+    """Mark a point in time (a retry, a reconnect)"""
+    if TRACER.enabled:
+        TRACER.instant(name, args)
+
+
+def enabled():
+    return TRACER.enabled
+
+
+def command_name(args):
+    """Short label for a subprocess: the program, or its first word for shell strings"""
+    if isinstance(args, (str, bytes)):
+        text = os.fsdecode(args).split(None, 1)
+        return os.path.basename(text[0]) if text else "sh"
+    args = list(args)
+    return os.path.basename(os.fsdecode(args[0])) if args else "?"
+
+
+class TracedPopen(subprocess.Popen):
+    """subprocess.Popen that records one span per child process"""
+
+    def __init__(self, args, *rest, **kwargs):
+        self._trace_start = TRACER.now()
+        self._trace_tid = TRACER.tid()
+        command = args if isinstance(args, (str, bytes)) else " ".join(os.fsdecode(a) for a in args)
+        command = os.fsdecode(command)
+        self._trace_args = {"command": command[:300] + ("..." if len(command) > 300 else ""),
+                            "command_bytes": len(command)}
+        TRACER.count("subprocesses")
+        TRACER.count("command_bytes", len(command))
+        super().__init__(args, *rest, **kwargs)
+
+    def _trace_done(self):
+        if self.returncode is not None and self._trace_start is not None:
+            self._trace_args["exit"] = self.returncode
+            TRACER.complete(f"subprocess {command_name(self.args)}", "subprocess", self._trace_start,
+                            TRACER.now(), self._trace_args, self._trace_tid)
+            self._trace_start = None
+
+    def wait(self, timeout=None):
+        code = super().wait(timeout)
+        self._trace_done()
+        return code
+
+    def poll(self):
+        code = super().poll()
+        self._trace_done()
+        return code
+
+
+def add_arguments(parser):
+    """Add --trace and --profile to an argparse parser"""
+    group = parser.add_argument_group("tracing")
+    group.add_argument("--trace", metavar="FILE", help="write a Chrome/Perfetto trace of the run to FILE")
+    group.add_argument("--profile", metavar="FILE", help="write a cProfile dump of the main thread to FILE")
+    return parser
+
+
+@contextmanager
+def tracing(trace_path=None, profile_path=None, name=None):
+    """Record spans, counters and subprocesses for the duration of the block
+
+    Does nothing when neither path is given. On exit writes the trace and
+    the profile and prints a summary. name labels the root span.
+    """
+    if not trace_path and not profile_path:
+        yield
+        return
+    profiler = cProfile.Profile() if profile_path else None
+    original_popen = subprocess.Popen
+    TRACER.enabled = True
+    subprocess.Popen = TracedPopen
+    if profiler:
+        profiler.enable()
+    try:
+        with span(name or os.path.basename(sys.argv[0]) or "main", cat="main"):
+            yield
+    finally:
+        if profiler:
+            profiler.disable()
+        subprocess.Popen = original_popen
+        TRACER.enabled = False
+        print_summary(TRACER.events, TRACER.counters)
+        if trace_path:
+            TRACER.write(trace_path)
+            print(f"OK: trace written to {trace_path} (open in https://ui.perfetto.dev)")
+        if profiler:
+            profiler.dump_stats(profile_path)
+            print(f"OK: profile written to {profile_path} (python3 -m pstats {profile_path})")
+
+
+def summarize(events):
+    """{span name: [count, total us, max us]} over the complete events"""
+    totals = {}
+    for event in events:
+        if event.get("ph") != "X":
+            continue
+        entry = totals.setdefault(event["name"], [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += event["dur"]
+        entry[2] = max(entry[2], event["dur"])
+    return totals
+
+
+def print_summary(events, counters, limit=15):
+    totals = summarize(events)
+    print("\n=== Trace ===")
+    print(f"{'span':<40} {'count':>6} {'total ms':>10} {'max ms':>9}")
+    for name, (number, total, longest) in sorted(totals.items(), key=lambda item: -item[1][1])[:limit]:
+        print(f"{name[:40]:<40} {number:>6} {total / 1e3:>10.1f} {longest / 1e3:>9.1f}")
+    if counters:
+        print(", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("trace", help="trace JSON written by --trace")
+    parser.add_argument("--limit", type=int, default=30, help="span names to show (default: %(default)s)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with open(args.trace, encoding="utf-8") as f:
+        document = json.load(f)
+    events = document["traceEvents"] if isinstance(document, dict) else document
+    counters = document.get("otherData", {}).get("counters", {}) if isinstance(document, dict) else {}
+    print_summary(events, counters, args.limit)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
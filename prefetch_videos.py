@@ -0,0 +1,518 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Prefetch source videos into channel inboxes with parallel HTTP Range segments
+
+videoDownloadService.ts, urlDownloader.ts and getvideoParser.ts fetch each
+video as one sequential stream inside the API container. This tool fetches
+the same URLs from outside it: a 1-byte Range probe learns the size and
+validator (ETag or Last-Modified), then the file is split into
+--segment-size pieces that -c connections download at once. Each piece is
+written at its offset with pwrite.
+
+  resume     data goes to a hidden .{name}.part file next to the target and
+             the finished segments to .{name}.part.json; a rerun skips them
+             as long as the size and validator still match. Every range
+             request sends If-Range, so a file that changed on the server
+             fails instead of mixing old and new bytes
+  pooling    keep-alive connections per host, at most --per-host open at a
+             time, reused across segments and files (redirects resolved once)
+  bandwidth  --limit-rate caps the total over all connections
+  fallback   servers without Range support get one plain GET
+
+A finished file is renamed into place, so fs_watch-based tools (inbox_worker)
+see it complete. The target is the path StorageService.resolveInboxPath
+builds:
+
+  {videosRoot}/users/{userFolderKey}/channels/{channelFolderKey}/inbox/{videoId}.mp4
+
+videosRoot is derived from --root the way StorageService treats
+STORAGE_ROOT. Folder keys are given directly (--user-key emailSlug__userId)
+or found from the ids among existing folders (--user ID). Without a videoId
+one is generated like fileUtils.generateVideoId. Only the file is written;
+the Firestore record and inbox .json metadata stay with the backend.
+
+Examples:
+  python3 prefetch_videos.py --user USER_ID --channel CHANNEL_ID https://cdn.example.com/a.mp4
+  python3 prefetch_videos.py --user-key me-at-x-com__U1 --channel-key main__C1 --list urls.txt -c 16
+  python3 prefetch_videos.py --list urls.txt --user U1 --channel C1 --limit-rate 20M
+  python3 prefetch_videos.py -o /tmp/clip.mp4 http://127.0.0.1:7777/api/media/clip --single   # one stream
+"""
+import argparse
+import http.client
+import json
+import os
+import queue
+import random
+import string
+import sys
+import threading
+import time
+from urllib.parse import urljoin, urlsplit
+
+import ops_trace
+from ops_common import format_size, parse_size
+from storage_index import DEFAULT_ROOT
+
+USER_AGENT = "shortsai-prefetch/1.0"
+MAX_REDIRECTS = 5
+READ_SIZE = 64 * 1024
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+
+class DownloadError(Exception):
+    """A download that cannot complete (HTTP error, changed file, short body)"""
+
+
+def videos_root(storage_root):
+    """videosRoot the way the StorageService constructor derives it from STORAGE_ROOT"""
+    root = storage_root.rstrip("/")
+    return root if root.endswith("videos") else os.path.join(root, "videos")
+
+
+def find_folder_key(parent, entity_id, kind):
+    """The existing '{slug}__{id}' folder under parent"""
+    try:
+        matches = sorted(name for name in os.listdir(parent) if name.endswith(f"__{entity_id}"))
+    except FileNotFoundError:
+        matches = []
+    if len(matches) != 1:
+        found = "no" if not matches else f"{len(matches)}"
+        raise DownloadError(f"{found} {kind} folders for {entity_id} in {parent}, pass --{kind}-key")
+    return matches[0]
+
+
+def inbox_path(videos, user_key, channel_key, video_id):
+    """StorageService.resolveInboxPath"""
+    name = video_id if video_id.endswith(".mp4") else f"{video_id}.mp4"
+    return os.path.join(videos, "users", user_key, "channels", channel_key, "inbox", name)
+
+
+def generate_video_id():
+    """fileUtils.generateVideoId: {ms timestamp}_{8 base36 chars}"""
+    return f"{int(time.time() * 1000)}_{''.join(random.choices(string.ascii_lowercase + string.digits, k=8))}"
+
+
+class RateLimiter:
+    """Byte budget shared by all connections, rate bytes/s (0 = unlimited)"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next_free = time.monotonic()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            # idle time earns at most a quarter second of burst
+            self.next_free = max(self.next_free, now - 0.25) + amount / self.rate
+            delay = self.next_free - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class HostPool:
+    """Keep-alive connections per (scheme, host), at most per_host in use at once"""
+
+    def __init__(self, per_host, timeout):
+        self.per_host = per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.slots = {}
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self, origin):
+        with self.lock:
+            slot = self.slots.setdefault(origin, threading.BoundedSemaphore(self.per_host))
+        slot.acquire()
+        with self.lock:
+            idle = self.idle.setdefault(origin, [])
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.opened += 1
+        ops_trace.count("connections")
+        scheme, netloc = origin
+        factory = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return factory(netloc, timeout=self.timeout)
+
+    def release(self, origin, connection, reuse):
+        if reuse:
+            with self.lock:
+                self.idle[origin].append(connection)
+        else:
+            connection.close()
+        self.slots[origin].release()
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+def fetch(pool, url, headers, handle):
+    """GET url through the pool, following redirects; returns handle(response, final_url)
+
+    The connection goes back to the pool only if handle read the whole body.
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise DownloadError(f"unsupported URL: {url}")
+        origin = (parts.scheme, parts.netloc)
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        connection = pool.acquire(origin)
+        response = None
+        try:
+            connection.request("GET", target, headers={"User-Agent": USER_AGENT, **headers})
+            response = connection.getresponse()
+            location = response.getheader("Location")
+            if response.status in REDIRECT_STATUSES and location:
+                response.read()
+                url = urljoin(url, location)
+                continue
+            if response.status >= 400 and response.status != 416:
+                response.read(READ_SIZE)
+                raise DownloadError(f"HTTP {response.status} {response.reason} for {url}")
+            return handle(response, url)
+        finally:
+            pool.release(origin, connection, response is not None and response.isclosed())
+    raise DownloadError(f"more than {MAX_REDIRECTS} redirects for {url}")
+
+
+def validator_of(response):
+    """Strong ETag, else Last-Modified: what If-Range accepts"""
+    etag = response.getheader("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.getheader("Last-Modified")
+
+
+def probe(pool, url):
+    """(final url, size or None, validator, supports ranges) from a bytes=0-0 request"""
+    def handle(response, final_url):
+        if response.status in (206, 416):
+            response.read()
+            total = response.getheader("Content-Range", "").rpartition("/")[2]
+            if total.isdigit():
+                return final_url, int(total), validator_of(response), True
+            return final_url, None, None, False
+        # 200: no Range support; the body stays unread and the connection is dropped
+        length = response.getheader("Content-Length")
+        return final_url, int(length) if length and length.isdigit() else None, None, False
+    return fetch(pool, url, {"Range": "bytes=0-0"}, handle)
+
+
+class Download:
+    """One URL fetched into dest through a .part file and its .part.json state"""
+
+    def __init__(self, url, dest):
+        self.url = url
+        self.source = url
+        self.dest = dest
+        directory, name = os.path.split(dest)
+        self.part = os.path.join(directory, f".{name}.part")
+        self.state_path = self.part + ".json"
+        self.size = None
+        self.validator = None
+        self.ranges = False
+        self.segment_size = 0
+        self.segments = 1
+        self.done = set()
+        self.fd = None
+        self.received = 0
+        self.resumed = 0
+        self.error = None
+        self.started = None
+        self.lock = threading.Lock()
+
+    def prepare(self, pool, segment_size, single):
+        """Probe the URL, open the .part file; returns the segment indexes still to fetch"""
+        with ops_trace.span("probe", url=self.source):
+            self.url, self.size, self.validator, self.ranges = probe(pool, self.source)
+        if self.ranges and self.size:
+            self.segment_size = self.size if single else min(segment_size, self.size)
+            self.segments = -(-self.size // self.segment_size)
+        elif self.ranges:
+            self.segments = 0
+        state = self.load_state()
+        if state and self.ranges and state.get("size") == self.size and state.get("validator") == self.validator \
+                and state.get("segmentSize") == self.segment_size and os.path.exists(self.part):
+            self.done = set(state["done"])
+            self.resumed = sum(self.segment_length(index) for index in self.done)
+        os.makedirs(os.path.dirname(self.dest) or ".", exist_ok=True)
+        self.fd = os.open(self.part, os.O_RDWR | os.O_CREAT | (0 if self.done else os.O_TRUNC), 0o644)
+        if self.size:
+            os.ftruncate(self.fd, self.size)
+        self.save_state()
+        return [index for index in range(self.segments) if index not in self.done]
+
+    def segment_length(self, index):
+        return min(self.segment_size, self.size - index * self.segment_size)
+
+    def load_state(self):
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_state(self):
+        if not self.ranges:
+            return
+        state = {"url": self.source, "size": self.size, "validator": self.validator,
+                 "segmentSize": self.segment_size, "done": sorted(self.done)}
+        temp = self.state_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(temp, self.state_path)
+
+    def fetch_segment(self, pool, limiter, index):
+        """Download one segment (or the whole body without Range support) into the .part file"""
+        if self.ranges:
+            start = index * self.segment_size
+            end = start + self.segment_length(index) - 1
+            headers = {"Range": f"bytes={start}-{end}"}
+            if self.validator:
+                headers["If-Range"] = self.validator
+        else:
+            start, end, headers = 0, None, {}
+
+        with self.lock:
+            self.started = self.started or time.monotonic()
+
+        def handle(response, _):
+            if self.ranges and response.status != 206:
+                changed = " (changed on the server, rerun to start over)" if response.status == 200 else ""
+                raise DownloadError(f"HTTP {response.status} for bytes {start}-{end} of {self.source}{changed}")
+            offset = start
+            while True:
+                data = response.read(READ_SIZE)
+                if not data:
+                    break
+                limiter.consume(len(data))
+                os.pwrite(self.fd, data, offset)
+                offset += len(data)
+                with self.lock:
+                    self.received += len(data)
+                ops_trace.count("bytes_received", len(data))
+            if end is not None and offset != end + 1:
+                raise http.client.IncompleteRead(b"", end + 1 - offset)
+            if end is None:
+                self.size = offset
+            return offset - start
+
+        with ops_trace.span("segment", url=self.source, index=index) as span:
+            span.set(bytes=fetch(pool, self.url, headers, handle))
+
+    def segment_done(self, index):
+        """Record a finished segment; True when it was the last one"""
+        os.fsync(self.fd)
+        with self.lock:
+            self.done.add(index)
+            self.save_state()
+            return len(self.done) == self.segments
+
+    def finish(self):
+        os.close(self.fd)
+        self.fd = None
+        if self.size is not None and os.path.getsize(self.part) != self.size:
+            raise DownloadError(f"{self.part} has {os.path.getsize(self.part)} bytes, expected {self.size}")
+        os.replace(self.part, self.dest)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def fail(self, error):
+        with self.lock:
+            if self.error is None:
+                self.error = error
+
+    def abandon(self):
+        """Close a failed download once no thread writes to it; keeps resumable parts"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if not self.ranges and os.path.exists(self.part):
+            os.remove(self.part)
+
+
+def run_downloads(downloads, tasks, pool, limiter, connections, retries, backoff=0.5):
+    """Work through (download, segment) tasks on connections threads"""
+    def worker():
+        while True:
+            try:
+                download, index = tasks.get_nowait()
+            except queue.Empty:
+                return
+            for attempt in range(retries + 1):
+                if download.error is not None:
+                    break
+                try:
+                    download.fetch_segment(pool, limiter, index)
+                except DownloadError as e:
+                    download.fail(e)
+                    break
+                except (OSError, http.client.HTTPException) as e:
+                    if attempt == retries:
+                        download.fail(DownloadError(f"segment {index} of {download.source}: {e!r}"))
+                        break
+                    ops_trace.count("retries")
+                    time.sleep(backoff * 2 ** attempt)
+                    continue
+                if download.segment_done(index):
+                    try:
+                        download.finish()
+                        report_done(download)
+                    except (OSError, DownloadError) as e:
+                        download.fail(e)
+                break
+
+    threads = [threading.Thread(target=worker, name=f"segment-{n}", daemon=True) for n in range(connections)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def report_done(download):
+    seconds = time.monotonic() - (download.started or time.monotonic())
+    fetched = download.received
+    note = f", resumed after {format_size(download.resumed)}" if download.resumed else ""
+    mode = f"{download.segments} segments" if download.ranges else "no Range support, one stream"
+    print(f"OK: {download.dest} {format_size(download.size or 0)} in {seconds:.2f}s "
+          f"({format_size(int(fetched / max(seconds, 1e-6)))}/s, {mode}{note})", flush=True)
+
+
+def read_list(path):
+    """[(url, video_id or None)] from a file of 'URL [videoId]' lines"""
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            fields = line.split()
+            if fields and not fields[0].startswith("#"):
+                entries.append((fields[0], fields[1] if len(fields) > 1 else None))
+    return entries
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("urls", nargs="*", help="video URLs")
+    parser.add_argument("--list", metavar="FILE", help="file with one 'URL [videoId]' per line")
+    parser.add_argument("--root", default=os.environ.get("STORAGE_ROOT", DEFAULT_ROOT),
+                        help="STORAGE_ROOT on this machine (default: $STORAGE_ROOT or %(default)s)")
+    parser.add_argument("--user", metavar="USER_ID", help="user id, its folder is looked up under --root")
+    parser.add_argument("--user-key", metavar="KEY", help="user folder key (emailSlug__userId)")
+    parser.add_argument("--channel", metavar="CHANNEL_ID", help="channel id, its folder is looked up")
+    parser.add_argument("--channel-key", metavar="KEY", help="channel folder key (channelSlug__channelId)")
+    parser.add_argument("--video-id", help="file name for a single URL (default: generated)")
+    parser.add_argument("-o", "--output", help="write a single URL here instead of a channel inbox")
+    parser.add_argument("-c", "--connections", type=int, default=8,
+                        help="segments downloaded at once over all files (default: %(default)s)")
+    parser.add_argument("--per-host", type=int, default=4, help="connections per host (default: %(default)s)")
+    parser.add_argument("--segment-size", type=parse_size, default=4 * 1024 * 1024,
+                        help="bytes per Range request, e.g. 8M (default: 4M)")
+    parser.add_argument("--single", action="store_true",
+                        help="one request per file, like the backend (still resumable as a whole)")
+    parser.add_argument("--limit-rate", type=parse_size, default=0, help="total bytes/s, e.g. 20M (default: none)")
+    parser.add_argument("--retries", type=int, default=3, help="retries per segment (default: %(default)s)")
+    parser.add_argument("--timeout", type=float, default=30, help="socket timeout, seconds (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="download even if the target exists")
+    parser.add_argument("--report", type=float, default=5, help="progress line every N seconds, 0 = off")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def resolve_targets(args):
+    """[(url, destination path)] for the command line"""
+    entries = [(url, args.video_id) for url in args.urls]
+    if args.list:
+        entries += read_list(args.list)
+    if not entries:
+        raise DownloadError("no URLs given")
+    if (args.output or args.video_id) and len(entries) > 1:
+        raise DownloadError("--output and --video-id need exactly one URL")
+    if args.output:
+        return [(entries[0][0], os.path.abspath(args.output))]
+    videos = videos_root(args.root)
+    users = os.path.join(videos, "users")
+    if not (args.user_key or args.user) or not (args.channel_key or args.channel):
+        raise DownloadError("give --user/--user-key and --channel/--channel-key (or --output)")
+    user_key = args.user_key or find_folder_key(users, args.user, "user")
+    channels = os.path.join(users, user_key, "channels")
+    channel_key = args.channel_key or find_folder_key(channels, args.channel, "channel")
+    return [(url, inbox_path(videos, user_key, channel_key, video_id or generate_video_id()))
+            for url, video_id in entries]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        targets = resolve_targets(args)
+    except DownloadError as e:
+        print(f"ERROR: {e}")
+        return 2
+
+    pool = HostPool(args.per_host, args.timeout)
+    limiter = RateLimiter(args.limit_rate)
+    downloads = []
+    tasks = queue.Queue()
+    failures = 0
+    started = time.monotonic()
+    with ops_trace.tracing(args.trace, args.profile):
+        for url, dest in targets:
+            if os.path.exists(dest) and not args.force:
+                print(f"exists, skipped: {dest}")
+                continue
+            download = Download(url, dest)
+            try:
+                todo = download.prepare(pool, args.segment_size, args.single)
+            except (OSError, http.client.HTTPException, DownloadError) as e:
+                print(f"ERROR: {url}: {e}")
+                failures += 1
+                continue
+            downloads.append(download)
+            if not todo:
+                download.finish()
+                report_done(download)
+            for index in todo:
+                tasks.put((download, index))
+
+        threads = run_downloads(downloads, tasks, pool, limiter, args.connections, args.retries)
+        last_report = time.monotonic()
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.2)
+                    if args.report and time.monotonic() - last_report >= args.report:
+                        last_report = time.monotonic()
+                        received = sum(download.received for download in downloads)
+                        total = sum(download.size or 0 for download in downloads)
+                        have = received + sum(download.resumed for download in downloads)
+                        print(f"  {format_size(have)} of {format_size(total)}, "
+                              f"{format_size(int(received / (last_report - started)))}/s", flush=True)
+        except KeyboardInterrupt:
+            print("\ninterrupted, rerun to resume")
+            return 130
+        finally:
+            pool.close()
+
+    for download in downloads:
+        if download.error is not None:
+            download.abandon()
+            print(f"ERROR: {download.source}: {download.error}")
+            failures += 1
+    seconds = time.monotonic() - started
+    received = sum(download.received for download in downloads)
+    completed = sum(1 for download in downloads if download.error is None)
+    print(f"\n{completed} downloaded, {failures} failed: "
+          f"{format_size(received)} in {seconds:.2f}s ({format_size(int(received / max(seconds, 1e-6)))}/s), "
+          f"{pool.opened} connections opened, {pool.reused} reused")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
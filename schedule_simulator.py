@@ -0,0 +1,436 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Replay a week of auto-send cron ticks offline and report load peaks
+
+Mirrors backend/src/services/autoSendScheduler.ts:
+- processAutoSendTick runs every minute ("* * * * *") and walks channels
+  with autoSendEnabled, skipping owners whose schedule settings have
+  isAutomationPaused;
+- shouldRunScheduleNow fires an enabled schedule when the channel-local
+  day (getLocalTimeInTimezone) is in daysOfWeek and the local minute is
+  within +-1 of "HH:MM", once per local day thanks to lastRunAt - so a
+  schedule really fires on the first tick of its window, one minute early;
+- each firing sends promptsPerRun prompts one after another (1s apart) and,
+  with autoDownloadToDriveEnabled, schedules one download per prompt after
+  getAutoDownloadDelayMinutesForChannel: the owner's minInterval for the
+  server-local hour (00-13, 13-17, 17-24) minus 1, clamped to 1..60.
+  The channel's own autoDownloadDelayMinutes is not used by the backend;
+  --use-channel-delay models it instead.
+
+Channels with the same (timezone, time, days, delay settings) behave the
+same, so they are collapsed into slot keys and the fire matrix is computed
+with NumPy over keys x minutes of the week. Tens of thousands of channels
+run in a few seconds.
+
+Snapshot JSON (a channels export with owner ids, plus optional user settings):
+  {"channels": [{"id": "...", "ownerId": "...", "timezone": "Europe/Moscow",
+                 "autoSendEnabled": true, "autoDownloadToDriveEnabled": true,
+                 "autoDownloadDelayMinutes": 10,
+                 "autoSendSchedules": [{"id": "s1", "enabled": true, "daysOfWeek": [1,2,3,4,5],
+                                        "time": "09:00", "promptsPerRun": 2}]}],
+   "users": {"<ownerId>": {"isAutomationPaused": false, "minInterval_00_13": 11,
+                           "minInterval_13_17": 11, "minInterval_17_24": 11}}}
+
+Examples:
+  python3 schedule_simulator.py snapshot.json
+  python3 schedule_simulator.py snapshot.json --download-minutes 4 --send-seconds 8 --top 20 --json
+  python3 schedule_simulator.py --generate 30000 --write-snapshot /tmp/snapshot.json
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import numpy as np
+
+WEEK_MINUTES = 7 * 1440
+OFFSET_STEP = 15
+FIRE_CHUNK = 2048
+DEFAULT_INTERVAL = 11
+TIME_RE = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+def parse_time(value):
+    """Minute of day of "HH:MM", None if invalid (parseTime)"""
+    match = TIME_RE.match(value or "")
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), int(match.group(2))
+    if hour > 23 or minute > 59:
+        return None
+    return hour * 60 + minute
+
+
+def download_delays(settings):
+    """Delay in minutes for each server-local hour 0..23 (getAutoDownloadDelayMinutesForChannel)"""
+    fallback = settings.get("minIntervalMinutes", DEFAULT_INTERVAL)
+    delays = []
+    for hour in range(24):
+        key = "minInterval_00_13" if hour < 13 else "minInterval_13_17" if hour < 17 else "minInterval_17_24"
+        value = settings.get(key)
+        interval = value if isinstance(value, (int, float)) else fallback
+        delays.append(int(min(60, max(1, interval - 1))))
+    return tuple(delays)
+
+
+def load_snapshot(paths):
+    """Merge snapshot files into (channels, users)
+
+    Plain channel exports (version/exportedAt/channels, no ownerId) get one
+    owner per file so pauses can still be keyed by file name.
+    """
+    channels, users = [], {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            data = {"channels": data}
+        for index, channel in enumerate(data.get("channels") or []):
+            channel = dict(channel)
+            channel.setdefault("ownerId", path)
+            channel.setdefault("id", f"{path}#{index}")
+            channels.append(channel)
+        users.update(data.get("users") or {})
+    return channels, users
+
+
+def build_slots(channels, users, use_channel_delay=False):
+    """Collapse schedules into slot keys, returns (slots, skipped counts)
+
+    A slot is (timezone, minute of day, days bitmask, delays per hour,
+    auto-download) -> [schedules, prompts, downloads].
+    """
+    slots = {}
+    skipped = {"disabledChannel": 0, "pausedOwner": 0, "disabledSchedule": 0, "invalidTime": 0,
+               "invalidTimezone": 0, "noDays": 0}
+    delay_cache = {}
+    for channel in channels:
+        if channel.get("autoSendEnabled") is not True or not isinstance(channel.get("autoSendSchedules"), list):
+            skipped["disabledChannel"] += 1
+            continue
+        owner = users.get(channel.get("ownerId"), {})
+        if owner.get("isAutomationPaused") is True or channel.get("isAutomationPaused") is True:
+            skipped["pausedOwner"] += 1
+            continue
+        zone = channel.get("timezone") or "UTC"
+        if use_channel_delay:
+            delay = int(channel.get("autoDownloadDelayMinutes") or 10)
+            delays = (min(60, max(1, delay)),) * 24
+        else:
+            owner_key = channel.get("ownerId")
+            if owner_key not in delay_cache:
+                delay_cache[owner_key] = download_delays(owner)
+            delays = delay_cache[owner_key]
+        download = channel.get("autoDownloadToDriveEnabled") is True
+        for schedule in channel["autoSendSchedules"]:
+            if not schedule.get("enabled"):
+                skipped["disabledSchedule"] += 1
+                continue
+            minute = parse_time(schedule.get("time"))
+            if minute is None:
+                skipped["invalidTime"] += 1
+                continue
+            mask = 0
+            for day in schedule.get("daysOfWeek") or []:
+                if isinstance(day, int) and 0 <= day <= 6:
+                    mask |= 1 << day
+            if not mask:
+                skipped["noDays"] += 1
+                continue
+            prompts = int(schedule.get("promptsPerRun") or 0)
+            entry = slots.setdefault((zone, minute, mask, delays, download), [0, 0, 0])
+            entry[0] += 1
+            entry[1] += prompts
+            entry[2] += prompts if download else 0
+    return slots, skipped
+
+
+def local_clock(zone, start):
+    """(date id, minute of day, day of week) arrays for every minute of the week in zone"""
+    tz = ZoneInfo(zone)
+    steps = WEEK_MINUTES // OFFSET_STEP
+    offsets = np.array([
+        (start + timedelta(minutes=step * OFFSET_STEP)).astimezone(tz).utcoffset().total_seconds() // 60
+        for step in range(steps)], dtype=np.int64)
+    base = int(start.timestamp() // 60)
+    local = base + np.arange(WEEK_MINUTES, dtype=np.int64) + np.repeat(offsets, OFFSET_STEP)
+    date_id = local // 1440
+    # 1970-01-01 was a Thursday (day 4, Sunday = 0)
+    return date_id, local % 1440, (date_id + 4) % 7
+
+
+def fire_events(fire_keys, start):
+    """(key index, tick) arrays of every firing of (timezone, minute, days) keys
+
+    Returns (key_index, ticks, invalid_zones) sorted by key index.
+    """
+    key_parts, tick_parts, invalid_zones = [], [], set()
+    by_zone = {}
+    for index, (zone, _, _) in enumerate(fire_keys):
+        by_zone.setdefault(zone, []).append(index)
+    for zone, indices in by_zone.items():
+        try:
+            date_id, minute, weekday = local_clock(zone, start)
+        except (ZoneInfoNotFoundError, ValueError):
+            invalid_zones.add(zone)
+            continue
+        day_bit = np.left_shift(1, weekday)
+        date_id = date_id - date_id.min()
+        indices = np.array(indices)
+        targets = np.array([fire_keys[i][1] for i in indices], dtype=np.int64)
+        masks = np.array([fire_keys[i][2] for i in indices], dtype=np.int64)
+        for offset in range(0, len(indices), FIRE_CHUNK):
+            block = slice(offset, offset + FIRE_CHUNK)
+            # shouldRunScheduleNow: day matches and |local minute - target| <= 1
+            candidate = ((np.abs(minute[None, :] - targets[block, None]) <= 1)
+                         & ((masks[block, None] & day_bit[None, :]) != 0))
+            rows, ticks = np.nonzero(candidate)
+            # lastRunAt: only the first tick of the window per local date fires
+            _, first = np.unique(rows * 16 + date_id[ticks], return_index=True)
+            key_parts.append(indices[block][rows[first]])
+            tick_parts.append(ticks[first])
+    if not key_parts:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), invalid_zones
+    key_index, ticks = np.concatenate(key_parts), np.concatenate(tick_parts)
+    order = np.argsort(key_index, kind="stable")
+    return key_index[order], ticks[order], invalid_zones
+
+
+def simulate(slots, start, server_zone="UTC"):
+    """Per-minute arrays of firings, sends and download starts over the week
+
+    Firing only depends on (timezone, minute, days), so the NumPy matrix is
+    built over those keys; every slot then inherits its key's fire ticks.
+    Returns (fires, sends, downloads, events, invalid_zones) where events
+    holds per-firing arrays (tick, label index, prompts) and the (timezone,
+    minute) labels for attributing peaks.
+    """
+    fires = np.zeros(WEEK_MINUTES, dtype=np.int64)
+    sends = np.zeros(WEEK_MINUTES, dtype=np.int64)
+    downloads = np.zeros(WEEK_MINUTES, dtype=np.int64)
+    keys = list(slots)
+    fire_index, labels = {}, {}
+    slot_fire = np.array([fire_index.setdefault(key[:3], len(fire_index)) for key in keys], dtype=np.int64)
+    slot_label = np.array([labels.setdefault(key[:2], len(labels)) for key in keys], dtype=np.int64)
+    counts, prompts, loads = (np.array([slots[key][column] for key in keys], dtype=np.int64).reshape(-1)
+                              for column in range(3))
+
+    event_key, event_tick, invalid = fire_events(list(fire_index), start)
+    per_key = np.bincount(event_key, minlength=len(fire_index))
+    key_start = np.cumsum(per_key) - per_key
+    # Expand each slot into one row per firing of its key
+    per_slot = per_key[slot_fire]
+    slot_rows = np.repeat(np.arange(len(keys)), per_slot)
+    within = np.arange(per_slot.sum()) - np.repeat(np.cumsum(per_slot) - per_slot, per_slot)
+    ticks = event_tick[key_start[slot_fire][slot_rows] + within]
+
+    np.add.at(fires, ticks, counts[slot_rows])
+    np.add.at(sends, ticks, prompts[slot_rows])
+    with_downloads = loads[slot_rows] > 0
+    if with_downloads.any():
+        server_hour = local_clock(server_zone, start)[1] // 60
+        delay_table = np.array([key[3] for key in keys], dtype=np.int64)
+        rows, dl_ticks = slot_rows[with_downloads], ticks[with_downloads]
+        delay = delay_table[rows, server_hour[dl_ticks]]
+        # The week repeats, so downloads past the end wrap to its start
+        np.add.at(downloads, (dl_ticks + delay) % WEEK_MINUTES, loads[rows])
+
+    invalid_zones = {}
+    for key in keys:
+        if key[0] in invalid:
+            invalid_zones[key[0]] = invalid_zones.get(key[0], 0) + slots[key][0]
+    events = {"tick": ticks, "label": slot_label[slot_rows], "prompts": prompts[slot_rows],
+              "labels": list(labels)}
+    return fires, sends, downloads, events, invalid_zones
+
+
+def active_count(starts, duration):
+    """Concurrent tasks per minute for tasks lasting duration minutes (circular week)"""
+    if duration <= 1:
+        return starts.copy()
+    padded = np.concatenate([starts[-(duration - 1):], starts])
+    return np.convolve(padded, np.ones(duration, dtype=np.int64), mode="valid")
+
+
+def percentile_nonzero(values, q):
+    nonzero = values[values > 0]
+    return float(np.percentile(nonzero, q)) if len(nonzero) else 0.0
+
+
+def build_report(slots, start, fires, sends, downloads, events, args, invalid_zones=()):
+    active = active_count(downloads, args.download_minutes)
+    # Ticks run channels sequentially: one tick lasts about prompts * send time
+    # plus 1s between prompts of a run; longer than 60s means ticks overlap.
+    tick_seconds = sends * args.send_seconds + np.maximum(sends - fires, 0)
+    order = np.argsort(-(sends * 1000 + active), kind="stable")[:args.top]
+
+    def at(tick):
+        return (start + timedelta(minutes=int(tick))).strftime("%a %H:%M")
+
+    peaks = []
+    for tick in order:
+        if sends[tick] == 0 and active[tick] == 0:
+            break
+        at_tick = events["tick"] == tick
+        weights = np.bincount(events["label"][at_tick], weights=events["prompts"][at_tick],
+                              minlength=len(events["labels"]))
+        contributors = [(int(weights[i]), events["labels"][i]) for i in np.argsort(-weights)[:3] if weights[i]]
+        peaks.append({
+            "minute": at(tick), "schedules": int(fires[tick]), "sends": int(sends[tick]),
+            "tickSeconds": round(float(tick_seconds[tick]), 1),
+            "downloadsStarted": int(downloads[tick]), "downloadsActive": int(active[tick]),
+            "topSlots": [f"{zone} {minute // 60:02d}:{minute % 60:02d} x{count}"
+                         for count, (zone, minute) in contributors],
+        })
+
+    slot_load = {}
+    for (zone, minute, _, _, _), (count, prompts, _) in slots.items():
+        if zone in invalid_zones:
+            continue
+        slot = (zone, minute)
+        previous = slot_load.get(slot, (0, 0))
+        slot_load[slot] = (previous[0] + count, previous[1] + prompts)
+    busiest = sorted(slot_load.items(), key=lambda item: -item[1][1])[:args.top]
+
+    return {
+        "start": start.isoformat(),
+        "schedules": sum(value[0] for value in slots.values()),
+        "slots": len(slots),
+        "sends": {"total": int(sends.sum()), "peakPerMinute": int(sends.max()),
+                  "p99PerBusyMinute": percentile_nonzero(sends, 99),
+                  "busyMinutes": int((sends > 0).sum()),
+                  "minutesOverLimit": int((sends > args.send_limit).sum()) if args.send_limit else None},
+        "ticks": {"peakSeconds": round(float(tick_seconds.max()), 1),
+                  "minutesOver60s": int((tick_seconds > 60).sum())},
+        "downloads": {"total": int(downloads.sum()), "peakStartsPerMinute": int(downloads.max()),
+                      "peakActive": int(active.max()), "durationMinutes": args.download_minutes},
+        "peaks": peaks,
+        "busiestLocalSlots": [{"timezone": zone, "time": f"{minute // 60:02d}:{minute % 60:02d}",
+                               "schedules": count, "prompts": prompts}
+                              for (zone, minute), (count, prompts) in busiest],
+    }
+
+
+def print_report(report, skipped, invalid_zones, elapsed):
+    sends, ticks, downloads = report["sends"], report["ticks"], report["downloads"]
+    print(f"week from {report['start']}: {report['schedules']} schedules in {report['slots']} slots "
+          f"(simulated in {elapsed:.2f}s)")
+    skipped_text = ", ".join(f"{name}={count}" for name, count in skipped.items() if count)
+    if skipped_text:
+        print(f"skipped: {skipped_text}")
+    for zone, count in invalid_zones.items():
+        print(f"WARNING: unknown timezone {zone!r} ({count} schedules skipped)")
+    print(f"sends: {sends['total']} total, peak {sends['peakPerMinute']}/min, "
+          f"p99 {sends['p99PerBusyMinute']:.0f}/min over {sends['busyMinutes']} busy minutes"
+          + (f", {sends['minutesOverLimit']} minutes over limit" if sends["minutesOverLimit"] is not None else ""))
+    print(f"tick duration: peak ~{ticks['peakSeconds']}s, {ticks['minutesOver60s']} ticks longer than 60s")
+    print(f"downloads: {downloads['total']} total, peak {downloads['peakStartsPerMinute']} starts/min, "
+          f"peak {downloads['peakActive']} running (each ~{downloads['durationMinutes']} min)")
+
+    print(f"\n{'minute (UTC)':<13} {'sched':>6} {'sends':>6} {'tick s':>7} {'dl start':>8} {'dl run':>7}  top slots")
+    for peak in report["peaks"]:
+        print(f"{peak['minute']:<13} {peak['schedules']:>6} {peak['sends']:>6} {peak['tickSeconds']:>7.0f} "
+              f"{peak['downloadsStarted']:>8} {peak['downloadsActive']:>7}  {', '.join(peak['topSlots'])}")
+    print("\nBusiest local slots (stagger candidates):")
+    for slot in report["busiestLocalSlots"]:
+        print(f"  {slot['timezone']:<24} {slot['time']}  {slot['schedules']:>6} schedules {slot['prompts']:>7} prompts")
+
+
+def generate_snapshot(count, seed=1):
+    """Synthetic snapshot with realistic clustering on round local times"""
+    rng = random.Random(seed)
+    zones = ["Europe/Moscow", "Asia/Almaty", "Europe/Berlin", "America/New_York", "UTC", "Asia/Tashkent",
+             "Europe/Kyiv", "Asia/Dubai"]
+    popular = ["09:00", "12:00", "15:00", "18:00", "20:00", "21:00"]
+    channels, users = [], {}
+    for index in range(count):
+        owner = f"user{index // 5}"
+        if owner not in users:
+            interval = rng.choice([5, 11, 15, 30])
+            users[owner] = {"isAutomationPaused": rng.random() < 0.05, "minInterval_00_13": interval,
+                            "minInterval_13_17": interval, "minInterval_17_24": interval}
+        schedules = []
+        for number in range(rng.choice([1, 2, 3, 4])):
+            if rng.random() < 0.6:
+                at = rng.choice(popular)
+            else:
+                at = f"{rng.randrange(24):02d}:{rng.choice([0, 10, 15, 20, 30, 40, 45, 50]):02d}"
+            schedules.append({"id": f"s{number}", "enabled": rng.random() < 0.95, "time": at,
+                              "daysOfWeek": sorted(rng.sample(range(7), rng.choice([5, 7]))),
+                              "promptsPerRun": rng.choice([1, 1, 2, 3])})
+        channels.append({"id": f"ch{index}", "ownerId": owner, "timezone": rng.choice(zones),
+                         "autoSendEnabled": rng.random() < 0.9, "autoSendSchedules": schedules,
+                         "autoDownloadToDriveEnabled": rng.random() < 0.7, "autoDownloadDelayMinutes": 10})
+    return {"channels": channels, "users": users}
+
+
+def week_start(value):
+    if value:
+        start = datetime.fromisoformat(value)
+        return start if start.tzinfo else start.replace(tzinfo=timezone.utc)
+    today = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=today.weekday())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("snapshots", nargs="*", help="snapshot JSON files")
+    parser.add_argument("--start", help="week start, ISO time (default: this Monday 00:00 UTC)")
+    parser.add_argument("--server-tz", default="UTC", help="timezone of the backend process (for delay hours)")
+    parser.add_argument("--use-channel-delay", action="store_true",
+                        help="use each channel's autoDownloadDelayMinutes instead of the owner's intervals")
+    parser.add_argument("--download-minutes", type=int, default=3, help="how long one download runs")
+    parser.add_argument("--send-seconds", type=float, default=5.0, help="time to generate and send one prompt")
+    parser.add_argument("--send-limit", type=int, default=0, help="count minutes with more sends than this")
+    parser.add_argument("--top", type=int, default=10, help="peaks and slots to list")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--csv", help="write per-minute sends/downloads to this CSV file")
+    parser.add_argument("--generate", type=int, metavar="N", help="simulate a synthetic snapshot of N channels")
+    parser.add_argument("--write-snapshot", help="with --generate, also save the snapshot here")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+    if not args.snapshots and not args.generate:
+        parser.error("give snapshot files or --generate N")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.generate:
+        snapshot = generate_snapshot(args.generate, args.seed)
+        if args.write_snapshot:
+            with open(args.write_snapshot, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+        channels, users = snapshot["channels"], snapshot["users"]
+    else:
+        channels, users = load_snapshot(args.snapshots)
+
+    started = time.perf_counter()
+    start = week_start(args.start)
+    slots, skipped = build_slots(channels, users, args.use_channel_delay)
+    fires, sends, downloads, events, invalid_zones = simulate(slots, start, args.server_tz)
+    report = build_report(slots, start, fires, sends, downloads, events, args, invalid_zones)
+    elapsed = time.perf_counter() - started
+    report["skipped"] = skipped
+    report["invalidTimezones"] = invalid_zones
+
+    if args.csv:
+        active = active_count(downloads, args.download_minutes)
+        with open(args.csv, "w", encoding="utf-8") as f:
+            f.write("minute_utc,schedules,sends,downloads_started,downloads_active\n")
+            for tick in range(WEEK_MINUTES):
+                stamp = (start + timedelta(minutes=tick)).strftime("%Y-%m-%dT%H:%MZ")
+                f.write(f"{stamp},{fires[tick]},{sends[tick]},{downloads[tick]},{active[tick]}\n")
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report, skipped, invalid_zones, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
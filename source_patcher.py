@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Declarative, idempotent source patcher
+
+A patch set maps files to a list of edits:
+
+    {
+      "src/index.ts": [
+        {"type": "insert_after", "anchor": "import debugRoutes from \"./routes/debugRoutes\";",
+         "text": "\\nimport diagRoutes from \"./routes/diagRoutes\";"}
+      ],
+      ".env.production": [
+        {"type": "env_upsert", "key": "DEBUG_DIAG", "value": "true"}
+      ]
+    }
+
+Edit types:
+  insert_after / insert_before  - "anchor" (literal), "text", optional "guard"
+  replace                       - "pattern" (regex), "replacement", optional
+                                  "guard", "flags" (e.g. "ms"), "count"
+  env_upsert                    - "key", "value", optional "comment"
+
+An edit whose guard (for insertions the inserted text itself) is already
+present is reported as already-applied. Anchors that are missing, ambiguous
+(unless "all": true) or overlap another edit are reported as conflicts and
+the file is left untouched. Each edit's anchor and guard are searched
+independently, the result is assembled in one pass and written atomically
+(temp file + rename).
+
+Usage: python3 source_patcher.py patches.json --root DIR [--dry-run] [--diff] [-j N]
+"""
+import argparse
+import difflib
+import json
+import os
+import re
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import ops_trace
+
+APPLIED = "applied"
+ALREADY_APPLIED = "already-applied"
+CONFLICT = "conflict"
+MISSING_FILE = "missing-file"
+
+
+class PatchError(Exception):
+    """Raised for malformed edits"""
+
+
+def edit_label(edit):
+    """Short human readable description of an edit"""
+    if "label" in edit:
+        return edit["label"]
+    if edit["type"] == "env_upsert":
+        return f"env {edit['key']}"
+    subject = edit.get("anchor") or edit.get("pattern") or ""
+    subject = subject.strip().splitlines()[0] if subject.strip() else ""
+    return f"{edit['type']} {subject[:60]}"
+
+
+def edit_patterns(edit):
+    """(target regex, guard regex or None) for an edit, both as source strings"""
+    kind = edit["type"]
+    if kind in ("insert_after", "insert_before"):
+        guard = edit.get("guard", edit["text"].strip())
+        return re.escape(edit["anchor"]), re.escape(guard) if guard else None
+    if kind == "replace":
+        flags = edit.get("flags", "")
+        target = f"(?{flags}:{edit['pattern']})" if flags else edit["pattern"]
+        guard = re.escape(edit["guard"]) if edit.get("guard") else None
+        return target, guard
+    if kind == "env_upsert":
+        key = re.escape(edit["key"])
+        # (?m)$ matches before \n only, so a CRLF line's \r is left out of the match by the lookahead
+        return f"(?m:^{key}=[^\\r\\n]*(?=\\r?$))", f"(?m:^{key}={re.escape(str(edit['value']))}[ \\t]*\\r?$)"
+    raise PatchError(f"unknown edit type: {kind}")
+
+
+def scan(content, edits):
+    """Locate targets and guards of all edits
+
+    Returns (targets, guards): per edit, a list of match objects for its
+    target pattern and a bool telling whether its guard is present. Each
+    edit is searched on its own so one edit's match never hides another's
+    anchor or guard; overlaps between edits are caught in plan_edits.
+    """
+    targets = []
+    guards = []
+    for edit in edits:
+        target, guard = edit_patterns(edit)
+        targets.append(list(re.finditer(target, content)))
+        guards.append(bool(guard and re.search(guard, content)))
+    return targets, guards
+
+
+def plan_edits(content, edits):
+    """Compute the patched content without touching the disk
+
+    Returns (new_content, results) where results is a list of
+    (label, status, detail) tuples in edit order. If any edit conflicts,
+    new_content is the original content.
+    """
+    targets, guards = scan(content, edits)
+    results = []
+    splices = []  # (start, end, replacement, edit index)
+    appends = []
+
+    for index, edit in enumerate(edits):
+        label = edit_label(edit)
+        kind = edit["type"]
+        matches = targets[index]
+        if guards[index]:
+            results.append((label, ALREADY_APPLIED, ""))
+            continue
+        if kind == "env_upsert":
+            line = f"{edit['key']}={edit['value']}"
+            if matches:
+                for match in matches:
+                    splices.append((match.start(), match.end(), line, index))
+            else:
+                eol = "\r\n" if "\r\n" in content else "\n"
+                prefix = "" if not content or content.endswith("\n") else eol
+                comment = f"{eol}# {edit['comment']}{eol}" if edit.get("comment") else ""
+                appends.append(f"{prefix}{comment}{line}{eol}")
+            results.append((label, APPLIED, "updated" if matches else "added"))
+            continue
+        if not matches:
+            results.append((label, CONFLICT, "anchor not found" if kind != "replace" else "pattern not found"))
+            continue
+        if kind == "replace":
+            count = edit.get("count", 0)
+            for match in matches[:count] if count else matches:
+                splices.append((match.start(), match.end(), match.expand(edit["replacement"]), index))
+            results.append((label, APPLIED, f"{min(len(matches), count) if count else len(matches)} match(es)"))
+            continue
+        if len(matches) > 1 and not edit.get("all"):
+            results.append((label, CONFLICT, f"anchor is ambiguous ({len(matches)} matches)"))
+            continue
+        for match in matches:
+            if kind == "insert_after":
+                splices.append((match.end(), match.end(), edit["text"], index))
+            else:
+                splices.append((match.start(), match.start(), edit["text"], index))
+        results.append((label, APPLIED, f"{len(matches)} location(s)"))
+
+    # Overlapping edits are a conflict between the two edits involved
+    splices.sort(key=lambda item: (item[0], item[1]))
+    conflicting = set()
+    for previous, current in zip(splices, splices[1:]):
+        if current[0] < previous[1] and previous[3] != current[3]:
+            conflicting.update((previous[3], current[3]))
+    for index in conflicting:
+        label, _, _ = results[index]
+        results[index] = (label, CONFLICT, "overlaps another edit")
+
+    if any(status == CONFLICT for _, status, _ in results):
+        return content, results
+
+    pieces = []
+    position = 0
+    for start, end, replacement, _ in splices:
+        pieces.append(content[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(content[position:])
+    pieces.extend(appends)
+    return "".join(pieces), results
+
+
+def write_atomic(path, content):
+    """Write text to path through a temp file in the same directory"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def patch_file(path, edits, dry_run=False, with_diff=False):
+    """Apply edits to one file, returns a report dict"""
+    report = {"path": path, "changed": False, "results": [], "diff": ""}
+    if not os.path.exists(path):
+        report["results"] = [(edit_label(edit), MISSING_FILE, "") for edit in edits]
+        return report
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        content = f.read()
+    new_content, results = plan_edits(content, edits)
+    report["results"] = results
+    report["changed"] = new_content != content
+    if report["changed"] and with_diff:
+        report["diff"] = "".join(difflib.unified_diff(
+            content.splitlines(keepends=True), new_content.splitlines(keepends=True),
+            fromfile=f"a/{path}", tofile=f"b/{path}"))
+    if report["changed"] and not dry_run:
+        write_atomic(path, new_content)
+    return report
+
+
+def _patch_file_job(args):
+    with ops_trace.span("patch", file=args[0]) as span:
+        report = patch_file(*args)
+        span.set(changed=report["changed"])
+    return report
+
+
+def apply_patchset(patchset, root=".", dry_run=False, with_diff=False, workers=1):
+    """Patch every file of a patch set, in parallel when workers > 1"""
+    jobs = [(os.path.normpath(os.path.join(root, path)), edits, dry_run, with_diff) for path, edits in patchset.items()]
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_patch_file_job, jobs))
+    return [_patch_file_job(job) for job in jobs]
+
+
+def print_report(reports):
+    """Print per-edit statuses, returns True if nothing conflicted"""
+    ok = True
+    for report in reports:
+        state = "changed" if report["changed"] else "unchanged"
+        print(f"{report['path']}: {state}")
+        for label, status, detail in report["results"]:
+            suffix = f" ({detail})" if detail else ""
+            print(f"  [{status}] {label}{suffix}")
+            if status == CONFLICT:
+                ok = False
+        if report["diff"]:
+            print(report["diff"], end="")
+    return ok
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("patchset", help="JSON file mapping paths to edit lists")
+    parser.add_argument("--root", default=".", help="directory the paths are relative to")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change, write nothing")
+    parser.add_argument("--diff", action="store_true", help="print a unified diff of each change")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="files patched in parallel")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.patchset, "r", encoding="utf-8") as f:
+        patchset = json.load(f)
+    reports = apply_patchset(patchset, args.root, args.dry_run, args.diff, args.workers)
+    sys.exit(0 if print_report(reports) else 1)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Find duplicate videos in the storage tree and replace them with hardlinks
+
+The same clip often sits in a channel inbox, under uploaded/<platform> and in
+other channels. Candidates are narrowed in three passes so most files are
+never read in full:
+  1. group by (device, size), skipping files that are already hardlinked
+  2. hash the first and last SAMPLE_SIZE bytes of each remaining file
+  3. stream a full SHA-256 only over files whose samples collide
+Each confirmed group keeps one file (most links, then oldest) and the others
+are replaced by a hardlink to it: link to a temp name, then os.replace, after
+re-checking that size and mtime did not change since hashing. Without
+--apply nothing is modified.
+
+--bwlimit caps the read rate across all workers so a run does not saturate
+the NAS disks while the backend is serving.
+
+Examples:
+  python3 storage_dedup.py /volume1/docker/shortsai/backend/storage
+  python3 storage_dedup.py /volume1/docker/shortsai/backend/storage --apply -j 2 --bwlimit 40
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ops_common import format_size
+from storage_index import VIDEO_EXTENSIONS, classify
+
+SAMPLE_SIZE = 64 * 1024
+READ_SIZE = 1024 * 1024
+DEDUP_KINDS = ("inbox", "uploaded")
+
+
+class RateLimiter:
+    """Token bucket shared by all readers, bytes per second"""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.allowance = rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def consume(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.allowance = min(self.rate, self.allowance + (now - self.updated) * self.rate)
+            self.updated = now
+            self.allowance -= amount
+            wait = -self.allowance / self.rate if self.allowance < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class FileInfo:
+    __slots__ = ("path", "size", "mtime_ns", "dev", "ino", "nlink")
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime_ns = stat.st_mtime_ns
+        self.dev = stat.st_dev
+        self.ino = stat.st_ino
+        self.nlink = stat.st_nlink
+
+
+def collect_files(root, min_size=1, all_files=False):
+    """FileInfo of every candidate file under root
+
+    By default only videos in inbox/ and uploaded/ (by the StorageService
+    layout) are considered; all_files takes every regular file.
+    """
+    files = []
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, PermissionError):
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            if not all_files:
+                if not entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                    continue
+                kind = classify(os.path.relpath(entry.path, root).replace(os.sep, "/"))[3]
+                if kind not in DEDUP_KINDS:
+                    continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_size >= min_size:
+                files.append(FileInfo(entry.path, stat))
+    return files
+
+
+def group_by(items, key):
+    groups = {}
+    for item in items:
+        groups.setdefault(key(item), []).append(item)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def sample_digest(info, limiter):
+    """Hash of the size, head and tail of a file"""
+    digest = hashlib.blake2b(str(info.size).encode(), digest_size=16)
+    with open(info.path, "rb") as f:
+        head = f.read(SAMPLE_SIZE)
+        digest.update(head)
+        limiter.consume(len(head))
+        if info.size > SAMPLE_SIZE:
+            f.seek(max(SAMPLE_SIZE, info.size - SAMPLE_SIZE))
+            tail = f.read(SAMPLE_SIZE)
+            digest.update(tail)
+            limiter.consume(len(tail))
+    return digest.digest()
+
+
+def full_digest(info, limiter):
+    digest = hashlib.sha256()
+    with open(info.path, "rb") as f:
+        while True:
+            chunk = f.read(READ_SIZE)
+            if not chunk:
+                break
+            limiter.consume(len(chunk))
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def refine(groups, digest_func, executor, limiter, stats, counter):
+    """Split each group by digest_func, dropping files that cannot be read"""
+    flat = [info for group in groups for info in group]
+
+    def safe_digest(info):
+        try:
+            return digest_func(info, limiter)
+        except OSError as e:
+            stats["errors"].append(f"{info.path}: {e}")
+            return None
+
+    digests = list(executor.map(safe_digest, flat))
+    stats[counter] += sum(min(info.size, 2 * SAMPLE_SIZE) if digest_func is sample_digest else info.size
+                          for info in flat)
+    keyed = [(digest, info) for digest, info in zip(digests, flat) if digest is not None]
+    refined = {}
+    for digest, info in keyed:
+        refined.setdefault((info.dev, info.size, digest), []).append(info)
+    return [group for group in refined.values() if len(group) > 1]
+
+
+def find_duplicates(files, workers=4, limiter=None, stats=None):
+    """Groups of FileInfo with identical content (distinct inodes only)"""
+    limiter = limiter or RateLimiter(0)
+    stats = stats if stats is not None else {}
+    stats.update({"files": len(files), "sample_bytes": 0, "full_bytes": 0, "errors": []})
+    # One representative per inode: existing hardlinks are already deduplicated
+    unique = list({(info.dev, info.ino): info for info in files}.values())
+    groups = group_by(unique, lambda info: (info.dev, info.size))
+    stats["size_candidates"] = sum(len(group) for group in groups)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        groups = refine(groups, sample_digest, executor, limiter, stats, "sample_bytes")
+        stats["sample_candidates"] = sum(len(group) for group in groups)
+        groups = refine(groups, full_digest, executor, limiter, stats, "full_bytes")
+    return groups
+
+
+def pick_keeper(group):
+    return max(group, key=lambda info: (info.nlink, -info.mtime_ns, info.path))
+
+
+def replace_with_link(keeper, duplicate):
+    """Atomically replace duplicate by a hardlink to keeper if neither changed"""
+    for info in (keeper, duplicate):
+        stat = os.stat(info.path)
+        if (stat.st_size, stat.st_mtime_ns, stat.st_ino) != (info.size, info.mtime_ns, info.ino):
+            raise RuntimeError(f"{info.path} changed since it was hashed")
+    temp = f"{duplicate.path}.dedup-{os.getpid()}"
+    os.link(keeper.path, temp)
+    try:
+        os.replace(temp, duplicate.path)
+    except OSError:
+        os.unlink(temp)
+        raise
+
+
+def dedup(groups, apply=False):
+    """Link duplicates to their keeper, returns (plan, reclaimed bytes, errors)"""
+    plan, reclaimed, errors = [], 0, []
+    for group in sorted(groups, key=lambda g: g[0].size * (len(g) - 1), reverse=True):
+        keeper = pick_keeper(group)
+        duplicates = sorted((info for info in group if info is not keeper), key=lambda info: info.path)
+        for duplicate in duplicates:
+            if apply:
+                try:
+                    replace_with_link(keeper, duplicate)
+                except (OSError, RuntimeError) as e:
+                    errors.append(f"{duplicate.path}: {e}")
+                    continue
+            reclaimed += duplicate.size
+        plan.append({"size": keeper.size, "keep": keeper.path, "link": [info.path for info in duplicates]})
+    return plan, reclaimed, errors
+
+
+def run(root, workers=4, bwlimit_mb=0, apply=False, all_files=False, min_size=1):
+    started = time.perf_counter()
+    files = collect_files(root, min_size, all_files)
+    scanned = time.perf_counter()
+    stats = {}
+    groups = find_duplicates(files, workers, RateLimiter(bwlimit_mb * 1e6), stats)
+    hashed = time.perf_counter()
+    plan, reclaimed, link_errors = dedup(groups, apply)
+    stats.update({
+        "groups": len(plan),
+        "duplicates": sum(len(entry["link"]) for entry in plan),
+        "reclaimable_bytes": reclaimed,
+        "total_bytes": sum(info.size for info in files),
+        "applied": apply,
+        "scan_seconds": scanned - started,
+        "hash_seconds": hashed - scanned,
+        "link_seconds": time.perf_counter() - hashed,
+    })
+    stats["errors"] += link_errors
+    stats["read_bytes"] = stats["sample_bytes"] + stats["full_bytes"]
+    stats["read_mb_per_s"] = stats["read_bytes"] / 1e6 / max(stats["hash_seconds"], 1e-9)
+    return plan, stats
+
+
+def print_report(plan, stats, limit=20):
+    for entry in plan[:limit]:
+        print(f"{format_size(entry['size'])} x{len(entry['link']) + 1}  keep {entry['keep']}")
+        for path in entry["link"]:
+            print(f"    {'link' if stats['applied'] else 'would link'} {path}")
+    if len(plan) > limit:
+        print(f"... {len(plan) - limit} more groups")
+    print(f"\n{stats['files']} files ({format_size(stats['total_bytes'])}), "
+          f"{stats['size_candidates']} share a size, {stats['sample_candidates']} share head/tail samples")
+    print(f"read {format_size(stats['read_bytes'])} ({format_size(stats['sample_bytes'])} samples + "
+          f"{format_size(stats['full_bytes'])} full) at {stats['read_mb_per_s']:.1f} MB/s; "
+          f"scan {stats['scan_seconds']:.2f}s, hash {stats['hash_seconds']:.2f}s")
+    verb = "reclaimed" if stats["applied"] else "reclaimable"
+    print(f"{stats['duplicates']} duplicates in {stats['groups']} groups, "
+          f"{format_size(stats['reclaimable_bytes'])} {verb}")
+    for error in stats["errors"]:
+        print(f"ERROR: {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="storage root (or any directory with --all)")
+    parser.add_argument("--apply", action="store_true", help="replace duplicates with hardlinks (default: dry run)")
+    parser.add_argument("--all", action="store_true", help="consider every file, not only inbox/uploaded videos")
+    parser.add_argument("--min-size", type=int, default=1024 * 1024, help="ignore smaller files (default: 1MiB)")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="parallel readers (default: %(default)s)")
+    parser.add_argument("--bwlimit", type=float, default=0, help="max read rate in MB/s across workers (0 = unlimited)")
+    parser.add_argument("--limit", type=int, default=20, help="groups to list (default: %(default)s)")
+    parser.add_argument("--json", action="store_true", help="print plan and stats as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.root):
+        print(f"ERROR: {args.root} is not a directory")
+        return 2
+    plan, stats = run(args.root, args.workers, args.bwlimit, args.apply, args.all, args.min_size)
+    if args.json:
+        print(json.dumps({"plan": plan, "stats": stats}, ensure_ascii=False, indent=2))
+    else:
+        print_report(plan, stats, args.limit)
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
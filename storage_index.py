@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Incremental index of the backend storage tree with usage and backlog queries
+
+Walks the storage root in parallel with os.scandir and keeps a SQLite index
+of every directory (path, mtime) and file (path, size, mtime). A re-scan
+stats each known directory and only re-lists those whose mtime changed, so
+on an unchanged tree it costs one stat() per directory instead of one per
+file. Files rewritten in place do not change their directory's mtime; use
+--full to re-list everything.
+
+Paths are classified by the StorageService layout:
+  videos/users/{emailSlug__userId}/channels/{channelSlug__channelId}/inbox/{videoId}.mp4
+  videos/users/.../channels/.../uploaded/{platform}/{videoId}.mp4
+  videos/users/.../channels/.../failed/{videoId}.log
+  videos/users/.../channels/.../tmp/...
+  music_clips/users/.../channels/.../{inbox,uploaded,failed,logs}/...
+so usage per user/channel/platform, inbox backlog and orphaned files are
+plain SQL queries on indexed columns.
+
+Examples:
+  python3 storage_index.py scan --root /volume1/docker/shortsai/backend/storage -j 8
+  python3 storage_index.py summary
+  python3 storage_index.py usage --by channel
+  python3 storage_index.py inbox --json
+  python3 storage_index.py orphans --limit 50
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ops_common import format_size
+
+DEFAULT_ROOT = "/volume1/docker/shortsai/backend/storage"
+DEFAULT_DB = os.path.expanduser("~/.shortsai_storage_index.sqlite")
+AREAS = ("videos", "music_clips")
+CHANNEL_SUBDIRS = {
+    "videos": ("inbox", "uploaded", "failed", "tmp"),
+    "music_clips": ("inbox", "uploaded", "failed", "logs"),
+}
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".webm")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    stem TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    area TEXT,
+    user_key TEXT,
+    channel_key TEXT,
+    kind TEXT NOT NULL,
+    platform TEXT
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir, stem, ext);
+CREATE INDEX IF NOT EXISTS files_owner ON files(user_key, channel_key, kind, size, area);
+CREATE INDEX IF NOT EXISTS files_kind ON files(kind, platform, size, area);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def classify(relpath):
+    """(area, user_key, channel_key, kind, platform) of a file path relative to the root
+
+    kind is inbox/uploaded/failed/tmp/logs for files where StorageService
+    puts them, "meta" for .json sidecars, "other" for anything outside the
+    layout.
+    """
+    parts = relpath.split("/")
+    if len(parts) < 7 or parts[0] not in AREAS or parts[1] != "users" or parts[3] != "channels":
+        return (parts[0] if parts[0] in AREAS else None), None, None, "other", None
+    area, user_key, channel_key, subdir = parts[0], parts[2], parts[4], parts[5]
+    if subdir not in CHANNEL_SUBDIRS[area]:
+        return area, user_key, channel_key, "other", None
+    platform = None
+    if subdir == "uploaded" and area == "videos":
+        if len(parts) != 8:
+            return area, user_key, channel_key, "other", None
+        platform = parts[6]
+    kind = subdir
+    if parts[-1].endswith(".json") and subdir in ("inbox", "uploaded"):
+        kind = "meta"
+    return area, user_key, channel_key, kind, platform
+
+
+def split_key(folder_key):
+    """(slug, id) of a "{slug}__{id}" folder key; legacy keys are a bare id"""
+    slug, sep, ident = folder_key.rpartition("__")
+    return (slug, ident) if sep else ("", folder_key)
+
+
+def scan_dir(path, known_mtime, full=False):
+    """List one directory unless its mtime matches known_mtime
+
+    Returns (mtime_ns, files, subdirs) where files is [(name, size, mtime_ns)]
+    and subdirs is [name]; files and subdirs are None for an unchanged
+    directory and mtime_ns is None if the directory is gone.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (FileNotFoundError, NotADirectoryError):
+        return None, None, None
+    if mtime == known_mtime and not full:
+        return mtime, None, None
+    files, subdirs = [], []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.name, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                continue
+    return mtime, files, subdirs
+
+
+class StorageIndex:
+    """SQLite index of one storage root"""
+
+    def __init__(self, db_path, root=None):
+        self.db = sqlite3.connect(db_path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        stored_root = self.get_meta("root")
+        if root is not None:
+            root = os.path.abspath(root).rstrip("/")
+            if stored_root and stored_root != root:
+                raise ValueError(f"index {db_path} belongs to {stored_root}, not {root}")
+            self.set_meta("root", root)
+        self.root = root or stored_root
+
+    def get_meta(self, key):
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        self.db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES (?, ?)", (key, str(value)))
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    # --- scanning ---------------------------------------------------------
+
+    def _drop_subtree(self, rel):
+        if not rel:
+            self.db.execute("DELETE FROM files")
+            self.db.execute("DELETE FROM dirs")
+            return
+        # Range instead of LIKE: "_" and "%" are common in folder keys
+        low, high = rel + "/", rel + "0"
+        self.db.execute("DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (rel, low, high))
+        self.db.execute("DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (rel, low, high))
+
+    def _store_listing(self, rel, parent, mtime, files, subdirs, known_children):
+        self.db.execute("INSERT OR REPLACE INTO dirs(path, parent, mtime_ns) VALUES (?, ?, ?)",
+                        (rel, parent, mtime))
+        self.db.execute("DELETE FROM files WHERE dir = ?", (rel,))
+        rows = []
+        for name, size, file_mtime in files:
+            file_rel = f"{rel}/{name}" if rel else name
+            stem, ext = os.path.splitext(name)
+            rows.append((file_rel, rel, stem, ext.lower(), size, file_mtime) + classify(file_rel))
+        self.db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        current = {f"{rel}/{name}" if rel else name for name in subdirs}
+        for gone in known_children - current:
+            self._drop_subtree(gone)
+
+    def scan(self, workers=8, full=False, progress=None):
+        """Bring the index up to date with the tree, returns scan statistics"""
+        started = time.perf_counter()
+        known = dict(self.db.execute("SELECT path, mtime_ns FROM dirs"))
+        children = {}
+        for path, parent in self.db.execute("SELECT path, parent FROM dirs WHERE parent IS NOT NULL"):
+            children.setdefault(parent, set()).add(path)
+
+        stats = {"dirs": 0, "listed": 0, "files_listed": 0, "removed": 0}
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+
+            def submit(rel, parent):
+                absolute = os.path.join(self.root, rel) if rel else self.root
+                future = executor.submit(scan_dir, absolute, known.get(rel), full)
+                pending[future] = (rel, parent)
+
+            submit("", None)
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel, parent = pending.pop(future)
+                    mtime, files, subdirs = future.result()
+                    stats["dirs"] += 1
+                    if mtime is None:
+                        self._drop_subtree(rel)
+                        stats["removed"] += 1
+                        continue
+                    if files is None:
+                        subpaths = children.get(rel, ())
+                    else:
+                        self._store_listing(rel, parent, mtime, files, subdirs, children.get(rel, set()))
+                        subpaths = [f"{rel}/{name}" if rel else name for name in subdirs]
+                        stats["listed"] += 1
+                        stats["files_listed"] += len(files)
+                    for subpath in subpaths:
+                        submit(subpath, rel)
+                if progress and stats["dirs"] % 1000 < len(done):
+                    progress(stats)
+        self.set_meta("scanned_at", time.time())
+        self.db.commit()
+        stats["seconds"] = time.perf_counter() - started
+        return stats
+
+    # --- queries ----------------------------------------------------------
+
+    def totals(self):
+        count, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        by_kind = self.db.execute(
+            "SELECT kind, COUNT(*), SUM(size) FROM files GROUP BY kind ORDER BY SUM(size) DESC").fetchall()
+        return {"files": count, "bytes": size,
+                "byKind": [{"kind": k, "files": n, "bytes": b} for k, n, b in by_kind]}
+
+    def usage(self, by="user", area=None):
+        """Bytes and file counts grouped by user, channel or platform"""
+        columns = {"user": "user_key", "channel": "user_key, channel_key", "platform": "platform"}[by]
+        where = "kind != 'other'" + (" AND area = ?" if area else "")
+        if by == "platform":
+            where += " AND platform IS NOT NULL"
+        rows = self.db.execute(
+            f"SELECT {columns}, COUNT(*), SUM(size), "
+            f"SUM(CASE WHEN kind = 'inbox' THEN size ELSE 0 END), "
+            f"SUM(CASE WHEN kind = 'uploaded' THEN size ELSE 0 END) "
+            f"FROM files WHERE {where} GROUP BY {columns} ORDER BY SUM(size) DESC",
+            (area,) if area else ()).fetchall()
+        result = []
+        for row in rows:
+            keys, (files, size, inbox, uploaded) = row[:-4], row[-4:]
+            entry = dict(zip(columns.replace(" ", "").split(","), keys))
+            entry.update({"files": files, "bytes": size, "inboxBytes": inbox, "uploadedBytes": uploaded})
+            if "user_key" in entry:
+                entry["userId"] = split_key(entry["user_key"])[1]
+            if "channel_key" in entry:
+                entry["channelId"] = split_key(entry["channel_key"])[1]
+            result.append(entry)
+        return result
+
+    def inbox_backlog(self, now=None):
+        """Videos waiting in inbox per channel, with the age of the oldest one"""
+        now = now or time.time()
+        rows = self.db.execute(
+            "SELECT user_key, channel_key, COUNT(*), SUM(size), MIN(mtime_ns) FROM files "
+            "WHERE kind = 'inbox' AND ext IN ({}) GROUP BY user_key, channel_key "
+            "ORDER BY COUNT(*) DESC".format(",".join("?" * len(VIDEO_EXTENSIONS))),
+            VIDEO_EXTENSIONS).fetchall()
+        return [{"user_key": user, "channel_key": channel, "channelId": split_key(channel)[1],
+                 "videos": count, "bytes": size, "oldestAgeHours": round((now - oldest / 1e9) / 3600, 1)}
+                for user, channel, count, size, oldest in rows]
+
+    def orphans(self, limit=None):
+        """Files nothing in the backend will ever pick up again
+
+        - "outside layout": not under users/{user}/channels/{channel}/{known subdir}
+        - "dangling meta": inbox/uploaded .json without its video
+        - "temp leftover": anything in a channel's tmp/
+        """
+        placeholders = ",".join("?" * len(VIDEO_EXTENSIONS))
+        query = (
+            "SELECT path, size, mtime_ns, 'outside layout' FROM files WHERE kind = 'other' "
+            "UNION ALL "
+            "SELECT f.path, f.size, f.mtime_ns, 'dangling meta' FROM files f WHERE f.kind = 'meta' "
+            "AND NOT EXISTS (SELECT 1 FROM files v WHERE v.dir = f.dir AND v.stem = f.stem "
+            f"AND v.ext IN ({placeholders})) "
+            "UNION ALL "
+            "SELECT path, size, mtime_ns, 'temp leftover' FROM files WHERE kind = 'tmp' "
+            "ORDER BY 2 DESC"
+        )
+        params = list(VIDEO_EXTENSIONS)
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return [{"path": path, "bytes": size, "mtime": mtime / 1e9, "reason": reason}
+                for path, size, mtime, reason in self.db.execute(query, params)]
+
+
+def print_rows(rows, columns):
+    """Plain aligned table of dict rows; *Bytes/bytes columns are humanized"""
+    def cell(row, column):
+        value = row.get(column)
+        if value is None:
+            return "-"
+        return format_size(value) if column.lower().endswith("bytes") else str(value)
+
+    table = [[cell(row, column) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in table]) for i, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in table:
+        print("  ".join(value.ljust(width) for value, width in zip(line, widths)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=DEFAULT_DB, help="index file (default: %(default)s)")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", parents=[output], help="walk the tree and update the index")
+    scan.add_argument("--root", default=DEFAULT_ROOT, help="storage root (default: %(default)s)")
+    scan.add_argument("-j", "--workers", type=int, default=8, help="parallel directory listings")
+    scan.add_argument("--full", action="store_true", help="re-list every directory, ignoring mtimes")
+
+    commands.add_parser("summary", parents=[output], help="totals per kind and free space")
+    usage = commands.add_parser("usage", parents=[output], help="usage per user, channel or platform")
+    usage.add_argument("--by", choices=("user", "channel", "platform"), default="user")
+    usage.add_argument("--area", choices=AREAS, help="only count videos or music_clips")
+    commands.add_parser("inbox", parents=[output], help="inbox backlog per channel")
+    orphans = commands.add_parser("orphans", parents=[output], help="files outside the layout, dangling meta, temp leftovers")
+    orphans.add_argument("--limit", type=int, default=100)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        index = StorageIndex(args.db, args.root if args.command == "scan" else None)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return 2
+    if args.command != "scan" and not index.root:
+        print(f"ERROR: {args.db} is empty, run `scan` first")
+        return 2
+
+    try:
+        started = time.perf_counter()
+        if args.command == "scan":
+            if not os.path.isdir(index.root):
+                print(f"ERROR: {index.root} is not a directory")
+                return 2
+            stats = index.scan(args.workers, args.full,
+                               progress=None if args.json else
+                               lambda s: print(f"  {s['dirs']} dirs, {s['files_listed']} files listed", flush=True))
+            if args.json:
+                print(json.dumps(stats))
+            else:
+                print(f"OK: {stats['dirs']} dirs checked, {stats['listed']} re-listed "
+                      f"({stats['files_listed']} files), {stats['removed']} removed in {stats['seconds']:.2f}s")
+            return 0
+
+        if args.command == "summary":
+            result = index.totals()
+            result["root"] = index.root
+            result["scannedAt"] = float(index.get_meta("scanned_at") or 0)
+            try:
+                result["freeSpaceBytes"] = shutil.disk_usage(index.root).free
+            except OSError:
+                result["freeSpaceBytes"] = None
+            if not args.json:
+                scanned = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(result["scannedAt"]))
+                print(f"{result['root']}: {result['files']} files, {format_size(result['bytes'])} "
+                      f"(scanned {scanned})")
+                if result["freeSpaceBytes"] is not None:
+                    print(f"free space: {format_size(result['freeSpaceBytes'])}")
+                print_rows(result["byKind"], ["kind", "files", "bytes"])
+        elif args.command == "usage":
+            result = index.usage(args.by, args.area)
+            columns = {"user": ["user_key"], "channel": ["user_key", "channel_key"],
+                       "platform": ["platform"]}[args.by]
+            if not args.json:
+                print_rows(result, columns + ["files", "bytes", "inboxBytes", "uploadedBytes"])
+        elif args.command == "inbox":
+            result = index.inbox_backlog()
+            if not args.json:
+                print_rows(result, ["user_key", "channel_key", "videos", "bytes", "oldestAgeHours"])
+        else:
+            result = index.orphans(args.limit)
+            if not args.json:
+                print_rows(result, ["reason", "bytes", "path"])
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print(f"\n({(time.perf_counter() - started) * 1000:.1f} ms)")
+        return 0
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Journaled, parallel migration of legacy user/channel folders in the storage tree
+
+Does what backend/src/scripts/migrateUserFolders.ts and
+migrateChannelFolders.ts do, but plans every move up front and survives a
+crash:
+  phase 1  users/{userId}            -> users/{emailSlug__userId}
+  phase 2  channels/{channelId}      -> channels/{channelSlug__channelId}
+Conflicting targets and channel folders in an unknown format go to
+_orphaned/ like the TypeScript scripts do. Emails (registrationEmail) and
+channel names (initialName) come from a JSON export of Firestore,
+--names FILE:
+  {"users": {"<userId>": "<email>"}, "channels": {"<channelId>": "<initialName>"}}
+and are slugged exactly like emailToSlug/channelNameToSlug in fileUtils.ts.
+Folders without an entry are left alone and reported.
+
+Moves of a phase run on a pool of -j workers. A move on the same filesystem
+is a single rename(); across devices (--dest on another volume) the tree is
+streamed into DST.migrating (files already there with the same size and
+mtime are kept), renamed to DST and only then is the source removed.
+
+Every step is appended to a write-ahead journal (JSON lines, fsynced)
+before and after it happens: the plan first, then begin/copied/done per
+move. `resume` continues an interrupted run from the journal without
+re-planning, and `rollback` moves everything back in reverse phase order,
+also journaled, so it can be resumed too.
+
+Examples:
+  python3 storage_migrate.py plan /volume1/docker/shortsai/backend/storage --names names.json
+  python3 storage_migrate.py run /volume1/docker/shortsai/backend/storage --names names.json -j 8
+  python3 storage_migrate.py run /volume1/.../storage --names names.json --dest /volume2/storage
+  python3 storage_migrate.py resume /volume1/docker/shortsai/backend/storage
+  python3 storage_migrate.py status /volume1/docker/shortsai/backend/storage
+  python3 storage_migrate.py rollback /volume1/docker/shortsai/backend/storage
+"""
+import argparse
+import errno
+import json
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ops_common import format_size
+from storage_index import print_rows
+
+JOURNAL_NAME = "migration-journal.jsonl"
+COPY_BUFFER = 4 * 1024 * 1024
+FIREBASE_ID = re.compile(r"^[a-zA-Z0-9]{28}$")
+SKIP_USER_FOLDERS = ("lost+found",)
+
+
+def _slug(text, max_length, fallback):
+    slug = re.sub(r"[^a-z0-9\-_]", "-", text)
+    slug = re.sub(r"-+", "-", slug).strip("-")
+    if len(slug) > max_length:
+        slug = slug[:max_length].rstrip("-")
+    return slug or fallback
+
+
+def email_to_slug(email):
+    """emailToSlug from backend/src/utils/fileUtils.ts"""
+    if not email or not isinstance(email, str):
+        return "unknown-email"
+    return _slug(email.strip().lower().replace("@", "-at-").replace(".", "-"), 80, "unknown-email")
+
+
+def channel_name_to_slug(name):
+    """channelNameToSlug from backend/src/utils/fileUtils.ts"""
+    if not name or not isinstance(name, str) or not name.strip():
+        return "channel"
+    return _slug(re.sub(r"\s+", "-", name.strip().lower()), 60, "channel")
+
+
+def load_names(path):
+    with open(path, encoding="utf-8") as f:
+        names = json.load(f)
+    return names.get("users", {}), names.get("channels", {})
+
+
+def list_dirs(path):
+    try:
+        with os.scandir(path) as entries:
+            return sorted(entry.name for entry in entries if entry.is_dir(follow_symlinks=False))
+    except FileNotFoundError:
+        return []
+
+
+class Planner:
+    """Builds the list of moves; targets are checked against the tree and each other"""
+
+    def __init__(self, emails, channel_names, stamp):
+        self.emails = emails
+        self.channel_names = channel_names
+        self.stamp = stamp
+        self.ops = []
+        self.skipped = []
+        self.targets = set()
+
+    def taken(self, path):
+        return path in self.targets or os.path.lexists(path)
+
+    def add(self, phase, action, src, dst, reason=""):
+        self.targets.add(dst)
+        self.ops.append({"id": len(self.ops), "phase": phase, "action": action,
+                         "src": src, "dst": dst, "reason": reason})
+
+    def orphan(self, phase, src, orphaned_dir, name, reason):
+        dst = os.path.join(orphaned_dir, name)
+        if self.taken(dst):
+            dst = os.path.join(orphaned_dir, f"{name}_{self.stamp}")
+        self.add(phase, "orphan", src, dst, reason)
+
+    def plan_users(self, users_root, dest_users_root):
+        """Phase 1; returns [(folder path after phase 1, folder path now)]"""
+        placed = []
+        for name in list_dirs(users_root):
+            src = os.path.join(users_root, name)
+            if name in SKIP_USER_FOLDERS:
+                continue
+            if name.startswith("_") or "__" in name:
+                if dest_users_root != users_root:
+                    self.add(1, "move", src, os.path.join(dest_users_root, name))
+                if not name.startswith("_"):
+                    placed.append((os.path.join(dest_users_root, name), src))
+                continue
+            email = self.emails.get(name)
+            if not email:
+                self.skipped.append({"path": src, "reason": "no registrationEmail in names file"})
+                if dest_users_root != users_root:
+                    self.add(1, "move", src, os.path.join(dest_users_root, name))
+                placed.append((os.path.join(dest_users_root, name), src))
+                continue
+            dst = os.path.join(dest_users_root, f"{email_to_slug(email)}__{name}")
+            if self.taken(dst):
+                self.orphan(1, src, os.path.join(dest_users_root, "_orphaned"), f"{name}_{self.stamp}",
+                            f"target folder already exists: {os.path.basename(dst)}")
+                continue
+            self.add(1, "rename", src, dst)
+            placed.append((dst, src))
+        return placed
+
+    def plan_channels(self, user_dir, source_user_dir):
+        """Phase 2 for one user folder; the listing is taken from where it is now"""
+        channels_root = os.path.join(user_dir, "channels")
+        orphaned_dir = os.path.join(channels_root, "_orphaned")
+        for name in list_dirs(os.path.join(source_user_dir, "channels")):
+            if name == "_orphaned":
+                continue
+            src = os.path.join(channels_root, name)
+            if "__" in name and len(name) > 28:
+                continue
+            if not FIREBASE_ID.match(name):
+                self.orphan(2, src, orphaned_dir, name, "unknown folder format")
+                continue
+            initial_name = self.channel_names.get(name)
+            if not initial_name:
+                self.skipped.append({"path": src, "reason": "no initialName in names file"})
+                continue
+            key = f"{channel_name_to_slug(initial_name)}__{name}"
+            dst = os.path.join(channels_root, key)
+            if self.taken(dst) or os.path.lexists(os.path.join(source_user_dir, "channels", key)):
+                self.orphan(2, src, orphaned_dir, f"{name}_conflict_{self.stamp}",
+                            f"target folder already exists: {key}")
+                continue
+            self.add(2, "rename", src, dst)
+
+
+def build_plan(root, areas, emails, channel_names, dest=None):
+    """Plan dict with every move of both phases, nothing is touched"""
+    stamp = int(time.time() * 1000)
+    planner = Planner(emails, channel_names, stamp)
+    for area in areas:
+        users_root = os.path.join(root, area, "users")
+        dest_users_root = os.path.join(dest or root, area, "users")
+        for user_dir, source_dir in planner.plan_users(users_root, dest_users_root):
+            planner.plan_channels(user_dir, source_dir)
+    return {"root": root, "dest": dest, "areas": list(areas), "created": stamp,
+            "ops": planner.ops, "skipped": planner.skipped}
+
+
+class Journal:
+    """Append-only JSON lines log: one plan record, then one record per state change"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    @classmethod
+    def create(cls, path, plan):
+        journal = cls(path)
+        journal.file = open(path, "x", encoding="utf-8")
+        journal.append({"type": "plan", **plan})
+        return journal
+
+    @classmethod
+    def open(cls, path):
+        """(journal, plan, {op id: last state})"""
+        plan, states = None, {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # a torn last line from a crash mid-write
+                    continue
+                if record.get("type") == "plan":
+                    plan = record
+                else:
+                    states[record["id"]] = record["state"]
+        if plan is None:
+            raise ValueError(f"{path} has no plan record")
+        journal = cls(path)
+        journal.file = open(path, "a", encoding="utf-8")
+        return journal, plan, states
+
+    def append(self, record):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def record(self, op_id, state):
+        self.append({"id": op_id, "state": state, "t": round(time.time(), 3)})
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def copy_file(src, dst):
+    """Stream one file unless dst already has the same size and mtime, returns bytes copied"""
+    stat = os.stat(src)
+    try:
+        existing = os.stat(dst)
+        if (existing.st_size, existing.st_mtime_ns) == (stat.st_size, stat.st_mtime_ns):
+            return 0
+    except FileNotFoundError:
+        pass
+    temp = dst + ".part"
+    with open(src, "rb") as fin, open(temp, "wb") as fout:
+        shutil.copyfileobj(fin, fout, COPY_BUFFER)
+        fout.flush()
+        os.fsync(fout.fileno())
+    shutil.copystat(src, temp)
+    os.replace(temp, dst)
+    return stat.st_size
+
+
+def copy_tree(src, dst):
+    """Copy a directory tree, keeping what a previous attempt already copied"""
+    copied = 0
+    for directory, subdirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(directory, src))
+        os.makedirs(target, exist_ok=True)
+        for name in subdirs + files:
+            path = os.path.join(directory, name)
+            if os.path.islink(path):
+                link = os.path.join(target, name)
+                if not os.path.lexists(link):
+                    os.symlink(os.readlink(path), link)
+        for name in files:
+            path = os.path.join(directory, name)
+            if not os.path.islink(path):
+                copied += copy_file(path, os.path.join(target, name))
+    for directory, _, _ in os.walk(src, topdown=False):
+        shutil.copystat(directory, os.path.join(dst, os.path.relpath(directory, src)))
+    return copied
+
+
+def finish_copy(src, dst):
+    """Second half of a cross-device move: publish DST.migrating as DST, drop the source"""
+    temp = dst + ".migrating"
+    if os.path.lexists(temp) and not os.path.lexists(dst):
+        os.rename(temp, dst)
+        fsync_dir(os.path.dirname(dst))
+    if os.path.lexists(src):
+        shutil.rmtree(src)
+
+
+def move(op_id, src, dst, journal, states, prefix=""):
+    """Move src to dst as one journaled step, resuming from the last recorded state
+
+    Returns (method, bytes copied). A step is recognised as finished by the
+    filesystem as well as the journal, so a crash between a rename and its
+    "done" record is harmless.
+    """
+    state = states.get(op_id)
+    if state == prefix + "done":
+        return "skip", 0
+    if state == prefix + "copied":
+        finish_copy(src, dst)
+        journal.record(op_id, prefix + "done")
+        return "resumed", 0
+    src_exists, dst_exists = os.path.lexists(src), os.path.lexists(dst)
+    if dst_exists and not src_exists and state == prefix + "begin":
+        journal.record(op_id, prefix + "done")
+        return "resumed", 0
+    if not src_exists:
+        raise FileNotFoundError(errno.ENOENT, "source is gone", src)
+    if dst_exists:
+        raise FileExistsError(errno.EEXIST, "target already exists", dst)
+
+    journal.record(op_id, prefix + "begin")
+    parent = os.path.dirname(dst)
+    os.makedirs(parent, exist_ok=True)
+    try:
+        os.rename(src, dst)
+        fsync_dir(parent)
+        journal.record(op_id, prefix + "done")
+        return "rename", 0
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    copied = copy_tree(src, dst + ".migrating")
+    journal.record(op_id, prefix + "copied")
+    finish_copy(src, dst)
+    journal.record(op_id, prefix + "done")
+    return "copy", copied
+
+
+def execute(plan, journal, states, workers=4, rollback=False, progress=None):
+    """Run (or undo) every move of the plan phase by phase, returns stats"""
+    stats = {"ops": 0, "rename": 0, "copy": 0, "skip": 0, "resumed": 0, "bytes": 0,
+             "errors": [], "phases": {}}
+    prefix = "undo-" if rollback else ""
+    started = time.perf_counter()
+    phases = sorted({op["phase"] for op in plan["ops"]}, reverse=rollback)
+    lock = threading.Lock()
+
+    def run(op):
+        src, dst = (op["dst"], op["src"]) if rollback else (op["src"], op["dst"])
+        state = states.get(op["id"])
+        try:
+            if rollback and not (state or "").startswith("undo-"):
+                temp = op["dst"] + ".migrating"
+                if state == "copied":
+                    # the copy is complete, finish the forward move before undoing it
+                    finish_copy(op["src"], op["dst"])
+                elif state is None or (os.path.lexists(op["src"]) and not os.path.lexists(op["dst"])):
+                    # never applied; drop a partial copy
+                    if os.path.lexists(temp):
+                        shutil.rmtree(temp)
+                    if state is not None:
+                        journal.record(op["id"], "undo-done")
+                    state = "undo-done"
+            method, copied = move(op["id"], src, dst, journal, {op["id"]: state}, prefix)
+            if rollback and op["action"] == "orphan":
+                try:
+                    os.rmdir(os.path.dirname(op["dst"]))
+                except OSError:
+                    pass
+        except (OSError, shutil.Error) as e:
+            with lock:
+                stats["errors"].append(f"{src} -> {dst}: {e}")
+            return
+        with lock:
+            stats["ops"] += 1
+            stats[method] += 1
+            stats["bytes"] += copied
+            if progress and method != "skip":
+                progress(op, method)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for phase in phases:
+            phase_started = time.perf_counter()
+            ops = [op for op in plan["ops"] if op["phase"] == phase]
+            if rollback:
+                ops.reverse()
+            list(executor.map(run, ops))
+            stats["phases"][phase] = {"ops": len(ops), "seconds": time.perf_counter() - phase_started}
+            if stats["errors"]:
+                # later phases plan paths that assume this one completed
+                break
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def status_rows(plan, states):
+    rows = []
+    for op in plan["ops"]:
+        rows.append({"id": op["id"], "phase": op["phase"], "action": op["action"],
+                     "state": states.get(op["id"], "pending"),
+                     "src": op["src"], "dst": op["dst"]})
+    return rows
+
+
+def print_plan(plan, limit):
+    ops = plan["ops"]
+    for op in ops[:limit]:
+        reason = f"  ({op['reason']})" if op["reason"] else ""
+        print(f"  [{op['phase']}] {op['action']:6s} {op['src']} -> {op['dst']}{reason}")
+    if len(ops) > limit:
+        print(f"  ... {len(ops) - limit} more")
+    for entry in plan["skipped"]:
+        print(f"  skip {entry['path']}: {entry['reason']}")
+    counts = {}
+    for op in ops:
+        counts[op["action"]] = counts.get(op["action"], 0) + 1
+    summary = ", ".join(f"{count} {action}" for action, count in sorted(counts.items())) or "nothing to do"
+    print(f"\n{len(ops)} moves ({summary}), {len(plan['skipped'])} skipped")
+
+
+def print_stats(stats, verb):
+    phases = ", ".join(f"phase {phase} {info['ops']} in {info['seconds']:.2f}s"
+                       for phase, info in stats["phases"].items())
+    rate = stats["bytes"] / 1e6 / max(stats["seconds"], 1e-9)
+    print(f"{'OK' if not stats['errors'] else 'ERROR'}: {verb} {stats['ops'] - stats['skip']} moves "
+          f"({stats['rename']} renamed, {stats['copy']} copied, {stats['resumed']} resumed, "
+          f"{stats['skip']} already done) in {stats['seconds']:.2f}s; {phases}")
+    if stats["copy"]:
+        print(f"    copied {format_size(stats['bytes'])} at {rate:.1f} MB/s")
+    for error in stats["errors"]:
+        print(f"ERROR: {error}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("root", help="storage root (contains videos/ and music_clips/)")
+    common.add_argument("--journal", help=f"journal path (default: ROOT/{JOURNAL_NAME})")
+    common.add_argument("--json", action="store_true", help="print the result as JSON")
+    planning = argparse.ArgumentParser(add_help=False)
+    planning.add_argument("--names", required=True, help="JSON with users->email and channels->initialName")
+    planning.add_argument("--area", action="append", choices=("videos", "music_clips"),
+                          help="area to migrate, repeatable (default: videos)")
+    planning.add_argument("--dest", help="move users/ into this storage root instead of renaming in place")
+    workers = argparse.ArgumentParser(add_help=False)
+    workers.add_argument("-j", "--workers", type=int, default=4, help="parallel moves (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    plan = subparsers.add_parser("plan", parents=[common, planning], help="dry run: print the planned moves")
+    plan.add_argument("--limit", type=int, default=200, help="moves to list (default: %(default)s)")
+    subparsers.add_parser("run", parents=[common, planning, workers], help="plan, journal and execute")
+    subparsers.add_parser("resume", parents=[common, workers], help="continue an interrupted run")
+    subparsers.add_parser("rollback", parents=[common, workers], help="undo a run (or finish undoing one)")
+    subparsers.add_parser("status", parents=[common], help="show the state of every journaled move")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isdir(args.root):
+        print(f"ERROR: {args.root} is not a directory")
+        return 2
+    journal_path = args.journal or os.path.join(args.root, JOURNAL_NAME)
+
+    if args.command in ("plan", "run"):
+        emails, channel_names = load_names(args.names)
+        plan = build_plan(os.path.abspath(args.root), args.area or ["videos"], emails, channel_names,
+                          os.path.abspath(args.dest) if args.dest else None)
+        if args.command == "plan":
+            if args.json:
+                print(json.dumps(plan, ensure_ascii=False, indent=2))
+            else:
+                print_plan(plan, args.limit)
+            return 0
+        try:
+            journal = Journal.create(journal_path, plan)
+        except FileExistsError:
+            print(f"ERROR: {journal_path} exists; use resume, rollback or another --journal")
+            return 2
+        states = {}
+    else:
+        try:
+            journal, plan, states = Journal.open(journal_path)
+        except (OSError, ValueError) as e:
+            print(f"ERROR: {e}")
+            return 2
+
+    try:
+        if args.command == "status":
+            rows = status_rows(plan, states)
+            if args.json:
+                print(json.dumps(rows, ensure_ascii=False, indent=2))
+            else:
+                print_rows(rows, ["id", "phase", "action", "state", "src", "dst"])
+                counts = {}
+                for row in rows:
+                    counts[row["state"]] = counts.get(row["state"], 0) + 1
+                print("\n" + ", ".join(f"{count} {state}" for state, count in sorted(counts.items())))
+            return 0
+        undoing = any(state.startswith("undo-") for state in states.values())
+        if args.command == "resume" and undoing:
+            print("ERROR: a rollback was started from this journal; run rollback to finish it")
+            return 2
+        rollback = args.command == "rollback"
+        progress = None if args.json else (
+            lambda op, method: print(f"  {method} {op['dst'] if not rollback else op['src']}", flush=True))
+        stats = execute(plan, journal, states, args.workers, rollback, progress)
+    finally:
+        journal.close()
+    if args.json:
+        print(json.dumps(stats, indent=2))
+    else:
+        print_stats(stats, "undid" if rollback else "applied")
+        print(f"    journal: {journal_path}")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
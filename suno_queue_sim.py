@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Discrete-event simulation of the Suno request queue and alternative policies
+
+Models SunoQueue (backend/src/services/sunoQueue.ts) exactly: one FIFO,
+at most `concurrency` calls in flight, and after a successful call the
+slot is held for `delayMs` while more work is queued; a failed call (e.g.
+429) releases its slot at once and rejects the job, which is what
+musicClipsPipeline does today. Alternatives with the same knobs:
+
+  fifo      SunoQueue as implemented (MUSIC_CLIPS_SUNO_CONCURRENCY/_DELAY_MS)
+  token     FIFO gated by a client-side token bucket (--bucket-rate/min, --bucket-burst)
+  fair      one FIFO per user served round-robin, so a batch from one user
+            does not block everyone else
+  adaptive  FIFO with AIMD concurrency: +1/limit per success, halved and a
+            --cooldown-ms pause on every 429, up to --concurrency
+
+The upstream is a token bucket of --upstream-rate requests/min (and an
+optional in-flight cap) that answers 429 when exceeded. With --retries the
+client re-queues 429s after exponential backoff like SunoClient's
+calculateRetryDelay (1s * 2^n + 20% jitter, max 30s).
+
+Arrivals come from a trace (CSV with time,userId columns or JSON lines
+{"time": ..., "userId": ...}; time in seconds or ISO 8601) or are
+synthetic: Poisson at --rate jobs/min from --users users with Zipf-skewed
+activity plus periodic single-user batches (--batch-every/--batch-size).
+
+Every combination of --policies x --concurrency x --delay-ms is simulated
+on the same arrivals and printed as one table: completed/failed jobs,
+429s, throughput, queue-wait percentiles, end-to-end p95, the p95 wait of
+light users (no more jobs than the median user - what a batch from someone
+else costs them), Jain's index over per-user mean wait (1.0 = every user
+waits the same) and the worst user's p95 wait.
+
+Examples:
+  python3 suno_queue_sim.py
+  python3 suno_queue_sim.py --policies fifo,fair,adaptive --concurrency 1,2,4 --delay-ms 0,1500
+  python3 suno_queue_sim.py --trace arrivals.csv --upstream-rate 30 --retries 3 --json
+"""
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import math
+import random
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from ops_common import Histogram
+
+POLICIES = ("fifo", "token", "fair", "adaptive")
+RETRY_BASE_S = 1.0
+RETRY_MAX_S = 30.0
+
+
+class Job:
+    __slots__ = ("id", "user", "arrival", "enqueued", "waited", "attempts", "started", "done", "ok")
+
+    def __init__(self, job_id, user, arrival):
+        self.id = job_id
+        self.user = user
+        self.arrival = arrival
+        self.enqueued = arrival
+        self.waited = 0.0
+        self.attempts = 0
+        self.started = None
+        self.done = None
+        self.ok = False
+
+
+class Upstream:
+    """Provider-side rate limit: token bucket plus optional in-flight cap"""
+
+    def __init__(self, rate_per_min, burst, max_inflight=0):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = 0.0
+        self.max_inflight = max_inflight
+        self.inflight = 0
+
+    def admit(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1 or (self.max_inflight and self.inflight >= self.max_inflight):
+            return False
+        self.tokens -= 1
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+
+
+class FifoPolicy:
+    """SunoQueue: plain FIFO with a fixed concurrency"""
+
+    def __init__(self, concurrency, **_):
+        self.queue = deque()
+        self.concurrency = concurrency
+
+    def __len__(self):
+        return len(self.queue)
+
+    def push(self, job):
+        self.queue.append(job)
+
+    def pop(self):
+        return self.queue.popleft()
+
+    def limit(self):
+        return self.concurrency
+
+    def ready_in(self, now):
+        """Seconds until a start is allowed (0 = now)"""
+        return 0.0
+
+    def on_result(self, ok, now):
+        pass
+
+
+class TokenBucketPolicy(FifoPolicy):
+    def __init__(self, concurrency, bucket_rate=20.0, bucket_burst=3, **_):
+        super().__init__(concurrency)
+        self.rate = bucket_rate / 60.0
+        self.burst = bucket_burst
+        self.tokens = float(bucket_burst)
+        self.updated = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_in(self, now):
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def pop(self):
+        self.tokens -= 1
+        return super().pop()
+
+
+class FairPolicy(FifoPolicy):
+    """Per-user FIFOs served round-robin"""
+
+    def __init__(self, concurrency, **_):
+        super().__init__(concurrency)
+        self.users = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def push(self, job):
+        self.users.setdefault(job.user, deque()).append(job)
+        self.size += 1
+
+    def pop(self):
+        user, jobs = next(iter(self.users.items()))
+        job = jobs.popleft()
+        if jobs:
+            self.users.move_to_end(user)
+        else:
+            del self.users[user]
+        self.size -= 1
+        return job
+
+
+class AdaptivePolicy(FifoPolicy):
+    """AIMD concurrency driven by 429s"""
+
+    def __init__(self, concurrency, cooldown_ms=5000, **_):
+        super().__init__(concurrency)
+        self.max_limit = concurrency
+        self.current = 1.0
+        self.cooldown = cooldown_ms / 1000
+        self.paused_until = 0.0
+
+    def limit(self):
+        return max(1, int(self.current))
+
+    def ready_in(self, now):
+        return max(0.0, self.paused_until - now)
+
+    def on_result(self, ok, now):
+        if ok:
+            self.current = min(self.max_limit, self.current + 1 / self.current)
+        else:
+            self.current = max(1.0, self.current / 2)
+            self.paused_until = now + self.cooldown
+
+
+POLICY_CLASSES = {"fifo": FifoPolicy, "token": TokenBucketPolicy, "fair": FairPolicy, "adaptive": AdaptivePolicy}
+
+
+def simulate(arrivals, policy, delay_s, upstream, service, reject_s=0.2, retries=0, seed=1):
+    """Run the queue over arrivals [(time, user)], returns (jobs, stats)"""
+    rng = random.Random(seed)
+    counter = itertools.count()
+    events = []
+    jobs = []
+    for arrival, user in arrivals:
+        job = Job(len(jobs), user, arrival)
+        jobs.append(job)
+        heapq.heappush(events, (arrival, next(counter), "enqueue", job))
+    running = 0
+    wake_at = None
+    stats = {"rejected_429": 0, "max_queue": 0, "end": 0.0}
+
+    def start_ready(now):
+        nonlocal running, wake_at
+        while len(policy) and running < policy.limit():
+            wait = policy.ready_in(now)
+            if wait > 0:
+                # Floor the wait so rounding cannot spin on sub-microsecond wakes
+                wait = max(wait, 1e-3)
+                if wake_at is None or wake_at > now + wait:
+                    wake_at = now + wait
+                    heapq.heappush(events, (wake_at, next(counter), "wake", None))
+                return
+            job = policy.pop()
+            job.waited += now - job.enqueued
+            job.attempts += 1
+            job.started = now
+            running += 1
+            if upstream.admit(now):
+                heapq.heappush(events, (now + service(rng), next(counter), "finish", job))
+            else:
+                heapq.heappush(events, (now + reject_s, next(counter), "reject", job))
+
+    while events:
+        now, _, kind, job = heapq.heappop(events)
+        stats["end"] = now
+        if kind == "enqueue":
+            job.enqueued = now
+            policy.push(job)
+            stats["max_queue"] = max(stats["max_queue"], len(policy))
+        elif kind == "wake":
+            if wake_at is not None and now >= wake_at:
+                wake_at = None
+        elif kind == "finish":
+            upstream.release()
+            job.ok, job.done = True, now
+            policy.on_result(True, now)
+            # SunoQueue keeps the slot for delayMs after a success if work is queued
+            if delay_s and len(policy):
+                heapq.heappush(events, (now + delay_s, next(counter), "release", None))
+                continue
+            running -= 1
+        elif kind == "reject":
+            stats["rejected_429"] += 1
+            policy.on_result(False, now)
+            running -= 1
+            if job.attempts <= retries:
+                backoff = RETRY_BASE_S * 2 ** (job.attempts - 1)
+                backoff = min(backoff + rng.random() * backoff * 0.2, RETRY_MAX_S)
+                heapq.heappush(events, (now + backoff, next(counter), "enqueue", job))
+            else:
+                job.done = now
+        elif kind == "release":
+            running -= 1
+        start_ready(now)
+    return jobs, stats
+
+
+def jain_index(values):
+    values = [value for value in values if value > 0]
+    if not values:
+        return 1.0
+    return sum(values) ** 2 / (len(values) * sum(value * value for value in values))
+
+
+def summarize(jobs, stats):
+    waits, latencies = Histogram(), Histogram()
+    per_user = {}
+    for job in jobs:
+        if not job.ok:
+            continue
+        waits.record(job.waited * 1e6)
+        latencies.record((job.done - job.arrival) * 1e6)
+        per_user.setdefault(job.user, Histogram()).record(job.waited * 1e6)
+    done = sum(job.ok for job in jobs)
+    first = min((job.arrival for job in jobs), default=0.0)
+    span = max(stats["end"] - first, 1e-9)
+    user_means = [histogram.sum / histogram.total / 1e6 for histogram in per_user.values()]
+    # Users with no more jobs than the median user: what a batch does to everyone else
+    demand = sorted(histogram.total for histogram in per_user.values())
+    light = Histogram()
+    for histogram in per_user.values():
+        if histogram.total <= demand[(len(demand) - 1) // 2]:
+            light.merge(histogram)
+    worst_user, worst = max(((user, histogram.percentile(95) / 1e6) for user, histogram in per_user.items()),
+                            key=lambda item: item[1], default=(None, 0.0))
+    return {
+        "jobs": len(jobs), "done": done, "failed": len(jobs) - done,
+        "rejected429": stats["rejected_429"], "maxQueue": stats["max_queue"],
+        "throughputPerMin": done / span * 60,
+        "waitP50": waits.percentile(50) / 1e6, "waitP95": waits.percentile(95) / 1e6,
+        "waitP99": waits.percentile(99) / 1e6, "latencyP95": latencies.percentile(95) / 1e6,
+        "fairness": jain_index([mean + 1e-3 for mean in user_means]),
+        "lightUsersWaitP95": light.percentile(95) / 1e6,
+        "worstUser": worst_user, "worstUserWaitP95": worst,
+        "makespan": span,
+    }
+
+
+def synthetic_arrivals(rate_per_min, minutes, users, skew=1.1, batch_every=0, batch_size=0, seed=1):
+    """Poisson arrivals from Zipf-weighted users plus periodic single-user batches"""
+    rng = random.Random(seed)
+    names = [f"user{index}" for index in range(users)]
+    weights = [1 / (rank + 1) ** skew for rank in range(users)]
+    arrivals = []
+    now = 0.0
+    horizon = minutes * 60
+    if rate_per_min > 0:
+        while True:
+            now += rng.expovariate(rate_per_min / 60)
+            if now >= horizon:
+                break
+            arrivals.append((now, rng.choices(names, weights)[0]))
+    if batch_every and batch_size:
+        for start in range(0, int(horizon), int(batch_every * 60)):
+            user = rng.choice(names)
+            arrivals.extend((start + index * 0.05, user) for index in range(batch_size))
+    arrivals.sort()
+    return arrivals
+
+
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def load_trace(path):
+    """[(seconds from first arrival, user)] from a CSV or JSON-lines trace"""
+    arrivals = []
+    with open(path, "r", encoding="utf-8") as f:
+        first = f.readline()
+        f.seek(0)
+        if first.lstrip().startswith("{"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = csv.DictReader(f)
+        for row in rows:
+            stamp = row.get("time") or row.get("timestamp") or row.get("ts")
+            user = row.get("userId") or row.get("user") or "unknown"
+            arrivals.append((parse_time(str(stamp)), user))
+    arrivals.sort()
+    base = arrivals[0][0] if arrivals else 0.0
+    return [(stamp - base, user) for stamp, user in arrivals]
+
+
+def lognormal_service(median_ms, sigma):
+    mu = math.log(median_ms / 1000)
+    return lambda rng: rng.lognormvariate(mu, sigma)
+
+
+def parse_list(value, cast):
+    return [cast(item) for item in value.split(",") if item.strip()]
+
+
+def print_table(results):
+    header = (f"{'policy':<9} {'conc':>4} {'delay':>6} {'done':>6} {'fail':>5} {'429s':>5} {'jobs/min':>8} "
+              f"{'wait p50':>9} {'p95':>8} {'p99':>8} {'e2e p95':>8} {'light p95':>9} {'fair':>5} {'worst user p95':>22}")
+    print(header)
+    for result in results:
+        worst = f"{result['worstUser']} {result['worstUserWaitP95']:.1f}s" if result["worstUser"] else "-"
+        print(f"{result['policy']:<9} {result['concurrency']:>4} {result['delayMs']:>6} {result['done']:>6} "
+              f"{result['failed']:>5} {result['rejected429']:>5} {result['throughputPerMin']:>8.1f} "
+              f"{result['waitP50']:>8.1f}s {result['waitP95']:>7.1f}s {result['waitP99']:>7.1f}s "
+              f"{result['latencyP95']:>7.1f}s {result['lightUsersWaitP95']:>8.1f}s {result['fairness']:>5.2f} {worst:>22}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trace", help="arrival trace (CSV time,userId or JSON lines)")
+    parser.add_argument("--rate", type=float, default=10, help="synthetic arrivals per minute")
+    parser.add_argument("--minutes", type=float, default=60, help="synthetic trace length")
+    parser.add_argument("--users", type=int, default=50, help="synthetic users")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of user activity")
+    parser.add_argument("--batch-every", type=float, default=10, help="minutes between single-user batches (0 = off)")
+    parser.add_argument("--batch-size", type=int, default=20, help="jobs per batch")
+    parser.add_argument("--policies", default=",".join(POLICIES), help="comma-separated: " + ", ".join(POLICIES))
+    parser.add_argument("--concurrency", default="1,2", help="comma-separated concurrency values (default: %(default)s)")
+    parser.add_argument("--delay-ms", default="1500", help="comma-separated delayMs values (default: %(default)s)")
+    parser.add_argument("--bucket-rate", type=float, default=18, help="token policy: starts per minute")
+    parser.add_argument("--bucket-burst", type=int, default=3, help="token policy: bucket size")
+    parser.add_argument("--cooldown-ms", type=float, default=5000, help="adaptive policy: pause after a 429")
+    parser.add_argument("--service-ms", type=float, default=2500, help="median generate() call time")
+    parser.add_argument("--service-sigma", type=float, default=0.5, help="lognormal sigma of the call time")
+    parser.add_argument("--upstream-rate", type=float, default=20, help="upstream requests per minute before 429")
+    parser.add_argument("--upstream-burst", type=int, default=5, help="upstream bucket size")
+    parser.add_argument("--upstream-inflight", type=int, default=0, help="upstream in-flight cap (0 = none)")
+    parser.add_argument("--reject-ms", type=float, default=200, help="time to receive a 429")
+    parser.add_argument("--retries", type=int, default=0, help="re-queue 429s this many times (backend: 0)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    policies = parse_list(args.policies, str)
+    unknown = [name for name in policies if name not in POLICY_CLASSES]
+    if unknown:
+        print(f"ERROR: unknown policies {', '.join(unknown)}")
+        return 2
+    if args.trace:
+        arrivals = load_trace(args.trace)
+    else:
+        arrivals = synthetic_arrivals(args.rate, args.minutes, args.users, args.skew,
+                                      args.batch_every, args.batch_size, args.seed)
+    if not arrivals:
+        print("ERROR: no arrivals")
+        return 2
+
+    results = []
+    started = time.perf_counter()
+    for name, concurrency, delay_ms in itertools.product(
+            policies, parse_list(args.concurrency, int), parse_list(args.delay_ms, float)):
+        policy = POLICY_CLASSES[name](concurrency, bucket_rate=args.bucket_rate, bucket_burst=args.bucket_burst,
+                                     cooldown_ms=args.cooldown_ms)
+        upstream = Upstream(args.upstream_rate, args.upstream_burst, args.upstream_inflight)
+        jobs, stats = simulate(arrivals, policy, delay_ms / 1000, upstream,
+                               lognormal_service(args.service_ms, args.service_sigma),
+                               args.reject_ms / 1000, args.retries, args.seed)
+        result = {"policy": name, "concurrency": concurrency, "delayMs": int(delay_ms)}
+        result.update(summarize(jobs, stats))
+        results.append(result)
+    elapsed = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps({"arrivals": len(arrivals), "results": results}, indent=2))
+        return 0
+    span = arrivals[-1][0] - arrivals[0][0]
+    print(f"{len(arrivals)} arrivals over {span / 60:.1f} min from {len({user for _, user in arrivals})} users; "
+          f"upstream {args.upstream_rate:g}/min burst {args.upstream_burst}, retries {args.retries}\n")
+    print_table(results)
+    print(f"\n{len(results)} scenarios simulated in {elapsed:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
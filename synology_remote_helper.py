@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Remote side of upload_to_synology_session.py - serves a framed request stream on stdin
+
+The client bootstraps this file through a single `ssh host python3 -c ...`
+process and then sends requests over the same stdin:
+
+    <json header>\\n<payload bytes>
+
+File contents ('put') and delta literals ('delta') are streamed as frames of
+<4-byte big-endian length><compressed bytes>, terminated by an empty frame,
+and written to a temp file that is renamed into place - memory use does not
+depend on file size.
+
+Each request gets exactly one JSON line back on stdout. The helper only needs
+the Python standard library (zstd is used when `zstandard` happens to be
+installed) so it runs on the stock Synology python3.
+"""
+import hashlib
+import itertools
+import json
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+PROTOCOL_VERSION = 4
+
+FRAME_HEADER = struct.Struct(">I")
+# Upper bound for a single decompressed write, keeps memory flat for
+# highly compressible input
+DECOMPRESS_CHUNK = 1 << 20
+
+# rsync-style weak checksum modulus
+WEAK_MOD = 1 << 16
+
+
+def resolve_path(base_path, remote_path):
+    """Resolve a client supplied relative path, refusing to leave base_path"""
+    base = os.path.realpath(base_path)
+    target = os.path.realpath(os.path.join(base, remote_path))
+    if os.path.isabs(remote_path) or not (target == base or target.startswith(base + os.sep)):
+        raise ValueError(f"path outside of base: {remote_path}")
+    return target
+
+
+def read_exact(stream, size):
+    """Read exactly size bytes from stream"""
+    chunks = []
+    remaining = size
+    while remaining > 0:
+        chunk = stream.read(min(remaining, 1 << 20))
+        if not chunk:
+            raise EOFError(f"stream closed with {remaining} bytes pending")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def available_codecs():
+    codecs = ["gzip", "none"]
+    if zstandard is not None:
+        codecs.insert(0, "zstd")
+    return codecs
+
+
+def iter_frames(stream):
+    """Yield frame payloads until the empty terminator frame"""
+    while True:
+        size, = FRAME_HEADER.unpack(read_exact(stream, FRAME_HEADER.size))
+        if size == 0:
+            return
+        yield read_exact(stream, size)
+
+
+def iter_decompressed(frames, codec):
+    """Decompress a frame stream in bounded pieces"""
+    if codec == "none":
+        yield from frames
+    elif codec == "gzip":
+        decompressor = zlib.decompressobj(wbits=31)
+        for frame in frames:
+            data = decompressor.decompress(frame, DECOMPRESS_CHUNK)
+            while True:
+                if data:
+                    yield data
+                if not decompressor.unconsumed_tail:
+                    break
+                data = decompressor.decompress(decompressor.unconsumed_tail, DECOMPRESS_CHUNK)
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+    elif codec == "zstd" and zstandard is not None:
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for frame in frames:
+            data = decompressor.decompress(frame)
+            if data:
+                yield data
+    else:
+        raise ValueError(f"unsupported codec: {codec}")
+
+
+class ChunkReader:
+    """Sequential reads of exact sizes over an iterator of byte chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.buffer = memoryview(b"")
+
+    def read(self, size):
+        """Yield exactly size bytes, in pieces"""
+        while size > 0:
+            if not self.buffer:
+                self.buffer = memoryview(next(self.chunks, b""))
+                if not self.buffer:
+                    raise ValueError(f"stream ended with {size} bytes pending")
+            piece = self.buffer[:size]
+            self.buffer = self.buffer[len(piece):]
+            size -= len(piece)
+            yield piece
+
+
+class AtomicFile:
+    """Temp file next to target that replaces it on commit()"""
+
+    def __init__(self, target, mode=None):
+        self.target = target
+        directory = os.path.dirname(target)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(target)}.", suffix=".tmp", dir=directory)
+        self.file = os.fdopen(fd, "wb")
+        self.mode = mode
+        self.size = 0
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+        self.digest.update(data)
+
+    def commit(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        if self.mode is not None:
+            os.chmod(self.tmp_path, self.mode)
+        os.replace(self.tmp_path, self.target)
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+
+def file_sha256(path):
+    """SHA-256 hex digest of a file, read in 1 MiB blocks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def weak_checksum(block):
+    """rsync rolling checksum of a block, returned as (a, b)
+
+    b = sum((size - i) * block[i]) is the sum of the prefix sums, which
+    sum/accumulate compute without a per-byte Python loop.
+    """
+    return sum(block) % WEAK_MOD, sum(itertools.accumulate(block)) % WEAK_MOD
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=8).hexdigest()
+
+
+def block_signature(path, block_size):
+    """[[weak, strong], ...] for every block_size block of the file"""
+    signature = []
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            a, b = weak_checksum(block)
+            signature.append([a | (b << 16), strong_checksum(block)])
+    return signature
+
+
+def op_put(base_path, header, stdin):
+    """Stream the framed payload of a put request into header['path']"""
+    frames = iter_frames(stdin)
+    out = None
+    try:
+        target = resolve_path(base_path, header["path"])
+        out = AtomicFile(target, header.get("mode"))
+        for data in iter_decompressed(frames, header.get("codec", "none")):
+            out.write(data)
+    except Exception:
+        if out is not None:
+            out.abort()
+        # Keep the stream in sync for the next request
+        for _ in frames:
+            pass
+        raise
+    if header.get("sha256") and out.digest.hexdigest() != header["sha256"]:
+        out.abort()
+        raise ValueError(f"checksum mismatch for {header['path']}")
+    out.commit()
+    return {"ok": True, "path": header["path"], "size": out.size, "sha256": out.digest.hexdigest()}
+
+
+def op_hash(base_path, header, stdin):
+    """SHA-256 of many files in one round-trip, null for missing ones"""
+    hashes = {}
+    for remote_path in header["paths"]:
+        target = resolve_path(base_path, remote_path)
+        hashes[remote_path] = file_sha256(target) if os.path.isfile(target) else None
+    return {"ok": True, "hashes": hashes}
+
+
+def op_signature(base_path, header, stdin):
+    """Block signature of an existing file, used by the client to build a delta"""
+    target = resolve_path(base_path, header["path"])
+    block_size = int(header["block_size"])
+    return {"ok": True, "path": header["path"], "block_size": block_size,
+            "blocks": block_signature(target, block_size)}
+
+
+def op_delta(base_path, header, stdin):
+    """Rebuild a file from blocks of its current version plus literal payload
+
+    header['ops'] is a list of ["c", first_block, count] (copy from the old
+    file) and ["d", length] (take the next length bytes of the literal). The
+    literal follows as a frame stream, like a 'put', and is consumed in order.
+    """
+    frames = iter_frames(stdin)
+    out = None
+    try:
+        literal = ChunkReader(iter_decompressed(frames, header.get("codec", "none")))
+        target = resolve_path(base_path, header["path"])
+        block_size = int(header["block_size"])
+        out = AtomicFile(target, os.stat(target).st_mode & 0o777)
+        with open(target, "rb") as old:
+            for op in header["ops"]:
+                if op[0] == "c":
+                    old.seek(op[1] * block_size)
+                    remaining = op[2] * block_size
+                    while remaining > 0:
+                        chunk = old.read(min(remaining, DECOMPRESS_CHUNK))
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        remaining -= len(chunk)
+                else:
+                    for chunk in literal.read(op[1]):
+                        out.write(chunk)
+    except Exception:
+        if out is not None:
+            out.abort()
+        raise
+    finally:
+        # Keep the stream in sync for the next request
+        for _ in frames:
+            pass
+    if out.digest.hexdigest() != header["sha256"]:
+        out.abort()
+        raise ValueError(f"checksum mismatch after delta for {header['path']}")
+    out.commit()
+    return {"ok": True, "path": header["path"], "size": out.size}
+
+
+def op_delete(base_path, header, stdin):
+    """Remove files, ignoring ones that are already gone"""
+    deleted = []
+    for remote_path in header["paths"]:
+        target = resolve_path(base_path, remote_path)
+        if os.path.isfile(target):
+            os.remove(target)
+            deleted.append(remote_path)
+    return {"ok": True, "deleted": deleted}
+
+
+def op_exec(base_path, header, stdin):
+    """Run a shell command in base_path, reply with its exit code and output tail"""
+    started = time.monotonic()
+    try:
+        result = subprocess.run(header["command"], shell=True, cwd=base_path, stdin=subprocess.DEVNULL,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                timeout=header.get("timeout", 1800))
+        code, output = result.returncode, result.stdout
+    except subprocess.TimeoutExpired as e:
+        code, output = None, (e.output or b"") + b"\n(timed out)"
+    return {"ok": code == 0, "code": code, "seconds": time.monotonic() - started,
+            "output": output[-4000:].decode("utf-8", errors="replace")}
+
+
+HANDLERS = {
+    "delete": op_delete,
+    "delta": op_delta,
+    "exec": op_exec,
+    "hash": op_hash,
+    "put": op_put,
+    "signature": op_signature,
+}
+
+
+def serve(base_path, stdin, stdout):
+    """Process requests until 'exit' or EOF"""
+    def reply(message):
+        stdout.write(json.dumps(message).encode("utf-8") + b"\n")
+        stdout.flush()
+
+    reply({"ok": True, "op": "hello", "version": PROTOCOL_VERSION, "ops": sorted(HANDLERS),
+           "codecs": available_codecs()})
+    while True:
+        line = stdin.readline()
+        if not line:
+            return
+        header = json.loads(line)
+        op = header.get("op")
+        if op == "exit":
+            reply({"ok": True, "op": "exit"})
+            return
+        handler = HANDLERS.get(op)
+        if handler is None:
+            reply({"ok": False, "error": f"unknown op: {op}"})
+            continue
+        try:
+            reply(handler(base_path, header, stdin))
+        except EOFError:
+            raise
+        except Exception as e:
+            reply({"ok": False, "error": f"{type(e).__name__}: {e}"})
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1] if len(sys.argv) > 1 else ".", sys.stdin.buffer, sys.stdout.buffer)
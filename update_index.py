@@ -1,24 +1,28 @@
 #!/usr/bin/env python3
-import re
+import sys
 
-with open('src/index.ts', 'r', encoding='utf-8') as f:
-    content = f.read()
+from source_patcher import apply_patchset, print_report
 
-# Добавить импорт diagRoutes
-if 'import diagRoutes' not in content:
-    content = content.replace(
-        'import debugRoutes from "./routes/debugRoutes";',
-        'import debugRoutes from "./routes/debugRoutes";\nimport diagRoutes from "./routes/diagRoutes";'
-    )
-
-# Добавить роут /api/diag
-if 'app.use("/api/diag", diagRoutes);' not in content:
-    content = content.replace(
-        'app.use("/api/debug", debugRoutes);',
-        'app.use("/api/debug", debugRoutes);\napp.use("/api/diag", diagRoutes);'
-    )
-
-with open('src/index.ts', 'w', encoding='utf-8') as f:
-    f.write(content)
-print('OK: index.ts updated')
+# Подключение diagRoutes в src/index.ts
+INDEX_EDITS = [
+    {
+        "type": "insert_after",
+        "label": "diagRoutes import",
+        "anchor": 'import debugRoutes from "./routes/debugRoutes";',
+        "text": '\nimport diagRoutes from "./routes/diagRoutes";',
+        "guard": "import diagRoutes",
+    },
+    {
+        "type": "insert_after",
+        "label": "/api/diag route",
+        "anchor": 'app.use("/api/debug", debugRoutes);',
+        "text": '\napp.use("/api/diag", diagRoutes);',
+    },
+]
 
+if __name__ == "__main__":
+    reports = apply_patchset({"src/index.ts": INDEX_EDITS}, dry_run="--dry-run" in sys.argv)
+    if print_report(reports):
+        print('OK: index.ts updated')
+    else:
+        sys.exit(1)
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Script to upload files to Synology via SSH"""
+import argparse
 import subprocess
 import sys
 import os
 import io
 
+import ops_trace
+
 # Set UTF-8 encoding for Windows
 if sys.platform == 'win32':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
@@ -33,7 +36,9 @@ def upload_file(local_path, remote_path):
         content = f.read()
     
     import base64
-    encoded = base64.b64encode(content).decode('utf-8')
+    with ops_trace.span("encode", bytes=len(content)):
+        encoded = base64.b64encode(content).decode('utf-8')
+    ops_trace.count("bytes_sent", len(encoded))
     
     # Создаем команду для декодирования и записи файла на сервере
     remote_dir = os.path.dirname(remote_path)
@@ -55,7 +60,8 @@ PYEOF
 " """
     
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        with ops_trace.span("ssh upload+decode", command_bytes=len(cmd)):
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode == 0:
             print(f"OK: Successfully uploaded: {remote_path}")
             return True
@@ -67,12 +73,20 @@ PYEOF
         print(f"ERROR exception uploading {remote_path}: {e}")
         return False
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload files to Synology via SSH (base64 heredoc)")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting file upload to Synology...")
     success_count = 0
-    for local, remote in files_to_upload:
-        if upload_file(local, remote):
-            success_count += 1
+    with ops_trace.tracing(args.trace, args.profile):
+        for local, remote in files_to_upload:
+            with ops_trace.span("upload", file=remote):
+                if upload_file(local, remote):
+                    success_count += 1
     
     print(f"\nUploaded files: {success_count}/{len(files_to_upload)}")
     if success_count == len(files_to_upload):
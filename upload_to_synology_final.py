@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Final version - upload files via separate base64 file"""
+import argparse
 import subprocess
 import sys
 import os
 import base64
 
+import ops_trace
+
 NAS_HOST = "adminv@192.168.100.222"
 BASE_PATH = "/volume1/docker/shortsai/backend"
 
@@ -26,7 +29,9 @@ def upload_file_final(local_path, remote_path):
     # Read and encode
     with open(local_path, 'rb') as f:
         content = f.read()
-    encoded = base64.b64encode(content).decode('utf-8')
+    with ops_trace.span("encode", bytes=len(content)):
+        encoded = base64.b64encode(content).decode('utf-8')
+    ops_trace.count("bytes_sent", len(encoded))
     
     remote_dir = os.path.dirname(remote_path)
     temp_b64 = f"/tmp/upload_{os.path.basename(remote_path)}.b64"
@@ -44,7 +49,8 @@ def upload_file_final(local_path, remote_path):
         # Escape single quotes in chunk
         chunk_escaped = chunk.replace("'", "'\"'\"'")
         cmd = f'ssh {NAS_HOST} "printf \'%s\' \'{chunk_escaped}\' >> {temp_b64}"'
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        with ops_trace.span("send chunk", index=i, chunks=len(chunks)):
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode != 0:
             print(f"ERROR writing chunk {i+1}/{len(chunks)}")
             subprocess.run(f'ssh {NAS_HOST} "rm -f {temp_b64}"', shell=True)
@@ -71,7 +77,8 @@ print('OK')
 PYEOF'''
     
     cmd = f'ssh -t {NAS_HOST} "{python_cmd}"'
-    result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+    with ops_trace.span("remote decode"):
+        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
     
     if result.returncode == 0 and "OK" in result.stdout:
         print(f"OK: Successfully uploaded: {remote_path}")
@@ -82,12 +89,20 @@ PYEOF'''
         subprocess.run(f'ssh {NAS_HOST} "rm -f {temp_b64}"', shell=True)
         return False
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload files to Synology via SSH (printf chunks into a temp file)")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting file upload (final version)...")
     success_count = 0
-    for local, remote in files_to_upload:
-        if upload_file_final(local, remote):
-            success_count += 1
+    with ops_trace.tracing(args.trace, args.profile):
+        for local, remote in files_to_upload:
+            with ops_trace.span("upload", file=remote):
+                if upload_file_final(local, remote):
+                    success_count += 1
     
     print(f"\nUploaded: {success_count}/{len(files_to_upload)}")
     sys.exit(0 if success_count == len(files_to_upload) else 1)
@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Script to upload files to Synology through one persistent SSH session
+
+Instead of spawning ssh per file (or per chunk), synology_remote_helper.py is
+bootstrapped once over `ssh NAS_HOST python3 -c ...` and every file is pushed
+through that process's stdin as a framed request. File contents are streamed
+raw in fixed-size compressed frames (zstd when available on both ends,
+otherwise gzip) and renamed into place atomically on the NAS, so binary files
+of any size (dist/ bundles, media, storage/ data) can be shipped.
+
+With --sync only files whose SHA-256 differs from the NAS copy are sent
+(one batched hash request), and large files that already exist remotely are
+patched with rsync-style block deltas. --tree LOCAL:REMOTE syncs a whole
+directory and --file LOCAL[:REMOTE] a single file instead of files_to_upload.
+
+Changed files are pushed by a pool of helper sessions (-j, default 4) with
+per-file retries and throughput/ETA reporting. Over ssh the sessions share
+one multiplexed connection (ControlMaster), so extra workers cost no extra
+handshakes.
+
+Use --local DIR to run the helper as a local subprocess rooted at DIR
+(useful for testing without the NAS).
+"""
+import argparse
+import io
+import json
+import os
+import queue
+import shlex
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import ops_trace
+from ops_common import format_size
+from synology_remote_helper import (
+    FRAME_HEADER,
+    WEAK_MOD,
+    file_sha256,
+    strong_checksum,
+    weak_checksum,
+    zstandard,
+)
+
+# Set UTF-8 encoding for Windows
+if sys.platform == 'win32':
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+
+NAS_HOST = "adminv@192.168.100.222"
+BASE_PATH = "/volume1/docker/shortsai/backend"
+
+files_to_upload = [
+    ("backend/src/routes/diagRoutes.ts", "src/routes/diagRoutes.ts"),
+    ("backend/src/routes/telegramRoutes.ts", "src/routes/telegramRoutes.ts"),
+    ("backend/src/index.ts", "src/index.ts"),
+    # pins the image name docker_context.py build and deploy_orchestrator.py use
+    ("backend/docker-compose.yml", "docker-compose.yml"),
+]
+
+# Files of this size range that already exist on the NAS are sent as deltas
+# (not media: INCOMPRESSIBLE_EXTENSIONS). The whole file is held in memory
+# while the delta is computed, and the rolling checksum costs about 0.5 s of
+# pure Python per MB on each side, so larger files always go up in full.
+DELTA_MIN_SIZE = 16 * 1024
+DELTA_MAX_SIZE = 2 * 1024 * 1024
+DELTA_BLOCK_SIZE = 1024
+# Fall back to a full upload when the delta would still carry this much literal data
+DELTA_MAX_LITERAL_RATIO = 0.7
+
+FRAME_SIZE = 256 * 1024
+GZIP_LEVEL = 4
+ZSTD_LEVEL = 3
+# Already compressed formats are sent with codec "none"
+INCOMPRESSIBLE_EXTENSIONS = {
+    ".gz", ".zip", ".zst", ".xz", ".bz2", ".7z",
+    ".mp4", ".mov", ".mkv", ".webm", ".mp3", ".m4a", ".aac", ".ogg",
+    ".jpg", ".jpeg", ".png", ".webp", ".gif",
+}
+
+EXCLUDE_DIRS = {".git", "node_modules", "__pycache__", "dist", "tmp"}
+
+# Share one TCP/SSH connection between all sessions of a deploy
+if sys.platform == 'win32':
+    SSH_MULTIPLEX_OPTIONS = []
+else:
+    SSH_MULTIPLEX_OPTIONS = [
+        "-o", "ControlMaster=auto",
+        "-o", f"ControlPath={os.path.join(tempfile.gettempdir(), 'synology-ssh-%C')}",
+        "-o", "ControlPersist=60",
+    ]
+
+HELPER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synology_remote_helper.py")
+
+# Reads "<length>\n<helper source>" from stdin and runs it; the helper then
+# keeps reading requests from the same stdin.
+BOOTSTRAP = (
+    "import sys;"
+    "n=int(sys.stdin.buffer.readline());"
+    "exec(compile(sys.stdin.buffer.read(n),'synology_remote_helper','exec'))"
+)
+
+
+class SessionError(Exception):
+    """Raised when the remote helper dies or answers out of protocol"""
+
+
+def make_compressor(codec):
+    """Object with compress()/flush() for codec, None for 'none'"""
+    if codec == "gzip":
+        return zlib.compressobj(GZIP_LEVEL, wbits=31)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    return None
+
+
+class RemoteSession:
+    """One long-lived helper process (over ssh or local) serving many requests"""
+
+    def __init__(self, host=NAS_HOST, base_path=BASE_PATH, local_root=None, codec="auto"):
+        self.host = host
+        self.base_path = local_root if local_root is not None else base_path
+        self.local = local_root is not None
+        self.codec = codec
+        self.process = None
+        self.ops = []
+        self.remote_codecs = []
+
+    def command(self):
+        """Command line that starts the helper"""
+        if self.local:
+            return [sys.executable, "-c", BOOTSTRAP, self.base_path]
+        remote = f"python3 -c {shlex.quote(BOOTSTRAP)} {shlex.quote(self.base_path)}"
+        return ["ssh", *SSH_MULTIPLEX_OPTIONS, self.host, remote]
+
+    def open(self):
+        with open(HELPER_PATH, "rb") as f:
+            source = f.read()
+        with ops_trace.span("session open", local=self.local):
+            self.process = subprocess.Popen(
+                self.command(),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            self.process.stdin.write(f"{len(source)}\n".encode("ascii") + source)
+            self.process.stdin.flush()
+            ops_trace.count("bytes_sent", len(source))
+            hello = self._read_reply()
+        if hello.get("op") != "hello":
+            raise SessionError(f"unexpected greeting: {hello}")
+        self.ops = hello.get("ops", [])
+        self.remote_codecs = hello.get("codecs", ["none"])
+        if self.codec == "zstd" and zstandard is None:
+            raise SessionError("codec zstd needs the zstandard package locally")
+        if self.codec not in ("auto", "none") and self.codec not in self.remote_codecs:
+            raise SessionError(f"codec {self.codec} not supported by remote ({', '.join(self.remote_codecs)})")
+        return self
+
+    def codec_for(self, path):
+        """Codec to use for a file"""
+        if self.codec != "auto":
+            return self.codec
+        if os.path.splitext(path)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return "none"
+        if zstandard is not None and "zstd" in self.remote_codecs:
+            return "zstd"
+        return "gzip" if "gzip" in self.remote_codecs else "none"
+
+    def _read_reply(self):
+        line = self.process.stdout.readline()
+        if not line:
+            code = self.process.poll()
+            raise SessionError(f"remote helper exited (code {code})")
+        try:
+            return json.loads(line)
+        except ValueError:
+            raise SessionError(f"bad reply from helper: {line[:200]!r}")
+
+    def request(self, header, payload=b"", frames=None):
+        """Send one request and return the decoded JSON reply
+
+        payload is sent verbatim after the header; frames (an iterable of
+        bytes) is sent as length-prefixed frames plus the empty terminator.
+        """
+        stdin = self.process.stdin
+        with ops_trace.span(f"request {header.get('op')}", cat="session", path=header.get("path")) as span:
+            try:
+                line = json.dumps(header).encode("utf-8") + b"\n"
+                stdin.write(line)
+                sent = len(line) + len(payload)
+                if payload:
+                    stdin.write(payload)
+                if frames is not None:
+                    for frame in frames:
+                        if frame:
+                            stdin.write(FRAME_HEADER.pack(len(frame)))
+                            stdin.write(frame)
+                            sent += FRAME_HEADER.size + len(frame)
+                    stdin.write(FRAME_HEADER.pack(0))
+                stdin.flush()
+            except (BrokenPipeError, OSError) as e:
+                raise SessionError(f"remote helper closed the stream: {e}")
+            span.set(bytes=sent)
+            ops_trace.count("bytes_sent", sent)
+            return self._read_reply()
+
+    def put_file(self, local_path, remote_path, sha256=None):
+        """Stream a single file to the NAS, returns the helper reply"""
+        codec = self.codec_for(local_path)
+        header = {
+            "op": "put",
+            "path": remote_path,
+            "codec": codec,
+            "mode": os.stat(local_path).st_mode & 0o777,
+        }
+        if sha256:
+            header["sha256"] = sha256
+        return self.request(header, frames=iter_file_frames(local_path, codec))
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            if self.process.poll() is None:
+                self.request({"op": "exit"})
+        except SessionError:
+            pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                # the helper is gone and buffered request bytes could not be flushed
+                pass
+            try:
+                self.process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process.stdout.close()
+            self.process = None
+
+    def __enter__(self):
+        try:
+            return self.open()
+        except Exception:
+            self.close()
+            raise
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def compress_frames(blocks, codec):
+    """Compressed frames of an iterable of byte blocks"""
+    compressor = make_compressor(codec)
+    for block in blocks:
+        yield compressor.compress(block) if compressor else block
+    if compressor:
+        yield compressor.flush()
+
+
+def iter_file_frames(path, codec):
+    """Read path in FRAME_SIZE pieces and yield compressed frames"""
+    with open(path, "rb") as f:
+        yield from compress_frames(iter(lambda: f.read(FRAME_SIZE), b""), codec)
+
+
+def compute_delta(data, blocks, block_size):
+    """Delta of data against a remote block signature
+
+    Returns (ops, literal) in the format expected by the helper's 'delta' op:
+    ["c", first_block, count] copies blocks of the remote file, ["d", length]
+    takes the next length bytes of literal.
+    """
+    table = {}
+    for index, (weak, strong) in enumerate(blocks):
+        table.setdefault(weak, []).append((strong, index))
+
+    ops = []
+    literal = bytearray()
+    size = len(data)
+    literal_start = 0
+
+    def emit_literal(end):
+        if end > literal_start:
+            ops.append(["d", end - literal_start])
+            literal.extend(data[literal_start:end])
+
+    def emit_copy(index):
+        if ops and ops[-1][0] == "c" and ops[-1][1] + ops[-1][2] == index:
+            ops[-1][2] += 1
+        else:
+            ops.append(["c", index, 1])
+
+    # roll the weak checksum byte by byte and only stop where it hits the table
+    mask = WEAK_MOD - 1
+    last = size - block_size
+    i = 0
+    while i <= last:
+        a, b = weak_checksum(data[i:i + block_size])
+        match = None
+        while True:
+            candidates = table.get(a | (b << 16))
+            if candidates:
+                strong = strong_checksum(data[i:i + block_size])
+                match = next((index for candidate, index in candidates if candidate == strong), None)
+                if match is not None:
+                    break
+            if i == last:
+                break
+            old = data[i]
+            a = (a - old + data[i + block_size]) & mask
+            b = (b - block_size * old + a) & mask
+            i += 1
+        if match is None:
+            break
+        emit_literal(i)
+        emit_copy(match)
+        i += block_size
+        literal_start = i
+    emit_literal(size)
+    return ops, bytes(literal)
+
+
+def build_manifest(local_root, remote_root):
+    """Walk local_root and return [(local_path, remote_path, sha256), ...]"""
+    manifest = []
+    for dirpath, dirnames, filenames in os.walk(local_root):
+        dirnames[:] = sorted(d for d in dirnames if d not in EXCLUDE_DIRS)
+        for filename in sorted(filenames):
+            local_path = os.path.join(dirpath, filename)
+            relative = os.path.relpath(local_path, local_root).replace(os.sep, "/")
+            remote_path = f"{remote_root.rstrip('/')}/{relative}" if remote_root else relative
+            manifest.append((local_path, remote_path, file_sha256(local_path)))
+    return manifest
+
+
+def sync_file(session, local_path, remote_path, sha256, remote_exists, use_delta=True):
+    """Send one changed file, as a block delta when that is worthwhile"""
+    size = os.path.getsize(local_path)
+    if (use_delta and remote_exists and DELTA_MIN_SIZE <= size <= DELTA_MAX_SIZE
+            and os.path.splitext(local_path)[1].lower() not in INCOMPRESSIBLE_EXTENSIONS):
+        signature = session.request({"op": "signature", "path": remote_path, "block_size": DELTA_BLOCK_SIZE})
+        if signature.get("ok"):
+            with open(local_path, "rb") as f:
+                data = f.read()
+            ops, literal = compute_delta(data, signature["blocks"], DELTA_BLOCK_SIZE)
+            if len(literal) <= size * DELTA_MAX_LITERAL_RATIO:
+                codec = session.codec_for(local_path)
+                pieces = (literal[i:i + FRAME_SIZE] for i in range(0, len(literal), FRAME_SIZE))
+                reply = session.request({
+                    "op": "delta", "path": remote_path, "block_size": DELTA_BLOCK_SIZE,
+                    "ops": ops, "codec": codec, "sha256": sha256,
+                }, frames=compress_frames(pieces, codec))
+                if reply.get("ok"):
+                    print(f"OK: Patched {remote_path} (sent {len(literal)} of {size} bytes)")
+                    return True
+                print(f"WARN: delta failed for {remote_path}, sending full file: {reply.get('error')}")
+    reply = session.put_file(local_path, remote_path, sha256)
+    if reply.get("ok"):
+        print(f"OK: Successfully uploaded: {remote_path}")
+        return True
+    print(f"ERROR uploading {remote_path}: {reply.get('error')}")
+    return False
+
+
+def manifest_for_files(files):
+    """Manifest entries for (local, remote) pairs, skipping missing local files"""
+    manifest = []
+    for local_path, remote_path in files:
+        if not os.path.exists(local_path):
+            print(f"ERROR: File not found: {local_path}")
+            continue
+        manifest.append((local_path, remote_path, file_sha256(local_path)))
+    return manifest
+
+
+def plan_sync(session, manifest):
+    """Compare a manifest against the NAS in one 'hash' round-trip
+
+    Returns (jobs, unchanged_count) where jobs are UploadJob for every file
+    whose remote content differs.
+    """
+    if not manifest:
+        return [], 0
+    reply = session.request({"op": "hash", "paths": [remote for _, remote, _ in manifest]})
+    if not reply.get("ok"):
+        raise SessionError(f"hash request failed: {reply.get('error')}")
+    remote_hashes = reply["hashes"]
+    jobs = [
+        UploadJob(local_path, remote_path, sha256, remote_hashes.get(remote_path) is not None)
+        for local_path, remote_path, sha256 in manifest
+        if remote_hashes.get(remote_path) != sha256
+    ]
+    unchanged = len(manifest) - len(jobs)
+    print(f"{unchanged} unchanged, {len(jobs)} to upload")
+    return jobs, unchanged
+
+
+class UploadJob:
+    """A single file to push, remote_exists enables block deltas"""
+
+    def __init__(self, local_path, remote_path, sha256=None, remote_exists=False):
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self.sha256 = sha256
+        self.remote_exists = remote_exists
+        self.size = os.path.getsize(local_path)
+
+
+class Progress:
+    """Thread-safe file/byte counters with throughput and ETA reporting"""
+
+    def __init__(self, jobs):
+        self.total_files = len(jobs)
+        self.total_bytes = sum(job.size for job in jobs)
+        self.done_files = 0
+        self.done_bytes = 0
+        self.failed = 0
+        self.retries = 0
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+
+    def finish(self, job, ok):
+        with self.lock:
+            self.done_files += 1
+            self.done_bytes += job.size
+            if not ok:
+                self.failed += 1
+            elapsed = max(time.monotonic() - self.started, 1e-6)
+            rate = self.done_bytes / elapsed
+            remaining = self.total_bytes - self.done_bytes
+            eta = remaining / rate if rate else 0.0
+            print(f"[{self.done_files}/{self.total_files}] {format_size(self.done_bytes)}"
+                  f"/{format_size(self.total_bytes)} at {format_size(rate)}/s, ETA {eta:.1f}s")
+
+    def summary(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.done_bytes / elapsed if elapsed else 0.0
+        return (f"{self.done_files - self.failed}/{self.total_files} files, {format_size(self.done_bytes)} "
+                f"in {elapsed:.2f}s ({format_size(rate)}/s), {self.retries} retries")
+
+
+def run_uploads(session_factory, jobs, workers=4, retries=2, backoff=0.5, use_delta=True, initial_session=None):
+    """Push jobs through up to `workers` sessions in parallel, returns success count
+
+    Each worker thread owns one helper session (opened lazily through
+    session_factory, reopened after a failure). Failed files are retried with
+    exponential backoff. initial_session, if given, is used by the first
+    worker and closed by the caller.
+    """
+    if not jobs:
+        return 0
+    pending = queue.Queue()
+    for job in jobs:
+        pending.put(job)
+    progress = Progress(jobs)
+    results = []
+    results_lock = threading.Lock()
+
+    def worker(session):
+        owned = session is None
+        while True:
+            try:
+                job = pending.get_nowait()
+            except queue.Empty:
+                break
+            ok = False
+            for attempt in range(retries + 1):
+                if attempt:
+                    with progress.lock:
+                        progress.retries += 1
+                    ops_trace.count("retries")
+                    time.sleep(backoff * (2 ** (attempt - 1)))
+                try:
+                    if session is None:
+                        session = session_factory()
+                        session.open()
+                        owned = True
+                    print(f"Uploading {job.local_path} -> {job.remote_path}...")
+                    with ops_trace.span("upload", file=job.remote_path, bytes=job.size, attempt=attempt):
+                        ok = sync_file(session, job.local_path, job.remote_path, job.sha256,
+                                       job.remote_exists, use_delta)
+                except (SessionError, OSError) as e:
+                    print(f"ERROR uploading {job.remote_path}: {e}")
+                    if session is not None and owned:
+                        session.close()
+                    session = None
+                if ok:
+                    break
+            progress.finish(job, ok)
+            with results_lock:
+                results.append(ok)
+        if session is not None and owned:
+            session.close()
+
+    threads = []
+    for index in range(max(1, min(workers, len(jobs)))):
+        thread = threading.Thread(target=worker, args=(initial_session if index == 0 else None,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    print(progress.summary())
+    return sum(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default=NAS_HOST, help="ssh destination (default: %(default)s)")
+    parser.add_argument("--base-path", default=BASE_PATH, help="remote backend directory (default: %(default)s)")
+    parser.add_argument("--local", metavar="DIR", help="run the helper locally rooted at DIR instead of over ssh")
+    parser.add_argument("--sync", action="store_true", help="only upload files whose content changed on the NAS")
+    parser.add_argument("--tree", action="append", metavar="LOCAL:REMOTE",
+                        help="sync a whole directory (implies --sync, may be repeated)")
+    parser.add_argument("--file", action="append", metavar="LOCAL[:REMOTE]",
+                        help="upload this file instead of files_to_upload (REMOTE defaults to its name, "
+                             "may be repeated)")
+    parser.add_argument("--no-delta", action="store_true", help="always send changed files in full")
+    parser.add_argument("--codec", choices=["auto", "zstd", "gzip", "none"], default="auto",
+                        help="compression for file frames (default: %(default)s)")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="parallel helper sessions (default: %(default)s)")
+    parser.add_argument("--retries", type=int, default=2, help="retries per file (default: %(default)s)")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    print(f"Starting file upload to Synology ({args.workers} workers)...")
+
+    def session_factory():
+        return RemoteSession(args.host, args.base_path, local_root=args.local, codec=args.codec)
+
+    files = files_to_upload
+    if args.file:
+        files = [(local, remote or os.path.basename(local))
+                 for local, _, remote in (spec.partition(":") for spec in args.file)]
+    success_count = 0
+    total = len(files)
+    with ops_trace.tracing(args.trace, args.profile):
+        try:
+            with session_factory() as session:
+                if args.tree:
+                    manifest = []
+                    for spec in args.tree:
+                        local_root, _, remote_root = spec.partition(":")
+                        manifest.extend(build_manifest(local_root, remote_root))
+                    total = len(manifest)
+                else:
+                    manifest = manifest_for_files(files)
+                if args.tree or args.sync:
+                    jobs, success_count = plan_sync(session, manifest)
+                else:
+                    jobs = [UploadJob(local_path, remote_path, sha256)
+                            for local_path, remote_path, sha256 in manifest]
+                success_count += run_uploads(session_factory, jobs, args.workers, args.retries,
+                                             use_delta=not args.no_delta, initial_session=session)
+        except SessionError as e:
+            print(f"ERROR: {e}")
+
+    print(f"\nUploaded files: {success_count}/{total}")
+    if success_count == total:
+        print("All files successfully uploaded!")
+        sys.exit(0)
+    else:
+        print("Some files failed to upload")
+        sys.exit(1)
@@ -1,12 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Script to upload files to Synology via SSH - using temp files"""
+import argparse
 import subprocess
 import sys
 import os
 import base64
 import tempfile
 
+import ops_trace
+
 NAS_HOST = "adminv@192.168.100.222"
 BASE_PATH = "/volume1/docker/shortsai/backend"
 
@@ -28,7 +31,9 @@ def upload_file_via_temp(local_path, remote_path):
     with open(local_path, 'rb') as f:
         content = f.read()
     
-    encoded = base64.b64encode(content).decode('utf-8')
+    with ops_trace.span("encode", bytes=len(content)):
+        encoded = base64.b64encode(content).decode('utf-8')
+    ops_trace.count("bytes_sent", len(encoded))
     
     # Split into chunks to avoid command line length limits
     chunk_size = 50000  # ~50KB chunks
@@ -42,7 +47,8 @@ def upload_file_via_temp(local_path, remote_path):
         append_flag = ">>" if i > 0 else ">"
         cmd = f'ssh {NAS_HOST} "echo \'{chunk}\' {append_flag} {temp_file}"'
         try:
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+            with ops_trace.span("send chunk", index=i, chunks=len(chunks)):
+                result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
             if result.returncode != 0:
                 print(f"ERROR uploading chunk {i+1}/{len(chunks)}")
                 print(result.stderr)
@@ -71,7 +77,8 @@ PYEOF
 " '''
     
     try:
-        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        with ops_trace.span("remote decode"):
+            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
         if result.returncode == 0:
             print(f"OK: Successfully uploaded: {remote_path}")
             return True
@@ -86,12 +93,20 @@ PYEOF
         subprocess.run(f'ssh {NAS_HOST} "rm -f {temp_file}"', shell=True)
         return False
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload files to Synology via SSH (echo chunks into a temp file)")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting file upload to Synology (v2)...")
     success_count = 0
-    for local, remote in files_to_upload:
-        if upload_file_via_temp(local, remote):
-            success_count += 1
+    with ops_trace.tracing(args.trace, args.profile):
+        for local, remote in files_to_upload:
+            with ops_trace.span("upload", file=remote):
+                if upload_file_via_temp(local, remote):
+                    success_count += 1
     
     print(f"\nUploaded files: {success_count}/{len(files_to_upload)}")
     if success_count == len(files_to_upload):
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """Script to upload files to Synology via SSH - using stdin"""
+import argparse
 import subprocess
 import sys
 import os
 import base64
 
+import ops_trace
+
 NAS_HOST = "adminv@192.168.100.222"
 BASE_PATH = "/volume1/docker/shortsai/backend"
 
@@ -28,7 +31,9 @@ def upload_file_via_stdin(local_path, remote_path):
         content = f.read()
     
     # Encode to base64
-    encoded = base64.b64encode(content).decode('utf-8')
+    with ops_trace.span("encode", bytes=len(content)):
+        encoded = base64.b64encode(content).decode('utf-8')
+    ops_trace.count("bytes_sent", len(encoded))
     
     remote_dir = os.path.dirname(remote_path)
     
@@ -65,7 +70,8 @@ print('OK: File {remote_path} created')
             text=True
         )
         
-        stdout, stderr = process.communicate(input=full_input, timeout=60)
+        with ops_trace.span("ssh stdin upload", stdin_bytes=len(full_input)):
+            stdout, stderr = process.communicate(input=full_input, timeout=60)
         
         if process.returncode == 0:
             print(f"OK: Successfully uploaded: {remote_path}")
@@ -84,12 +90,20 @@ print('OK: File {remote_path} created')
         print(f"ERROR exception: {e}")
         return False
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Upload files to Synology via SSH (stdin)")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
     print("Starting file upload to Synology (v3 - stdin)...")
     success_count = 0
-    for local, remote in files_to_upload:
-        if upload_file_via_stdin(local, remote):
-            success_count += 1
+    with ops_trace.tracing(args.trace, args.profile):
+        for local, remote in files_to_upload:
+            with ops_trace.span("upload", file=remote):
+                if upload_file_via_stdin(local, remote):
+                    success_count += 1
     
     print(f"\nUploaded files: {success_count}/{len(files_to_upload)}")
     if success_count == len(files_to_upload):
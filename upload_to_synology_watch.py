@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Watch local source trees and push every saved file to the NAS within seconds
+
+Keeps one upload_to_synology_session.py helper session open. After an
+initial --sync of each tree it waits for changes: inotify, or polling
+where inotify is unavailable (see fs_watch.py). A burst of saves, such as
+an editor's "save all" or a git checkout, is coalesced into one batch: the
+batch closes once nothing changed for --debounce seconds, or after
+--max-wait at the latest. For each batch:
+
+  1. one 'hash' round-trip drops files whose content did not change
+  2. the touched files go up over the open session (block deltas for big ones)
+  3. files deleted locally are deleted on the NAS too with --delete
+  4. --rebuild runs a command on the NAS once per batch, through the same
+     session (default: docker-compose build + up -d of the backend)
+  5. --health URL waits until /api/diag/buildinfo answers from a new
+     container (buildId or hostname changed), i.e. the rebuilt one is live
+
+Each batch prints a timing line: save to detection, debounce, upload,
+rebuild and health, and the total edit-to-live time from the first save.
+Ctrl-C prints percentiles over all batches.
+
+Examples:
+  python3 upload_to_synology_watch.py                        # backend/src -> src
+  python3 upload_to_synology_watch.py --rebuild --health https://api.shortsai.ru/api/diag/buildinfo
+  python3 upload_to_synology_watch.py --tree backend/src:src --tree backend/public:public
+  python3 upload_to_synology_watch.py --local /tmp/nas --rebuild "sleep 1"   # offline test
+"""
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+
+import ops_trace
+from fs_watch import Watcher
+from ops_common import Histogram, fetch_buildinfo, format_size, instance_key
+from upload_to_synology_session import (
+    BASE_PATH,
+    EXCLUDE_DIRS,
+    NAS_HOST,
+    RemoteSession,
+    SessionError,
+    build_manifest,
+    file_sha256,
+    plan_sync,
+    sync_file,
+)
+
+DEFAULT_TREES = ["backend/src:src"]
+DEFAULT_REBUILD = ("sudo /usr/local/bin/docker-compose build backend && "
+                   "sudo /usr/local/bin/docker-compose up -d backend")
+# editor leftovers that are not dot-files (those fs_watch already skips)
+IGNORED_SUFFIXES = ("~", ".swp", ".swx", ".tmp", ".crswap")
+
+
+class Tree:
+    """A local directory mirrored to a remote path"""
+
+    def __init__(self, spec):
+        local, _, remote = spec.partition(":")
+        self.local = os.path.abspath(local)
+        self.remote = remote.rstrip("/")
+
+    def accept(self, path):
+        if path.endswith(IGNORED_SUFFIXES):
+            return False
+        relative = os.path.relpath(path, self.local)
+        return not any(part in EXCLUDE_DIRS for part in relative.split(os.sep))
+
+    def remote_path(self, path):
+        relative = os.path.relpath(path, self.local).replace(os.sep, "/")
+        return f"{self.remote}/{relative}" if self.remote else relative
+
+    def manifest(self):
+        return [entry for entry in build_manifest(self.local, self.remote) if self.accept(entry[0])]
+
+
+def watch(tree, events, backend, interval, stop):
+    """Feed (detected at, saved at, event, path, tree) tuples from one tree into events
+
+    saved at is the file's mtime when the event arrived, so the first save of
+    a file that keeps being rewritten still counts as the start of the edit.
+    """
+    watcher = Watcher(tree.local, backend, interval, accept=tree.accept, rewrites=True)
+    try:
+        while not stop.is_set():
+            for event, path in watcher.wait(0.5):
+                detected = time.time()
+                try:
+                    saved = min(os.stat(path).st_mtime, detected) if event == "write" else detected
+                except OSError:
+                    saved = detected
+                events.put((detected, saved, event, path, tree))
+    finally:
+        watcher.close()
+
+
+def next_batch(events, debounce, max_wait, stop):
+    """Block for the first change, then collect until quiet for debounce seconds"""
+    while not stop.is_set():
+        try:
+            first = events.get(timeout=0.5)
+            break
+        except queue.Empty:
+            continue
+    else:
+        return []
+    batch = [first]
+    deadline = time.monotonic() + max_wait
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(events.get(timeout=min(debounce, remaining)))
+        except queue.Empty:
+            break
+    return batch
+
+
+class Syncer:
+    """Pushes batches over one session, reopening it after a failure"""
+
+    def __init__(self, args):
+        self.args = args
+        self.session = None
+
+    def factory(self):
+        return RemoteSession(self.args.host, self.args.base_path, local_root=self.args.local, codec=self.args.codec)
+
+    def ensure_session(self):
+        if self.session is None:
+            started = time.monotonic()
+            self.session = self.factory().open()
+            print(f"session open in {time.monotonic() - started:.2f}s", flush=True)
+        return self.session
+
+    def drop_session(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
+
+    def push(self, manifest):
+        """Upload changed entries, returns (sent, unchanged, failed)"""
+        for attempt in range(2):
+            try:
+                session = self.ensure_session()
+                jobs, unchanged = plan_sync(session, manifest)
+                failed = 0
+                for job in jobs:
+                    if not sync_file(session, job.local_path, job.remote_path, job.sha256,
+                                     job.remote_exists, not self.args.no_delta):
+                        failed += 1
+                return len(jobs) - failed, unchanged, failed
+            except (SessionError, OSError) as e:
+                print(f"ERROR: {e}" + (", reconnecting" if not attempt else ""), flush=True)
+                self.drop_session()
+        return 0, 0, len(manifest)
+
+    def delete(self, remote_paths):
+        try:
+            reply = self.ensure_session().request({"op": "delete", "paths": remote_paths})
+        except SessionError as e:
+            print(f"ERROR: delete failed: {e}")
+            self.drop_session()
+            return []
+        if not reply.get("ok"):
+            print(f"ERROR: delete failed: {reply.get('error')}")
+            return []
+        for path in reply["deleted"]:
+            print(f"OK: Deleted {path}")
+        return reply["deleted"]
+
+    def rebuild(self, command):
+        try:
+            reply = self.ensure_session().request({"op": "exec", "command": command})
+        except SessionError as e:
+            print(f"ERROR: rebuild failed: {e}")
+            self.drop_session()
+            return False
+        if not reply.get("ok"):
+            output = reply.get("output", "").rstrip()
+            print(f"ERROR: rebuild exited with {reply.get('code')}" + (f":\n{output}" if output else ""))
+            return False
+        print(f"OK: rebuild finished in {reply['seconds']:.1f}s")
+        return True
+
+
+def current_instance(url):
+    try:
+        return instance_key(fetch_buildinfo(url))
+    except (OSError, ValueError):
+        return None
+
+
+def wait_live(url, previous, timeout):
+    """Poll buildinfo until it answers from a container other than previous"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        current = current_instance(url)
+        if current is not None and current != previous:
+            return True
+        time.sleep(0.25)
+    return False
+
+
+def process_batch(syncer, batch, args):
+    """Sync one batch, returns its timing dict"""
+    first_event = min(item[0] for item in batch)
+    last_event = max(item[0] for item in batch)
+    first_save = min(item[1] for item in batch)
+    latest = {}
+    for _, _, _, path, tree in batch:
+        latest[path] = tree
+    uploads, deletes = [], []
+    for path, tree in latest.items():
+        if not os.path.exists(path):
+            deletes.append(tree.remote_path(path))
+            continue
+        try:
+            uploads.append((path, tree.remote_path(path), file_sha256(path)))
+        except OSError as e:
+            print(f"ERROR: cannot read {path}: {e}")
+
+    timing = {"files": len(latest), "detect": first_event - first_save}
+    started = time.time()
+    timing["debounce"] = started - last_event
+    sent = failed = 0
+    if uploads:
+        sent, _, failed = syncer.push(uploads)
+    if deletes:
+        if args.delete:
+            syncer.delete(deletes)
+        else:
+            for path in deletes:
+                print(f"deleted locally, kept on the NAS (use --delete): {path}")
+    timing["upload"] = time.time() - started
+    timing["sent"] = sent
+    timing["failed"] = failed
+
+    changed = sent > 0 or (args.delete and deletes)
+    if args.rebuild and changed and not failed:
+        previous = current_instance(args.health) if args.health else None
+        step = time.time()
+        with ops_trace.span("rebuild"):
+            ok = syncer.rebuild(args.rebuild)
+        timing["rebuild"] = time.time() - step
+        if not ok:
+            failed += 1
+        elif args.health:
+            step = time.time()
+            with ops_trace.span("health", url=args.health):
+                live = wait_live(args.health, previous, args.health_timeout)
+            timing["health"] = time.time() - step
+            if not live:
+                print(f"ERROR: {args.health} did not report a restart within {args.health_timeout:g}s")
+                failed += 1
+        timing["failed"] = failed
+    timing["live"] = time.time() - first_save
+    return timing
+
+
+def print_timing(number, timing):
+    parts = [f"batch {number}: {timing['files']} file(s), {timing['sent']} sent"]
+    parts.append(f"detect {timing['detect']:.2f}s")
+    parts.append(f"debounce {timing['debounce']:.2f}s")
+    parts.append(f"upload {timing['upload']:.2f}s")
+    if "rebuild" in timing:
+        parts.append(f"rebuild {timing['rebuild']:.1f}s")
+    if "health" in timing:
+        parts.append(f"health {timing['health']:.1f}s")
+    status = "edit-to-live" if not timing["failed"] else "FAILED after"
+    print(", ".join(parts) + f" -> {status} {timing['live']:.2f}s", flush=True)
+
+
+def print_summary(timings):
+    if not timings:
+        return
+    live = Histogram()
+    upload = Histogram()
+    for timing in timings:
+        live.record(int(timing["live"] * 1e6))
+        upload.record(int(timing["upload"] * 1e6))
+    files = sum(timing["sent"] for timing in timings)
+    print(f"\n{len(timings)} batches, {files} files sent")
+    print(f"edit-to-live p50 {live.percentile(50) / 1e6:.2f}s, p95 {live.percentile(95) / 1e6:.2f}s, "
+          f"max {live.percentile(100) / 1e6:.2f}s; upload p50 {upload.percentile(50) / 1e6:.2f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tree", action="append", metavar="LOCAL:REMOTE",
+                        help=f"directory or file to mirror, may be repeated (default: {DEFAULT_TREES[0]})")
+    parser.add_argument("--host", default=NAS_HOST, help="ssh destination (default: %(default)s)")
+    parser.add_argument("--base-path", default=BASE_PATH, help="remote backend directory (default: %(default)s)")
+    parser.add_argument("--local", metavar="DIR", help="run the helper locally rooted at DIR instead of over ssh")
+    parser.add_argument("--codec", choices=["auto", "zstd", "gzip", "none"], default="auto")
+    parser.add_argument("--no-delta", action="store_true", help="always send changed files in full")
+    parser.add_argument("--debounce", type=float, default=0.3,
+                        help="seconds without changes that close a batch (default: %(default)s)")
+    parser.add_argument("--max-wait", type=float, default=2.0,
+                        help="longest a batch stays open while changes keep coming (default: %(default)s)")
+    parser.add_argument("--poll", action="store_true", help="poll instead of inotify")
+    parser.add_argument("--interval", type=float, default=0.5, help="poll interval (default: %(default)s)")
+    parser.add_argument("--delete", action="store_true", help="delete files on the NAS that were deleted locally")
+    parser.add_argument("--rebuild", nargs="?", const=DEFAULT_REBUILD, metavar="COMMAND",
+                        help="run on the NAS (in --base-path) after each batch; without COMMAND: "
+                             "docker-compose build + up -d backend")
+    parser.add_argument("--health", metavar="URL", help="buildinfo URL to wait on after --rebuild")
+    parser.add_argument("--health-timeout", type=float, default=180, help="seconds (default: %(default)s)")
+    parser.add_argument("--no-initial", action="store_true", help="skip the initial sync of the trees")
+    parser.add_argument("--batches", type=int, help="exit after this many batches")
+    ops_trace.add_arguments(parser)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    trees = [Tree(spec) for spec in args.tree or DEFAULT_TREES]
+    missing = [tree.local for tree in trees if not os.path.isdir(tree.local)]
+    if missing:
+        print(f"ERROR: not a directory: {', '.join(missing)}")
+        return 2
+    with ops_trace.tracing(args.trace, args.profile):
+        return run(args, trees)
+
+
+def run(args, trees):
+    syncer = Syncer(args)
+    try:
+        syncer.ensure_session()
+        if not args.no_initial:
+            manifest = [entry for tree in trees for entry in tree.manifest()]
+            started = time.monotonic()
+            sent, unchanged, failed = syncer.push(manifest)
+            print(f"initial sync: {sent} sent, {unchanged} unchanged, {failed} failed "
+                  f"({format_size(sum(os.path.getsize(local) for local, _, _ in manifest))} checked) "
+                  f"in {time.monotonic() - started:.2f}s", flush=True)
+    except (SessionError, OSError) as e:
+        print(f"ERROR: {e}")
+        syncer.drop_session()
+        return 1
+
+    events = queue.Queue()
+    stop = threading.Event()
+    for tree in trees:
+        thread = threading.Thread(target=watch, args=(tree, events, "poll" if args.poll else "auto",
+                                                       args.interval, stop), daemon=True)
+        thread.start()
+    print(f"watching {', '.join(f'{tree.local} -> {tree.remote}' for tree in trees)} "
+          f"(debounce {args.debounce:g}s{', rebuild' if args.rebuild else ''}), Ctrl-C to stop", flush=True)
+
+    timings = []
+    try:
+        while args.batches is None or len(timings) < args.batches:
+            batch = next_batch(events, args.debounce, args.max_wait, stop)
+            if not batch:
+                break
+            with ops_trace.span("batch", events=len(batch)) as span:
+                timing = process_batch(syncer, batch, args)
+                span.set(**timing)
+            timings.append(timing)
+            print_timing(len(timings), timing)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        syncer.drop_session()
+    print_summary(timings)
+    return 0 if all(not timing["failed"] for timing in timings) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())